@@ -3,69 +3,171 @@
 提供内存缓存和持久化缓存功能
 """
 
+import atexit
 import hashlib
+import heapq
 import json
+import pickle
+import sys
 import time
 from datetime import datetime, date
-from typing import Any, Dict, Optional, Callable, TypeVar, Generic
+from typing import Any, Dict, List, Optional, Callable, Tuple, TypeVar, Generic
 from functools import wraps
 from pathlib import Path
 import threading
 import sqlite3
+from collections import OrderedDict, defaultdict
 from decimal import Decimal
 
 from app.core.config import settings
+from app.core.logging_config import get_logger
+
+logger = get_logger(__name__)
 
 T = TypeVar('T')
 
+# 持久化缓存存储格式版本，缓存值的结构变化时递增以丢弃旧数据
+CACHE_SCHEMA_VERSION = 2
+# 应用代码所在目录，代码变化后持久化缓存中的旧结果全部丢弃
+APP_SOURCE_DIR = Path(__file__).resolve().parent.parent
+# 持久化缓存批量写入的条数和最长间隔
+CACHE_WRITE_BATCH_SIZE = 32
+CACHE_FLUSH_INTERVAL_SECONDS = 2.0
+# 临时账本哈希的前缀（加载期间文件被修改），这类版本生成的值不写入持久化缓存
+UNSTABLE_VERSION_PREFIX = "unstable-"
+
+# 估算大型容器大小时的采样数量
+SIZE_SAMPLE_LIMIT = 100
+
+
+def compute_code_version(source_dir: Path = APP_SOURCE_DIR) -> str:
+    """
+    计算应用代码版本：所有 Python 源文件的相对路径和内容的哈希
+    
+    持久化缓存保存的是 pickle 后的计算结果，计算逻辑或模型结构变化后都不能再复用。
+    """
+    digest = hashlib.sha256(str(CACHE_SCHEMA_VERSION).encode('utf-8'))
+    for file_path in sorted(source_dir.rglob('*.py')):
+        digest.update(str(file_path.relative_to(source_dir)).encode('utf-8') + b'\0')
+        try:
+            digest.update(file_path.read_bytes())
+        except OSError:
+            digest.update(b'<missing>')
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def estimate_size(value: Any) -> int:
+    """
+    估算对象占用的内存字节数
+    
+    递归累加容器及其元素的 sys.getsizeof，大型列表只采样部分元素后按比例推算，
+    避免每次写入缓存都完整遍历。
+    """
+    seen = set()
+    
+    def _size(obj: Any) -> int:
+        if id(obj) in seen:
+            return 0
+        seen.add(id(obj))
+        size = sys.getsizeof(obj, 0)
+        
+        if isinstance(obj, (str, bytes, bytearray, int, float, bool, Decimal, date, datetime)) or obj is None:
+            return size
+        
+        if isinstance(obj, dict):
+            items = list(obj.items())
+            return size + _sampled(items, lambda item: _size(item[0]) + _size(item[1]))
+        if isinstance(obj, (list, tuple, set, frozenset)):
+            return size + _sampled(list(obj), _size)
+        if hasattr(obj, '__dict__'):
+            return size + _size(vars(obj))
+        if hasattr(obj, '__slots__'):
+            return size + sum(_size(getattr(obj, slot)) for slot in obj.__slots__ if hasattr(obj, slot))
+        return size
+    
+    def _sampled(items: list, measure: Callable[[Any], int]) -> int:
+        count = len(items)
+        if count <= SIZE_SAMPLE_LIMIT:
+            return sum(measure(item) for item in items)
+        step = count / SIZE_SAMPLE_LIMIT
+        sample_total = sum(measure(items[int(i * step)]) for i in range(SIZE_SAMPLE_LIMIT))
+        return int(sample_total * count / SIZE_SAMPLE_LIMIT)
+    
+    return _size(value)
+
+
 class LRUCache(Generic[T]):
-    """LRU缓存实现"""
+    """
+    LRU缓存实现
     
-    def __init__(self, capacity: int = 1000):
+    使用 OrderedDict 保证命中和淘汰都是 O(1)；同时按条目数和估算字节数限制容量，
+    过期时间通过小顶堆管理，写入时顺带清理已过期的条目。
+    """
+    
+    def __init__(self, capacity: int = 1000, max_bytes: Optional[int] = None):
         self.capacity = capacity
-        self.cache: Dict[str, Dict[str, Any]] = {}
-        self.access_order = []
+        self.max_bytes = max_bytes
+        self.cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # (过期时间, 键) 小顶堆，条目被覆盖或删除后留下的旧记录在弹出时忽略
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self.current_bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rejections = 0
         self._lock = threading.RLock()
     
+    def __len__(self) -> int:
+        return len(self.cache)
+    
     def get(self, key: str) -> Optional[T]:
         with self._lock:
-            if key in self.cache:
-                # 更新访问顺序
-                self.access_order.remove(key)
-                self.access_order.append(key)
-                
-                # 检查TTL
-                item = self.cache[key]
-                if item['expires_at'] and time.time() > item['expires_at']:
-                    del self.cache[key]
-                    self.access_order.remove(key)
-                    return None
-                
-                return item['value']
-            return None
+            item = self.cache.get(key)
+            if item is None:
+                return None
+            
+            # 检查TTL
+            if item['expires_at'] and time.time() > item['expires_at']:
+                self._remove(key)
+                self.expirations += 1
+                return None
+            
+            # 更新访问顺序
+            self.cache.move_to_end(key)
+            return item['value']
     
     def put(self, key: str, value: T, ttl_seconds: Optional[int] = None):
         with self._lock:
+            now = time.time()
+            self._purge_expired(now)
+            
+            size = estimate_size(value)
+            if key in self.cache:
+                self._remove(key)
+            
+            # 单个值超过总容量时不缓存
+            if self.max_bytes and size > self.max_bytes:
+                self.rejections += 1
+                return
+            
             # 计算过期时间
             expires_at = None
             if ttl_seconds:
-                expires_at = time.time() + ttl_seconds
+                expires_at = now + ttl_seconds
+                heapq.heappush(self._expiry_heap, (expires_at, key))
             
-            # 如果已存在，更新值
-            if key in self.cache:
-                self.cache[key] = {'value': value, 'expires_at': expires_at}
-                self.access_order.remove(key)
-                self.access_order.append(key)
-                return
+            self.cache[key] = {'value': value, 'expires_at': expires_at, 'size': size}
+            self.current_bytes += size
             
-            # 检查容量
-            if len(self.cache) >= self.capacity:
-                # 删除最少使用的项
-                oldest_key = self.access_order.pop(0)
-                del self.cache[oldest_key]
+            # 淘汰最少使用的项，直到条目数和大小都满足限制
+            while len(self.cache) > self.capacity or (self.max_bytes and self.current_bytes > self.max_bytes):
+                oldest_key = next(iter(self.cache))
+                self._remove(oldest_key)
+                self.evictions += 1
             
-            self.cache[key] = {'value': value, 'expires_at': expires_at}
-            self.access_order.append(key)
+            # 旧的堆记录过多时重建堆
+            if len(self._expiry_heap) > 2 * len(self.cache) + 64:
+                self._rebuild_heap()
     
     def invalidate(self, pattern: str = None):
         """使缓存失效"""
@@ -73,179 +175,388 @@ class LRUCache(Generic[T]):
             if pattern is None:
                 # 清空所有缓存
                 self.cache.clear()
-                self.access_order.clear()
+                self._expiry_heap.clear()
+                self.current_bytes = 0
             else:
                 # 删除匹配模式的键
                 keys_to_remove = [k for k in self.cache.keys() if pattern in k]
                 for key in keys_to_remove:
-                    del self.cache[key]
-                    if key in self.access_order:
-                        self.access_order.remove(key)
+                    self._remove(key)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取容量和淘汰统计"""
+        with self._lock:
+            return {
+                'entries': len(self.cache),
+                'capacity': self.capacity,
+                'estimated_bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'rejections': self.rejections
+            }
+    
+    def _remove(self, key: str):
+        item = self.cache.pop(key, None)
+        if item is not None:
+            self.current_bytes -= item['size']
+    
+    def _purge_expired(self, now: float):
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            expires_at, key = heapq.heappop(self._expiry_heap)
+            item = self.cache.get(key)
+            if item is not None and item['expires_at'] == expires_at:
+                self._remove(key)
+                self.expirations += 1
+    
+    def _rebuild_heap(self):
+        self._expiry_heap = [
+            (item['expires_at'], key) for key, item in self.cache.items() if item['expires_at']
+        ]
+        heapq.heapify(self._expiry_heap)
 
 class CacheManager:
-    """缓存管理器"""
+    """
+    缓存管理器
+    
+    内存层为 LRUCache；持久层为 SQLite，缓存键包含账本内容哈希，
+    进程重启后只要账本内容未变，之前的结果仍然有效。
+    """
     
     def __init__(self):
-        self.memory_cache = LRUCache[Any](capacity=2000)
+        self.memory_cache = LRUCache[Any](
+            capacity=settings.cache_max_entries,
+            max_bytes=settings.cache_max_memory_mb * 1024 * 1024
+        )
         self.db_path = settings.data_dir / "performance_cache.db"
         self.entries_version = 0
         self._lock = threading.RLock()
+        # 账本版本提供者，返回账本内容哈希，参与缓存键的生成
+        self._version_provider: Optional[Callable[[], Any]] = None
+        self._last_version: Optional[str] = None
+        # 按键前缀统计命中情况
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {'hits': 0, 'misses': 0, 'persistent_hits': 0}
+        )
+        # 持久层：单个 WAL 模式连接 + 批量写入队列
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._pending: Dict[str, Tuple[bytes, str, float, Optional[float]]] = {}
+        self._flush_event = threading.Event()
         self._init_db()
+        self._flusher = threading.Thread(target=self._flush_loop, name="cache-flusher", daemon=True)
+        self._flusher.start()
+        atexit.register(self.flush)
     
     def _init_db(self):
         """初始化缓存数据库"""
-        with sqlite3.connect(self.db_path) as conn:
-            # 设置时区为东八区
-            conn.execute("PRAGMA timezone = '+08:00'")
+        try:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            
+            # 存储格式或应用代码变化时丢弃旧数据
             conn.execute("""
-                CREATE TABLE IF NOT EXISTS cache_entries (
+                CREATE TABLE IF NOT EXISTS cache_meta (
+                    name TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                )
+            """)
+            code_version = compute_code_version()
+            schema_version = conn.execute("PRAGMA user_version").fetchone()[0]
+            row = conn.execute("SELECT value FROM cache_meta WHERE name = 'code_version'").fetchone()
+            if schema_version != CACHE_SCHEMA_VERSION or row is None or row[0] != code_version:
+                conn.execute("DROP TABLE IF EXISTS cache_entries")
+                conn.execute("DROP TABLE IF EXISTS cache_blobs")
+                conn.execute(f"PRAGMA user_version = {CACHE_SCHEMA_VERSION}")
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache_meta (name, value) VALUES ('code_version', ?)",
+                    (code_version,)
+                )
+            
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_blobs (
                     key TEXT PRIMARY KEY,
-                    value TEXT,
-                    version INTEGER,
-                    created_at TIMESTAMP,
-                    expires_at TIMESTAMP
+                    value BLOB NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL
                 )
             """)
             conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_cache_version ON cache_entries(version)
+                CREATE INDEX IF NOT EXISTS idx_cache_content_hash ON cache_blobs(content_hash)
             """)
             conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache_entries(expires_at)
+                CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache_blobs(expires_at)
             """)
+            conn.commit()
+            self._conn = conn
+        except Exception as e:
+            logger.warning(f"初始化持久化缓存失败，仅使用内存缓存: {e}")
+            self._conn = None
     
-    def _serialize_value(self, value: Any) -> str:
-        """序列化值用于存储"""
-        def default_serializer(obj):
-            if isinstance(obj, (date, datetime)):
-                return obj.isoformat()
-            elif isinstance(obj, Decimal):
-                return str(obj)
-            elif hasattr(obj, 'model_dump'):
-                return obj.model_dump()
-            elif hasattr(obj, '__dict__'):
-                return obj.__dict__
-            return str(obj)
-        
-        return json.dumps(value, default=default_serializer, ensure_ascii=False)
+    def _serialize_value(self, value: Any) -> bytes:
+        """序列化值用于存储（保留 Decimal、date 和模型类型）"""
+        return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
     
-    def _deserialize_value(self, value_str: str) -> Any:
+    def _deserialize_value(self, value_bytes: bytes) -> Any:
         """反序列化存储的值"""
+        return pickle.loads(value_bytes)
+    
+    def set_version_provider(self, provider: Callable[[], Any]):
+        """设置账本版本提供者，账本变化后旧的缓存键自然失效"""
+        self._version_provider = provider
+    
+    def get_version(self) -> Any:
+        """获取参与缓存键的版本（账本内容哈希）"""
+        if self._version_provider is None:
+            return str(self.entries_version)
+        
+        version = str(self._version_provider())
+        if version != self._last_version:
+            # 首次获取或账本内容变化，其他内容的持久化缓存不会再命中
+            self._last_version = version
+            self._prune(keep_hash=version)
+        return version
+    
+    def _record(self, key: str, hit: bool, persistent: bool = False):
+        prefix = key.split(':', 1)[0]
+        with self._lock:
+            counter = self._stats[prefix]
+            counter['hits' if hit else 'misses'] += 1
+            if persistent:
+                counter['persistent_hits'] += 1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存命中统计"""
+        with self._lock:
+            prefixes = {}
+            total_hits = total_misses = 0
+            for prefix, counter in sorted(self._stats.items()):
+                hits, misses = counter['hits'], counter['misses']
+                total_hits += hits
+                total_misses += misses
+                prefixes[prefix] = {
+                    'hits': hits,
+                    'misses': misses,
+                    'persistent_hits': counter['persistent_hits'],
+                    'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else 0.0
+                }
+        
+        total = total_hits + total_misses
+        return {
+            'version': self.get_version(),
+            'memory': self.memory_cache.get_stats(),
+            'persistent': self._get_persistent_stats(),
+            'hits': total_hits,
+            'misses': total_misses,
+            'hit_ratio': round(total_hits / total, 4) if total else 0.0,
+            'prefixes': prefixes
+        }
+    
+    def _get_persistent_stats(self) -> Dict[str, Any]:
+        stats = {'enabled': self._conn is not None, 'entries': 0, 'bytes': 0, 'pending_writes': len(self._pending)}
+        if self._conn is None:
+            return stats
         try:
-            return json.loads(value_str)
-        except json.JSONDecodeError:
-            return value_str
+            with self._db_lock:
+                row = self._conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM cache_blobs"
+                ).fetchone()
+            stats['entries'], stats['bytes'] = row
+        except Exception as e:
+            logger.warning(f"读取持久化缓存统计失败: {e}")
+        return stats
     
     def get(self, key: str, use_persistent: bool = True) -> Optional[Any]:
         """获取缓存值"""
         # 先检查内存缓存
         value = self.memory_cache.get(key)
         if value is not None:
+            self._record(key, True)
             return value
         
         # 检查持久化缓存
         if use_persistent:
+            value = self._get_persistent(key)
+            if value is not None:
+                # 放入内存缓存
+                self.memory_cache.put(key, value, ttl_seconds=3600)
+                self._record(key, True, persistent=True)
+                return value
+        
+        self._record(key, False)
+        return None
+    
+    def _get_persistent(self, key: str) -> Optional[Any]:
+        now = time.time()
+        
+        # 尚未落盘的写入
+        pending = self._pending.get(key)
+        if pending is not None:
+            value_bytes, _, _, expires_at = pending
+        elif self._conn is not None:
             try:
-                with sqlite3.connect(self.db_path) as conn:
-                    cursor = conn.execute("""
-                        SELECT value, version, expires_at FROM cache_entries 
-                        WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)
-                    """, (key, settings.now().isoformat()))
-                    
-                    row = cursor.fetchone()
-                    if row:
-                        value_str, version, expires_at = row
-                        # 检查版本是否有效
-                        if version >= self.entries_version:
-                            value = self._deserialize_value(value_str)
-                            # 放入内存缓存
-                            self.memory_cache.put(key, value, ttl_seconds=3600)
-                            return value
+                with self._db_lock:
+                    row = self._conn.execute(
+                        "SELECT value, expires_at FROM cache_blobs WHERE key = ?", (key,)
+                    ).fetchone()
             except Exception as e:
-                # print(f"读取持久化缓存失败: {e}")
-                pass
+                logger.warning(f"读取持久化缓存失败: {e}")
+                return None
+            if row is None:
+                return None
+            value_bytes, expires_at = row
+        else:
+            return None
         
-        return None
+        if expires_at is not None and expires_at <= now:
+            return None
+        
+        try:
+            return self._deserialize_value(value_bytes)
+        except Exception as e:
+            logger.warning(f"反序列化持久化缓存失败: {e}")
+            return None
     
-    def put(self, key: str, value: Any, ttl_seconds: int = 3600, use_persistent: bool = True):
-        """设置缓存值"""
+    def put(self, key: str, value: Any, ttl_seconds: int = 3600, use_persistent: bool = True,
+            version: Optional[str] = None):
+        """设置缓存值，version 为生成该值时的账本内容哈希"""
         # 存入内存缓存
         self.memory_cache.put(key, value, ttl_seconds)
         
-        # 存入持久化缓存
-        if use_persistent:
+        # 存入持久化缓存（写入队列，批量落盘）
+        if use_persistent and self._conn is not None:
+            content_hash = version or self.get_version()
+            if content_hash.startswith(UNSTABLE_VERSION_PREFIX):
+                return
             try:
-                expires_at = None
-                if ttl_seconds:
-                    expires_at = (settings.now().timestamp() + ttl_seconds)
-                    expires_at = datetime.fromtimestamp(expires_at).isoformat()
-                
-                value_str = self._serialize_value(value)
-                
-                with sqlite3.connect(self.db_path) as conn:
-                    conn.execute("""
-                        INSERT OR REPLACE INTO cache_entries 
-                        (key, value, version, created_at, expires_at)
-                        VALUES (?, ?, ?, ?, ?)
-                    """, (key, value_str, self.entries_version, 
-                          settings.now().isoformat(), expires_at))
+                value_bytes = self._serialize_value(value)
             except Exception as e:
-                # print(f"写入持久化缓存失败: {e}")
-                pass
+                logger.warning(f"序列化缓存值失败: {e}")
+                return
+            
+            now = time.time()
+            expires_at = now + ttl_seconds if ttl_seconds else None
+            with self._lock:
+                self._pending[key] = (value_bytes, content_hash, now, expires_at)
+                pending_count = len(self._pending)
+            if pending_count >= CACHE_WRITE_BATCH_SIZE:
+                self._flush_event.set()
+    
+    def flush(self):
+        """将待写入的缓存批量落盘"""
+        with self._lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+        
+        if self._conn is None:
+            return
+        try:
+            with self._db_lock:
+                with self._conn:
+                    self._conn.executemany("""
+                        INSERT OR REPLACE INTO cache_blobs
+                        (key, value, content_hash, created_at, expires_at)
+                        VALUES (?, ?, ?, ?, ?)
+                    """, [(key, sqlite3.Binary(value_bytes), content_hash, created_at, expires_at)
+                          for key, (value_bytes, content_hash, created_at, expires_at) in batch.items()])
+        except Exception as e:
+            logger.warning(f"写入持久化缓存失败: {e}")
+    
+    def _flush_loop(self):
+        while True:
+            self._flush_event.wait(CACHE_FLUSH_INTERVAL_SECONDS)
+            self._flush_event.clear()
+            self.flush()
+    
+    def _prune(self, keep_hash: str):
+        """删除其他账本内容和已过期的持久化缓存"""
+        with self._lock:
+            self._pending = {k: v for k, v in self._pending.items() if v[1] == keep_hash}
+        if self._conn is None:
+            return
+        try:
+            with self._db_lock:
+                with self._conn:
+                    self._conn.execute("""
+                        DELETE FROM cache_blobs
+                        WHERE content_hash != ? OR (expires_at IS NOT NULL AND expires_at < ?)
+                    """, (keep_hash, time.time()))
+        except Exception as e:
+            logger.warning(f"清理持久化缓存失败: {e}")
     
     def invalidate_by_pattern(self, pattern: str):
         """按模式使缓存失效"""
         self.memory_cache.invalidate(pattern)
         
+        with self._lock:
+            self._pending = {k: v for k, v in self._pending.items() if pattern not in k}
+        if self._conn is None:
+            return
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute("DELETE FROM cache_entries WHERE key LIKE ?", (f"%{pattern}%",))
+            with self._db_lock:
+                with self._conn:
+                    self._conn.execute("DELETE FROM cache_blobs WHERE key LIKE ?", (f"%{pattern}%",))
         except Exception as e:
-            # print(f"清理持久化缓存失败: {e}")
-            pass
+            logger.warning(f"清理持久化缓存失败: {e}")
     
     def bump_version(self):
         """增加版本号，使所有缓存失效"""
         with self._lock:
             self.entries_version += 1
             self.memory_cache.invalidate()
-            
-            # 清理过期的持久化缓存
-            try:
-                with sqlite3.connect(self.db_path) as conn:
-                    conn.execute("""
-                        DELETE FROM cache_entries 
-                        WHERE version < ? OR (expires_at IS NOT NULL AND expires_at < ?)
-                    """, (self.entries_version, settings.now().isoformat()))
-            except Exception as e:
-                # print(f"清理过期缓存失败: {e}")
-                pass
+            self._pending.clear()
+        
+        if self._conn is None:
+            return
+        try:
+            with self._db_lock:
+                with self._conn:
+                    self._conn.execute("DELETE FROM cache_blobs")
+        except Exception as e:
+            logger.warning(f"清理持久化缓存失败: {e}")
     
     def cache_key(self, prefix: str, **kwargs) -> str:
         """生成缓存键"""
+        def default_serializer(obj):
+            if hasattr(obj, 'model_dump'):
+                return obj.model_dump()
+            return str(obj)
+        
         # 将参数排序后生成哈希
-        params_str = json.dumps(kwargs, sort_keys=True, default=str)
+        params_str = json.dumps(kwargs, sort_keys=True, default=default_serializer)
         hash_suffix = hashlib.md5(params_str.encode()).hexdigest()[:8]
         return f"{prefix}:{hash_suffix}"
 
 # 全局缓存管理器实例
 cache_manager = CacheManager()
 
-def cached(key_prefix: str, ttl_seconds: int = 3600, use_persistent: bool = True):
-    """缓存装饰器"""
+def cached(key_prefix: str, ttl_seconds: int = 3600, use_persistent: bool = True, ignore_self: bool = False):
+    """
+    缓存装饰器
+    
+    缓存键包含账本版本，账本重新加载后自动失效。
+    装饰实例方法时设置 ignore_self=True，使缓存键不依赖实例本身。
+    """
     def decorator(func: Callable[..., T]) -> Callable[..., T]:
         @wraps(func)
         def wrapper(*args, **kwargs) -> T:
             # 生成缓存键
-            cache_key = cache_manager.cache_key(key_prefix, args=args, kwargs=kwargs)
+            key_args = args[1:] if ignore_self else args
+            version = cache_manager.get_version()
+            cache_key = cache_manager.cache_key(key_prefix, version=version, args=key_args, kwargs=kwargs)
             
             # 尝试从缓存获取
             cached_result = cache_manager.get(cache_key, use_persistent)
             if cached_result is not None:
                 return cached_result
             
-            # 执行函数并缓存结果
+            # 执行函数并缓存结果；计算期间账本发生变化时结果不再对应该键，不写入缓存
             result = func(*args, **kwargs)
-            cache_manager.put(cache_key, result, ttl_seconds, use_persistent)
+            if cache_manager.get_version() == version:
+                cache_manager.put(cache_key, result, ttl_seconds, use_persistent, version=version)
             
             return result
         return wrapper
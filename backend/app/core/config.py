@@ -86,6 +86,28 @@ class Settings(BaseSettings):
     sync_delay_seconds: int = int(os.getenv("SYNC_DELAY_SECONDS", "30"))
     # 周期记账执行后的延迟同步时间（秒）
     recurring_sync_delay_seconds: int = int(os.getenv("RECURRING_SYNC_DELAY_SECONDS", "60"))
+    # GitHub API 地址（可指向 GitHub Enterprise 或本地模拟服务）
+    github_api_url: str = os.getenv("GITHUB_API_URL", "https://api.github.com")
+    # 同步时并发上传 blob 的数量
+    sync_upload_concurrency: int = int(os.getenv("SYNC_UPLOAD_CONCURRENCY", "8"))
+    
+    # 缓存配置
+    # 内存缓存最大条目数
+    cache_max_entries: int = int(os.getenv("CACHE_MAX_ENTRIES", "2000"))
+    # 内存缓存最大占用（MB，按估算大小计算）
+    cache_max_memory_mb: int = int(os.getenv("CACHE_MAX_MEMORY_MB", "256"))
+    
+    # 重新加载配置
+    # 交易写入后合并重新加载的窗口（毫秒），窗口内的多次写入只重新加载一次，0 表示立即重新加载
+    reload_coalesce_ms: int = int(os.getenv("RELOAD_COALESCE_MS", "300"))
+    # 读请求携带版本令牌时等待重新加载完成的最长时间（秒）
+    reload_wait_timeout_seconds: float = float(os.getenv("RELOAD_WAIT_TIMEOUT_SECONDS", "10"))
+    
+    # 预热配置
+    # 启动时和交易写入后是否在后台预热账本与仪表盘报表
+    warmup_enabled: bool = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+    # 交易写入后延迟预热的时间（秒），连续写入只预热一次
+    warmup_delay_seconds: int = int(os.getenv("WARMUP_DELAY_SECONDS", "2"))
     
     model_config = {
         "env_file": ".env",
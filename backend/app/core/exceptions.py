@@ -80,3 +80,18 @@ class ConfigurationError(BeancountWebException):
             code="CONFIGURATION_ERROR",
             details={"config_key": config_key}
         )
+
+
+class FileConflictError(BeancountWebException):
+    """文件已被修改（版本不一致）异常"""
+    
+    def __init__(self, file_path: str, expected_version: str, current_version: str):
+        super().__init__(
+            message=f"文件已被修改，请重新读取后再试: {file_path}",
+            code="FILE_CONFLICT",
+            details={
+                "file_path": file_path,
+                "expected_version": expected_version,
+                "current_version": current_version
+            }
+        )
@@ -39,15 +39,17 @@ def init_database():
     try:
         # 导入所有模型以确保它们被注册到Base.metadata
         from app.models.recurring import Recurring, RecurringExecutionLog
-        from app.models.sync import SyncLog
+        from app.models.sync import SyncLog, SyncFileManifest
         from app.models.setting import Setting
         from app.models.github_sync import GitHubSync
         from app.models.account_order import AccountOrder
+        from app.models.budget import Budget, BudgetStatus
         
         logger.info("正在初始化数据库表...")
         
         # 创建所有表
         Base.metadata.create_all(bind=engine)
+        _add_missing_columns()
         
         logger.info("数据库表初始化完成")
         
@@ -59,4 +61,23 @@ def init_database():
         
     except Exception as e:
         logger.error(f"数据库初始化失败: {e}")
-        raise
\ No newline at end of file
+        raise
+
+
+def _add_missing_columns():
+    """为已存在的表补充后来新增的可空列（create_all 不会修改已有的表）"""
+    from sqlalchemy import inspect, text
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns or not column.nullable or column.primary_key:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                logger.info(f"已为表 {table.name} 添加列 {column.name}")
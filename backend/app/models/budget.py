@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Numeric, DateTime, Date
+from sqlalchemy import Column, Integer, String, Numeric, DateTime, Date, Boolean
 from app.database import Base
 from app.core.config import settings
 from typing import Dict, Any
@@ -31,3 +31,22 @@ class Budget(Base):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
         }
 
+
+
+class BudgetStatus(Base):
+    """预算状态表：当前周期预算执行情况的物化结果，随交易写入增量更新"""
+    __tablename__ = "budget_status"
+
+    budget_id = Column(Integer, primary_key=True)  # 对应 budgets.id
+    category = Column(String(200), nullable=False)
+    period_type = Column(String(20), nullable=False)
+    period_value = Column(String(50), nullable=False)
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date, nullable=False)
+    amount = Column(Numeric(precision=15, scale=2), nullable=False)
+    currency = Column(String(10), nullable=False, default="CNY")
+    spent = Column(Numeric(precision=15, scale=2), nullable=False, default=0)
+    is_exceeded = Column(Boolean, nullable=False, default=False)
+    budget_updated_at = Column(DateTime)  # 预算记录的更新时间，用于发现预算被修改
+    ledger_hash = Column(String(64))  # 计算时的账本内容哈希
+    refreshed_at = Column(DateTime, default=lambda: settings.now(), onupdate=lambda: settings.now())
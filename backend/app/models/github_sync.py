@@ -13,3 +13,5 @@ class GitHubSync(Base):
     include_files = Column(JSON) # List of glob patterns
     exclude_files = Column(JSON) # List of glob patterns
     conflict_resolution = Column(String, default="manual")
+    backend = Column(String, default="rest")  # rest: GitHub API; git: 本地 git 仓库推送
+    remote_url = Column(String)  # git 同步方式的远端地址
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
 from datetime import date, datetime
 from decimal import Decimal
 from enum import Enum
@@ -58,6 +58,37 @@ class IncomeStatement(BaseModel):
     net_income: Decimal
     currency: str
 
+class ReportSpec(BaseModel):
+    """批量报表请求中的单个报表"""
+    type: Literal["balance_sheet", "income_statement", "monthly_summary", "year_to_date", "trends"]
+    id: Optional[str] = Field(None, description="客户端自定义标识，原样返回")
+    as_of_date: Optional[date] = Field(None, description="资产负债表截止日期")
+    start_date: Optional[date] = Field(None, description="损益表开始日期")
+    end_date: Optional[date] = Field(None, description="损益表结束日期")
+    period: Optional[str] = Field(None, description="周期：月度汇总为 2024-11，年度汇总为 2024")
+    year: Optional[int] = None
+    month: Optional[int] = Field(None, ge=1, le=12)
+    months: Optional[int] = Field(None, ge=3, le=24, description="趋势分析月份数")
+
+class ReportBatchRequest(BaseModel):
+    """批量报表请求"""
+    reports: List[ReportSpec] = Field(..., min_length=1, max_length=50)
+
+class ReportBatchResult(BaseModel):
+    """批量报表中单个报表的结果"""
+    id: Optional[str] = None
+    type: str
+    success: bool
+    data: Optional[Any] = None
+    error: Optional[str] = None
+    elapsed_ms: float = Field(..., description="该报表的计算耗时（毫秒）")
+
+class ReportBatchResponse(BaseModel):
+    """批量报表响应"""
+    results: List[ReportBatchResult]
+    shared_elapsed_ms: float = Field(..., description="共享发生额的计算耗时（毫秒）")
+    total_elapsed_ms: float
+
 class TransactionFilter(BaseModel):
     start_date: Optional[date] = None
     end_date: Optional[date] = None
@@ -100,6 +131,37 @@ class FileTreeResponse(BaseModel):
     total_files: int
     main_file: str
 
+class FileRangeResponse(BaseModel):
+    """文件按范围读取响应"""
+    filename: str
+    file_path: str
+    content: str
+    start_line: int
+    end_line: int
+    total_lines: int
+    size: int
+    version: str = Field(..., description="文件版本，按行修改时用于检测并发写入")
+
+class FileLinePatch(BaseModel):
+    """按行范围修改：用 lines 替换第 start_line 到 end_line 行（1 基，闭区间）"""
+    start_line: int = Field(..., ge=1, description="起始行")
+    end_line: int = Field(..., ge=0, description="结束行，等于 start_line - 1 时表示在起始行之前插入")
+    lines: List[str] = Field(default_factory=list, description="替换后的行，为空表示删除")
+
+class FilePatchRequest(BaseModel):
+    """文件按行修改请求"""
+    version: Optional[str] = Field(None, description="读取时的文件版本，不一致时拒绝修改")
+    patches: List[FileLinePatch] = Field(..., min_length=1)
+
+class FilePatchResponse(BaseModel):
+    """文件按行修改响应"""
+    message: str
+    filename: str
+    file_path: str
+    total_lines: int
+    size: int
+    version: str
+
 class RecurrenceType(str, Enum):
     """周期类型枚举"""
     DAILY = "daily"  # 每日
@@ -169,6 +231,19 @@ class RecurringExecutionResult(BaseModel):
     failed_count: int
     details: List[Dict[str, Any]]
 
+class RecurringBackfillItem(BaseModel):
+    """周期记账错过的发生日期"""
+    recurring_transaction_id: int
+    name: str
+    last_executed: Optional[date] = None
+    dates: List[date]
+
+class RecurringBackfillPreview(BaseModel):
+    """周期记账补记预览"""
+    until: date
+    total_count: int
+    items: List[RecurringBackfillItem]
+
 class AccountCreate(BaseModel):
     """创建账户请求"""
     name: str = Field(..., description="账户名称，需要符合beancount规范")
@@ -191,6 +266,71 @@ class AccountActionResponse(BaseModel):
     message: str
     account_name: str
 
+class AccountRegisterItem(BaseModel):
+    """账户明细中的一条记账行"""
+    date: date
+    flag: Optional[str] = None
+    payee: Optional[str] = None
+    narration: Optional[str] = None
+    amount: Decimal
+    currency: str
+    balance: Decimal = Field(..., description="记账后该币种的累计余额")
+    other_accounts: List[str] = Field(default_factory=list, description="同一交易中的其他账户")
+    filename: Optional[str] = None
+    lineno: Optional[int] = None
+    transaction_id: Optional[str] = None
+
+class AccountRegisterResponse(BaseModel):
+    """账户明细（分页）"""
+    account: str
+    data: List[AccountRegisterItem]
+    total: int
+    page: int
+    page_size: int
+    total_pages: int
+
+class AccountTreeNode(BaseModel):
+    """带汇总余额的账户树节点"""
+    name: str = Field(..., description="账户名的最后一段")
+    account: str = Field(..., description="完整账户名")
+    balance: Decimal = Field(..., description="包含子账户的余额，按截止日汇率折算为主币种")
+    balances: Dict[str, Decimal] = Field(default_factory=dict, description="包含子账户的各币种原币余额")
+    is_closed: bool = False
+    children: List['AccountTreeNode'] = Field(default_factory=list)
+
+AccountTreeNode.model_rebuild()
+
+class AccountTreeResponse(BaseModel):
+    """账户余额树响应"""
+    as_of_date: date
+    currency: str
+    roots: List[AccountTreeNode]
+    unconverted_currencies: List[str] = Field(default_factory=list, description="没有汇率、未计入折算余额的币种")
+
+class NetWorthSeriesResponse(BaseModel):
+    """净资产时间序列，各数组与 dates 一一对应"""
+    interval: Literal["month", "week", "day"]
+    currency: str
+    dates: List[date]
+    assets: List[Decimal]
+    liabilities: List[Decimal]
+    net_worth: List[Decimal]
+    account: Optional[str] = None
+    account_balance: Optional[List[Decimal]] = Field(None, description="指定账户（含子账户）的折算余额")
+
+class AccountStats(BaseModel):
+    """账户生命周期与记账统计"""
+    account: str
+    open_date: Optional[date] = None
+    close_date: Optional[date] = None
+    is_closed: bool = False
+    currencies: List[str] = Field(default_factory=list, description="Open 指令约束的币种")
+    booking_method: Optional[str] = None
+    first_posting_date: Optional[date] = None
+    last_posting_date: Optional[date] = None
+    posting_count: int = 0
+    subaccount_count: int = 0
+
 # 新增：主币种和价格管理相关的 Schema
 class OperatingCurrencyResponse(BaseModel):
     """主币种响应"""
@@ -318,4 +458,55 @@ class BudgetSummary(BaseModel):
     total_remaining: Decimal
     overall_percentage: float
     budgets: List[BudgetProgress]
-    currency: str 
\ No newline at end of file
+    currency: str 
+
+class BudgetHistoryPoint(BaseModel):
+    """某个类别在单个周期的预算执行情况"""
+    period_value: str = Field(..., description="周期值")
+    start_date: date
+    end_date: date
+    budget_amount: Optional[Decimal] = Field(None, description="预算金额，该周期未设置预算时为空")
+    spent: Decimal = Field(..., description="实际支出")
+    remaining: Optional[Decimal] = Field(None, description="剩余金额")
+    percentage: Optional[float] = Field(None, description="使用百分比")
+    is_exceeded: bool = Field(False, description="是否超支")
+    days_remaining: Optional[int] = Field(None, description="剩余天数")
+    projected_spent: Optional[Decimal] = Field(None, description="按当前支出速度预测的周期末支出")
+    projected_exceeded: bool = Field(False, description="预测是否超支")
+
+
+class BudgetHistoryCategory(BaseModel):
+    """单个类别的预算历史"""
+    category: str
+    currency: str
+    points: List[BudgetHistoryPoint]
+
+
+class BudgetHistory(BaseModel):
+    """多周期预算历史与预测"""
+    period_type: str
+    periods: List[str] = Field(..., description="按时间顺序排列的周期值")
+    categories: List[BudgetHistoryCategory]
+
+
+class BudgetStatusItem(BaseModel):
+    """单个预算的当前状态"""
+    budget_id: int
+    category: str
+    period_type: str
+    period_value: str
+    amount: Decimal
+    currency: str
+    spent: Decimal
+    remaining: Decimal
+    percentage: float
+    is_exceeded: bool
+    days_remaining: Optional[int] = None
+
+
+class BudgetStatusResponse(BaseModel):
+    """当前周期预算状态（来自物化的预算状态表）"""
+    items: List[BudgetStatusItem]
+    exceeded_count: int = Field(..., description="超支预算数量")
+    ledger_hash: Optional[str] = Field(None, description="状态对应的账本内容哈希")
+    refreshed_at: Optional[datetime] = None
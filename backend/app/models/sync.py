@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Float
+from sqlalchemy import Column, Integer, String, DateTime, Text, Float, BigInteger
 from app.database import Base
 from app.core.config import settings
 import datetime
@@ -15,3 +15,15 @@ class SyncLog(Base):
     files_count = Column(Integer, default=0)
     duration = Column(Float) # in seconds
     logs = Column(Text)
+
+
+class SyncFileManifest(Base):
+    """同步文件清单：记录本地文件的 stat 信息、git blob SHA 以及最近一次推送的 blob SHA"""
+    __tablename__ = "sync_file_manifest"
+
+    path = Column(String, primary_key=True)  # 相对数据目录的路径
+    size = Column(BigInteger, nullable=False)
+    mtime_ns = Column(BigInteger, nullable=False)
+    blob_sha = Column(String(40), nullable=False)  # 当前内容的 git blob SHA
+    pushed_sha = Column(String(40))  # 最近一次推送（或从远端恢复）时的 blob SHA
+    updated_at = Column(DateTime, default=lambda: settings.now(), onupdate=lambda: settings.now())
@@ -28,6 +28,8 @@ class GitHubSyncConfig(BaseModel):
     include_files: List[str] = Field(default=["*.bean", "*.beancount"], description="包含的文件模式")
     exclude_files: List[str] = Field(default=["*.tmp", "*.log"], description="排除的文件模式")
     conflict_resolution: ConflictResolution = Field(default=ConflictResolution.MANUAL, description="冲突解决策略")
+    backend: Literal["rest", "git"] = Field(default="rest", description="同步方式：rest 通过 GitHub API 逐个上传，git 通过本地 git 仓库推送 pack")
+    remote_url: Optional[str] = Field(default=None, description="git 同步方式的远端地址，默认为 https://github.com/<repository>.git")
 
 class GitHubSyncConfigRequest(BaseModel):
     """GitHub同步配置请求"""
@@ -39,6 +41,8 @@ class GitHubSyncConfigRequest(BaseModel):
     include_files: List[str] = Field(default=["*.bean", "*.beancount"], description="包含的文件模式")
     exclude_files: List[str] = Field(default=["*.tmp", "*.log"], description="排除的文件模式")
     conflict_resolution: ConflictResolution = Field(default=ConflictResolution.MANUAL, description="冲突解决策略")
+    backend: Literal["rest", "git"] = Field(default="rest", description="同步方式：rest 通过 GitHub API 逐个上传，git 通过本地 git 仓库推送 pack")
+    remote_url: Optional[str] = Field(default=None, description="git 同步方式的远端地址，默认为 https://github.com/<repository>.git")
 
 class GitHubSyncConfigResponse(BaseModel):
     """GitHub同步配置响应"""
@@ -49,6 +53,8 @@ class GitHubSyncConfigResponse(BaseModel):
     include_files: List[str]
     exclude_files: List[str]
     conflict_resolution: ConflictResolution
+    backend: Literal["rest", "git"] = "rest"
+    remote_url: Optional[str] = None
     last_sync: Optional[datetime] = None
     status: SyncStatus
 
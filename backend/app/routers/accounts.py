@@ -1,9 +1,13 @@
-from fastapi import APIRouter, HTTPException, Body
-from typing import List, Dict
+from fastapi import APIRouter, HTTPException, Body, Query
+from typing import List, Dict, Optional
+from datetime import date, datetime
 
 from app.services.beancount_service import beancount_service
 from app.services.account_order_service import account_order_service
-from app.models.schemas import AccountCreate, AccountClose, AccountRestore, AccountActionResponse
+from app.models.schemas import (
+    AccountCreate, AccountClose, AccountRestore, AccountActionResponse, AccountStats, AccountTreeResponse,
+    AccountRegisterResponse
+)
 from app.core.response import success_response, error_response
 from app.core.exceptions import BeancountWebException
 from app.core.logging_config import get_logger
@@ -90,6 +94,21 @@ async def get_account_structure():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取账户结构失败: {str(e)}")
 
+@router.get("/tree", response_model=AccountTreeResponse)
+async def get_account_tree(
+    as_of_date: Optional[date] = Query(None, description="截止日期，默认为今天"),
+    include_archived: bool = Query(False, description="是否包含余额为零的已归档账户")
+):
+    """获取带汇总余额的账户树，每个节点的余额包含其所有子账户"""
+    try:
+        if as_of_date is None:
+            as_of_date = datetime.now().date()
+        
+        return beancount_service.get_account_tree(as_of_date, include_archived)
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取账户余额树失败: {str(e)}")
+
 @router.get("/types")
 async def get_accounts_by_type():
     """按类型分组获取活跃账户（排除已归档账户）"""
@@ -270,4 +289,39 @@ async def get_accounts_in_subcategory(category: str, subcategory: str):
         subcategory_accounts = account_order_service.get_accounts_in_subcategory(category, subcategory, accounts)
         return {"accounts": subcategory_accounts}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"获取子分类账户失败: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"获取子分类账户失败: {str(e)}")
+
+@router.get("/{account_name}/stats", response_model=AccountStats)
+async def get_account_stats(account_name: str):
+    """获取账户的开启/关闭日期、约束币种、记账方法和记账行统计"""
+    try:
+        stats = beancount_service.get_account_stats(account_name)
+        if stats is None:
+            raise HTTPException(status_code=404, detail=f"账户不存在: {account_name}")
+        return AccountStats(**stats)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取账户统计失败: {str(e)}")
+
+@router.get("/{account_name}/register", response_model=AccountRegisterResponse)
+async def get_account_register(
+    account_name: str,
+    start_date: Optional[date] = Query(None, description="开始日期"),
+    end_date: Optional[date] = Query(None, description="结束日期"),
+    order: str = Query("desc", pattern="^(asc|desc)$", description="排序方式：desc 最新在前，asc 最早在前"),
+    page: int = Query(1, description="页码", ge=1),
+    page_size: int = Query(50, description="每页条数", ge=1, le=200)
+):
+    """获取账户明细，每条记账行附带记账后的累计余额"""
+    try:
+        register = beancount_service.get_account_register(
+            account_name, page, page_size, start_date, end_date, reverse=(order == "desc")
+        )
+        if register is None:
+            raise HTTPException(status_code=404, detail=f"账户不存在: {account_name}")
+        return register
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取账户明细失败: {str(e)}")
@@ -1,7 +1,10 @@
 """
 预算管理 API 路由
 """
-from fastapi import APIRouter, HTTPException, Depends, Query
+import asyncio
+
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
@@ -10,13 +13,19 @@ from app.models.schemas import (
     BudgetUpdate,
     BudgetResponse,
     BudgetProgress,
-    BudgetSummary
+    BudgetSummary,
+    BudgetHistory,
+    BudgetStatusResponse
 )
 from app.services.budget_service import BudgetService
+from app.services.budget_status_service import budget_status_service
 from app.database import get_db
 
 router = APIRouter()
 
+# SSE 心跳间隔（秒），避免代理断开空闲连接
+BUDGET_STATUS_HEARTBEAT_SECONDS = 15
+
 
 @router.post("/", response_model=BudgetResponse)
 async def create_budget(
@@ -28,7 +37,9 @@ async def create_budget(
     """
     try:
         service = BudgetService(db)
-        return service.create_budget(budget_data)
+        budget = service.create_budget(budget_data)
+        budget_status_service.refresh(db)
+        return budget
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -67,6 +78,74 @@ async def get_budget_summary(
         raise HTTPException(status_code=500, detail=f"获取预算汇总失败: {str(e)}")
 
 
+@router.get("/history", response_model=BudgetHistory)
+async def get_budget_history(
+    period_type: str = Query("month", description="周期类型：month, quarter, year"),
+    periods: int = Query(12, description="周期数量", ge=1, le=60),
+    end_period: Optional[str] = Query(None, description="最后一个周期值，默认当前周期"),
+    db: Session = Depends(get_db)
+):
+    """
+    获取多周期预算历史与预测
+    
+    一次遍历账本得到类别 × 周期的支出矩阵，返回每个预算类别在各周期的
+    预算、实际支出，以及按当前支出速度预测的周期末支出。
+    """
+    try:
+        service = BudgetService(db)
+        return service.get_budget_history(period_type, periods, end_period)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取预算历史失败: {str(e)}")
+
+
+@router.get("/status", response_model=BudgetStatusResponse)
+async def get_budget_status(db: Session = Depends(get_db)):
+    """
+    获取当前周期预算状态
+    
+    读取物化的预算状态表，只有账本或预算发生变化后才重新计算，适合频繁查询超支提醒。
+    """
+    try:
+        return budget_status_service.get_status(db)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取预算状态失败: {str(e)}")
+
+
+@router.get("/status/stream")
+async def stream_budget_status(request: Request, db: Session = Depends(get_db)):
+    """
+    以 Server-Sent Events 推送预算状态
+    
+    连接建立后先推送一次当前状态，之后在交易或预算变化导致状态改变时推送。
+    """
+    try:
+        initial_status = budget_status_service.get_status(db)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取预算状态失败: {str(e)}")
+    
+    queue = budget_status_service.subscribe()
+    
+    async def event_stream():
+        try:
+            yield f"event: budget_status\ndata: {initial_status.model_dump_json()}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    payload = await asyncio.wait_for(queue.get(), timeout=BUDGET_STATUS_HEARTBEAT_SECONDS)
+                    yield f"event: budget_status\ndata: {payload}\n\n"
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            budget_status_service.unsubscribe(queue)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/{budget_id}", response_model=BudgetResponse)
 async def get_budget(
     budget_id: int,
@@ -118,7 +197,9 @@ async def update_budget(
     """
     try:
         service = BudgetService(db)
-        return service.update_budget(budget_id, update_data)
+        budget = service.update_budget(budget_id, update_data)
+        budget_status_service.refresh(db)
+        return budget
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
@@ -138,6 +219,7 @@ async def delete_budget(
         success = service.delete_budget(budget_id)
         if not success:
             raise HTTPException(status_code=404, detail="预算不存在")
+        budget_status_service.refresh(db)
         return {"success": True, "message": "预算已删除"}
     except HTTPException:
         raise
@@ -0,0 +1,17 @@
+"""
+缓存管理 API 路由
+"""
+from fastapi import APIRouter, HTTPException
+
+from app.core.cache import cache_manager
+
+router = APIRouter()
+
+
+@router.get("/stats")
+async def get_cache_stats():
+    """获取缓存统计信息，包括各键前缀的命中率"""
+    try:
+        return cache_manager.get_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取缓存统计失败: {str(e)}")
@@ -1,17 +1,24 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
-from typing import List
+from fastapi import APIRouter, HTTPException, UploadFile, File, Query
+from fastapi.responses import FileResponse
+from typing import List, Optional
 import os
 from pathlib import Path
 from datetime import datetime
 
 from app.core.config import settings
-from app.models.schemas import FileInfo, FileListResponse, FileTreeResponse, FileTreeNode
+from app.core.exceptions import FileConflictError
+from app.models.schemas import (
+    FileInfo, FileListResponse, FileTreeResponse, FileTreeNode,
+    FileRangeResponse, FilePatchRequest, FilePatchResponse
+)
 from app.utils.file_utils import (
     is_beancount_file, 
     get_beancount_files, 
     build_file_tree, 
     get_all_included_files
 )
+from app.utils.line_index import LinePatch, line_index_cache
+from app.utils.write_lock import ledger_write_lock
 
 router = APIRouter()
 
@@ -129,6 +136,99 @@ async def get_file_content(file_path: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"读取文件失败: {str(e)}")
 
+def _resolve_ledger_file(file_path: str) -> Path:
+    """解析相对路径并检查文件位于data目录内且为Beancount文件"""
+    full_path = settings.data_dir / file_path
+    
+    try:
+        full_path.resolve().relative_to(settings.data_dir.resolve())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="不允许访问data目录外的文件")
+    
+    if not full_path.exists():
+        raise HTTPException(status_code=404, detail="文件不存在")
+    
+    if not is_beancount_file(full_path.name):
+        raise HTTPException(status_code=400, detail="只支持Beancount文件(.bean/.beancount)")
+    
+    return full_path
+
+@router.get("/content/range", response_model=FileRangeResponse)
+async def get_file_content_range(
+    file_path: str,
+    start_line: Optional[int] = Query(None, ge=1, description="起始行（1 基）"),
+    end_line: Optional[int] = Query(None, ge=0, description="结束行（含），默认到文件末尾"),
+    offset: Optional[int] = Query(None, ge=0, description="起始字节偏移，与 length 一起使用时按字节范围读取"),
+    length: Optional[int] = Query(None, ge=1, description="读取的字节数")
+):
+    """按行或字节范围读取文件内容，字节范围会扩展到完整的行"""
+    try:
+        full_path = _resolve_ledger_file(file_path)
+        
+        if offset is not None or length is not None:
+            if offset is None or length is None:
+                raise HTTPException(status_code=400, detail="按字节范围读取需要同时提供 offset 和 length")
+            content, first, last, index = line_index_cache.read_bytes(full_path, offset, length)
+        else:
+            content, first, last, index = line_index_cache.read_lines(full_path, start_line or 1, end_line)
+        
+        return FileRangeResponse(
+            filename=full_path.name,
+            file_path=file_path,
+            content=content,
+            start_line=first,
+            end_line=last,
+            total_lines=index.total_lines,
+            size=index.size,
+            version=index.version
+        )
+        
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"读取文件失败: {str(e)}")
+
+@router.get("/content/raw")
+async def get_file_content_raw(file_path: str):
+    """以流的方式下载文件原始内容，支持 HTTP Range 请求"""
+    full_path = _resolve_ledger_file(file_path)
+    return FileResponse(full_path, media_type="text/plain; charset=utf-8", filename=full_path.name)
+
+@router.patch("/content", response_model=FilePatchResponse)
+async def patch_file_content(file_path: str, request: FilePatchRequest):
+    """按行范围原子修改文件内容，只传输修改的行"""
+    try:
+        full_path = _resolve_ledger_file(file_path)
+        
+        patches = [LinePatch(p.start_line, p.end_line, p.lines) for p in request.patches]
+        index = line_index_cache.apply_patches(full_path, patches, request.version)
+        
+        # 只有账本引用的文件才需要重新加载，多次修改合并为一次重新加载
+        main_file = settings.data_dir / settings.default_beancount_file
+        if full_path.resolve() in get_all_included_files(main_file.resolve()):
+            from app.services.beancount_service import beancount_service
+            beancount_service.loader.schedule_reload()
+        
+        return FilePatchResponse(
+            message="文件更新成功",
+            filename=full_path.name,
+            file_path=file_path,
+            total_lines=index.total_lines,
+            size=index.size,
+            version=index.version
+        )
+        
+    except HTTPException:
+        raise
+    except FileConflictError as e:
+        raise HTTPException(status_code=409, detail=e.message)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"更新文件失败: {str(e)}")
+
 @router.get("/{filename}/content")
 async def get_file_content_legacy(filename: str):
     """获取指定文件的内容（兼容旧接口）"""
@@ -151,8 +251,9 @@ async def update_file_content(file_path: str, content: dict):
             raise HTTPException(status_code=400, detail="只支持Beancount文件(.bean/.beancount)")
         
         # 写入新内容
-        with open(full_path, 'w', encoding='utf-8') as f:
-            f.write(content.get('content', ''))
+        with ledger_write_lock:
+            with open(full_path, 'w', encoding='utf-8') as f:
+                f.write(content.get('content', ''))
         
         # 重新加载beancount数据
         from app.services.beancount_service import beancount_service
@@ -213,7 +314,8 @@ async def delete_file(filename: str):
         if filename == settings.default_beancount_file:
             raise HTTPException(status_code=400, detail="不能删除主账本文件")
         
-        file_path.unlink()
+        with ledger_write_lock:
+            file_path.unlink()
         
         return {"message": "文件删除成功", "filename": filename}
         
@@ -223,43 +325,66 @@ async def delete_file(filename: str):
         raise HTTPException(status_code=500, detail=f"删除文件失败: {str(e)}")
 
 @router.post("/{filename}/validate")
-async def validate_file(filename: str):
-    """验证beancount文件语法"""
+async def validate_file(filename: str, syntax_only: bool = False):
+    """
+    验证beancount文件
+    
+    文件自上次加载后未被修改时直接从当前快照的错误索引返回结果；文件已修改时先做单文件语法检查，
+    语法无误再重新加载账本。syntax_only 为 True 时只做单文件语法检查。
+    """
     try:
         file_path = settings.data_dir / filename
         
         if not file_path.exists():
             raise HTTPException(status_code=404, detail="文件不存在")
         
-        # 使用beancount加载器验证文件
-        from beancount import loader
-        
-        # 判断是否为主文件，如果不是主文件，则验证整个账本系统
+        from app.services.beancount_service import beancount_service
+        from app.services.ledger_loader import normalize_path
+        loader = beancount_service.loader
+        main_file = settings.data_dir / settings.default_beancount_file
+        resolved_path = file_path.resolve()
+        in_ledger = main_file.exists() and resolved_path in get_all_included_files(main_file.resolve())
+        
+        source = "snapshot"
+        if syntax_only or not in_ledger or not loader.is_file_current(resolved_path):
+            # 只解析当前文件，不做记账和校验
+            from beancount.parser import parser
+            parsed_entries, syntax_errors, parsed_options = parser.parse_file(str(resolved_path))
+            if syntax_only or not in_ledger or syntax_errors:
+                return _validation_result(syntax_errors, len(parsed_entries), parsed_options, "parse")
+            
+            loader.load_entries(force_reload=True)
+            source = "reloaded"
+        
+        entries, errors, options_map = loader.load_entries()
         if filename == settings.default_beancount_file:
-            # 直接验证主文件
-            entries, errors, options_map = loader.load_file(str(file_path))
-        else:
-            # 对于子文件，验证整个账本系统以确保所有引用都能正确解析
-            main_file_path = settings.data_dir / settings.default_beancount_file
-            if main_file_path.exists():
-                entries, errors, options_map = loader.load_file(str(main_file_path))
-                # 过滤出与当前文件相关的错误
-                file_specific_errors = []
-                for error in errors:
-                    if hasattr(error, 'source') and error.source and filename in str(error.source.get('filename', '')):
-                        file_specific_errors.append(error)
-                errors = file_specific_errors
-            else:
-                # 如果主文件不存在，直接验证单个文件
-                entries, errors, options_map = loader.load_file(str(file_path))
+            # 主文件的验证结果即整个账本的结果
+            return _validation_result(errors, len(entries), options_map, source)
         
-        return {
-            "valid": len(errors) == 0,
-            "entries_count": len(entries),
-            "errors_count": len(errors),
-            "errors": [str(error) for error in errors[:10]],  # 最多返回10个错误
-            "options": dict(options_map) if options_map else {}
-        }
+        error_index = loader.get_error_index()
+        key = normalize_path(resolved_path)
+        file_errors = [error for _, error in error_index.errors_by_file.get(key, [])]
+        return _validation_result(file_errors, error_index.entries_by_file.get(key, 0), options_map, source)
         
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"验证文件失败: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"验证文件失败: {str(e)}")
+
+def _validation_result(errors: list, entries_count: int, options_map: dict, source: str) -> dict:
+    """构造验证结果，最多返回10个错误"""
+    return {
+        "valid": len(errors) == 0,
+        "entries_count": entries_count,
+        "errors_count": len(errors),
+        "errors": [str(error) for error in errors[:10]],
+        "error_details": [
+            {
+                "lineno": (getattr(error, 'source', None) or {}).get('lineno'),
+                "message": getattr(error, 'message', str(error))
+            }
+            for error in errors[:10]
+        ],
+        "source": source,
+        "options": dict(options_map) if options_map else {}
+    }
@@ -5,7 +5,7 @@ from datetime import date
 
 from app.models.schemas import (
     RecurringTransactionCreate, RecurringTransactionUpdate,
-    RecurringTransactionResponse
+    RecurringTransactionResponse, RecurringBackfillItem, RecurringBackfillPreview
 )
 from app.services.recurring_service import recurring_service
 from app.database import get_db
@@ -99,6 +99,54 @@ async def execute_recurring_transactions(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"执行失败: {str(e)}")
 
+def _parse_backfill_until(until: Optional[str]) -> date:
+    if not until:
+        return date.today()
+    try:
+        return date.fromisoformat(until)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日期格式错误，请使用YYYY-MM-DD格式")
+
+@router.get("/backfill/preview", response_model=RecurringBackfillPreview)
+async def preview_backfill(
+    until: Optional[str] = Query(None, description="补记截止日期（含），格式：YYYY-MM-DD，默认今天"),
+    ids: Optional[List[int]] = Query(None, description="只补记指定的周期记账ID"),
+    db: Session = Depends(get_db)
+):
+    """预览自上次执行以来错过的周期记账"""
+    until_date = _parse_backfill_until(until)
+    try:
+        missed = recurring_service.get_missed_occurrences(db, until_date, ids)
+        items = [
+            RecurringBackfillItem(
+                recurring_transaction_id=transaction.id,
+                name=transaction.name,
+                last_executed=transaction.last_executed,
+                dates=dates
+            )
+            for transaction, dates in missed
+        ]
+        return RecurringBackfillPreview(
+            until=until_date,
+            total_count=sum(len(item.dates) for item in items),
+            items=items
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"预览补记失败: {str(e)}")
+
+@router.post("/backfill")
+async def backfill_recurring_transactions(
+    until: Optional[str] = Query(None, description="补记截止日期（含），格式：YYYY-MM-DD，默认今天"),
+    ids: Optional[List[int]] = Query(None, description="只补记指定的周期记账ID"),
+    db: Session = Depends(get_db)
+):
+    """补记错过的周期记账（一次写入、一次重新加载）"""
+    until_date = _parse_backfill_until(until)
+    try:
+        return recurring_service.backfill_missed_transactions(db, until_date, ids)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"补记失败: {str(e)}")
+
 @router.get("/logs/execution")
 async def get_execution_logs(
     transaction_id: Optional[int] = Query(None, description="周期记账ID"),
@@ -1,12 +1,59 @@
 from fastapi import APIRouter, HTTPException, Query
-from typing import Optional
+from typing import Optional, List, Tuple, Callable, Any, Literal
 from datetime import date, datetime, timedelta
+from calendar import monthrange
+import time
 
-from app.models.schemas import BalanceResponse, IncomeStatement
+from app.models.schemas import (
+    BalanceResponse, IncomeStatement, NetWorthSeriesResponse,
+    ReportSpec, ReportBatchRequest, ReportBatchResult, ReportBatchResponse
+)
 from app.services.beancount_service import beancount_service
 
 router = APIRouter()
 
+
+def _month_period(year: Optional[int], month: Optional[int]) -> Tuple[int, int, date, date]:
+    """月度汇总的周期，默认为当前月份"""
+    if year is None or month is None:
+        now = datetime.now()
+        year = now.year
+        month = now.month
+    
+    start_date = date(year, month, 1)
+    _, last_day = monthrange(year, month)
+    end_date = date(year, month, last_day)
+    return year, month, start_date, end_date
+
+
+def _year_to_date_period(year: Optional[int]) -> Tuple[int, date, date]:
+    """年度至今汇总的周期，默认为当前年份"""
+    if year is None:
+        year = datetime.now().year
+    
+    start_date = date(year, 1, 1)
+    end_date = datetime.now().date()
+    
+    # 确保不超过当前年份
+    if end_date.year > year:
+        end_date = date(year, 12, 31)
+    return year, start_date, end_date
+
+
+def _trend_periods(months: int) -> List[Tuple[date, date, date]]:
+    """趋势分析的各月周期 (month_end, month_start, month_actual_end)，按时间倒序"""
+    periods = []
+    end_date = datetime.now().date()
+    
+    for i in range(months):
+        # 计算每个月的开始和结束日期
+        month_end = end_date.replace(day=1) - timedelta(days=i*30)
+        month_start = month_end.replace(day=1)
+        _, last_day = monthrange(month_end.year, month_end.month)
+        month_actual_end = month_end.replace(day=last_day)
+        periods.append((month_end, month_start, month_actual_end))
+    return periods
+
 @router.get("/balance-sheet", response_model=BalanceResponse)
 async def get_balance_sheet(
     as_of_date: Optional[date] = Query(None, description="截止日期，默认为今天")
@@ -48,18 +95,8 @@ async def get_monthly_summary(
 ):
     """获取月度汇总报告"""
     try:
-        from calendar import monthrange
-        
         # 默认为当前月份
-        if year is None or month is None:
-            now = datetime.now()
-            year = now.year
-            month = now.month
-        
-        # 计算月份的开始和结束日期
-        start_date = date(year, month, 1)
-        _, last_day = monthrange(year, month)
-        end_date = date(year, month, last_day)
+        year, month, start_date, end_date = _month_period(year, month)
         
         # 获取损益表
         income_statement = beancount_service.get_income_statement(start_date, end_date)
@@ -82,15 +119,7 @@ async def get_monthly_summary(
 async def get_year_to_date_summary(year: Optional[int] = Query(None, description="年份")):
     """获取年度至今汇总报告"""
     try:
-        if year is None:
-            year = datetime.now().year
-        
-        start_date = date(year, 1, 1)
-        end_date = datetime.now().date()
-        
-        # 确保不超过当前年份
-        if end_date.year > year:
-            end_date = date(year, 12, 31)
+        year, start_date, end_date = _year_to_date_period(year)
         
         income_statement = beancount_service.get_income_statement(start_date, end_date)
         balance_sheet = beancount_service.get_balance_sheet(end_date)
@@ -112,19 +141,9 @@ async def get_trends(
 ):
     """获取趋势分析数据"""
     try:
-        from datetime import datetime, timedelta
-        import calendar
-        
         trends = []
-        end_date = datetime.now().date()
-        
-        for i in range(months):
-            # 计算每个月的开始和结束日期
-            month_end = end_date.replace(day=1) - timedelta(days=i*30)
-            month_start = month_end.replace(day=1)
-            _, last_day = calendar.monthrange(month_end.year, month_end.month)
-            month_actual_end = month_end.replace(day=last_day)
-            
+        
+        for month_end, month_start, month_actual_end in _trend_periods(months):
             # 获取该月的损益表
             income_statement = beancount_service.get_income_statement(month_start, month_actual_end)
             
@@ -148,6 +167,31 @@ async def get_trends(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取趋势分析失败: {str(e)}") 
 
+@router.get("/net-worth-series", response_model=NetWorthSeriesResponse)
+async def get_net_worth_series(
+    interval: Literal["month", "week", "day"] = Query("month", description="采样间隔"),
+    start_date: Optional[date] = Query(None, description="开始日期，默认为结束日期前五年"),
+    end_date: Optional[date] = Query(None, description="结束日期，默认为今天"),
+    account: Optional[str] = Query(None, description="同时返回该账户（含子账户）的余额序列")
+):
+    """获取净资产时间序列，所有采样点在一次遍历中计算"""
+    try:
+        if end_date is None:
+            end_date = datetime.now().date()
+        if start_date is None:
+            start_date = end_date.replace(year=end_date.year - 5, day=1)
+        if start_date > end_date:
+            raise HTTPException(status_code=400, detail="开始日期不能晚于结束日期")
+        
+        return beancount_service.get_net_worth_series(start_date, end_date, interval, account)
+        
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取净资产趋势失败: {str(e)}")
+
 @router.get("/account-configuration")
 async def get_account_configuration():
     """获取Beancount账户配置信息"""
@@ -164,4 +208,154 @@ async def get_conversion_account_info():
         info = beancount_service.get_conversion_account_info()
         return info
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"获取转换账户信息失败: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"获取转换账户信息失败: {str(e)}") 
+
+def _parse_period(period: Optional[str], with_month: bool) -> Tuple[Optional[int], Optional[int]]:
+    """解析批量报表中的周期字符串：2024-11 或 2024"""
+    if not period:
+        return None, None
+    if with_month:
+        year, month = period.split('-')
+        return int(year), int(month)
+    return int(period), None
+
+
+def _plan_report(spec: ReportSpec) -> Tuple[List[Tuple[date, date]], List[date], Callable[..., Any]]:
+    """将报表定义拆解为所需的期间发生额、截止日余额，以及组装结果的函数"""
+    if spec.type == "balance_sheet":
+        as_of_date = spec.as_of_date or datetime.now().date()
+        return [], [as_of_date], lambda income, balance: balance(as_of_date)
+    
+    if spec.type == "income_statement":
+        # 默认获取当前月份的损益表
+        end_date = spec.end_date or datetime.now().date()
+        start_date = spec.start_date or end_date.replace(day=1)
+        if start_date > end_date:
+            raise ValueError("开始日期不能晚于结束日期")
+        return [(start_date, end_date)], [], lambda income, balance: income(start_date, end_date)
+    
+    if spec.type == "monthly_summary":
+        year, month = spec.year, spec.month
+        if spec.period:
+            year, month = _parse_period(spec.period, with_month=True)
+        year, month, start_date, end_date = _month_period(year, month)
+        
+        def assemble_monthly(income, balance):
+            return {
+                "period": f"{year}年{month}月",
+                "start_date": start_date,
+                "end_date": end_date,
+                "income_statement": income(start_date, end_date),
+                "balance_sheet": balance(end_date)
+            }
+        return [(start_date, end_date)], [end_date], assemble_monthly
+    
+    if spec.type == "year_to_date":
+        year = spec.year
+        if spec.period:
+            year, _ = _parse_period(spec.period, with_month=False)
+        year, start_date, end_date = _year_to_date_period(year)
+        
+        def assemble_year_to_date(income, balance):
+            return {
+                "period": f"{year}年至今",
+                "start_date": start_date,
+                "end_date": end_date,
+                "income_statement": income(start_date, end_date),
+                "balance_sheet": balance(end_date)
+            }
+        return [(start_date, end_date)], [end_date], assemble_year_to_date
+    
+    # trends
+    periods = _trend_periods(spec.months or 12)
+    
+    def assemble_trends(income, balance):
+        trends = []
+        for month_end, month_start, month_actual_end in periods:
+            income_statement = income(month_start, month_actual_end)
+            trends.append({
+                "period": f"{month_end.year}-{month_end.month:02d}",
+                "year": month_end.year,
+                "month": month_end.month,
+                "total_income": float(income_statement.total_income),
+                "total_expenses": float(income_statement.total_expenses),
+                "net_income": float(income_statement.net_income)
+            })
+        trends.reverse()
+        return {"trends": trends, "currency": "CNY"}
+    return [(start, end) for _, start, end in periods], [], assemble_trends
+
+
+@router.post("/batch", response_model=ReportBatchResponse)
+async def get_reports_batch(request: ReportBatchRequest):
+    """
+    批量获取报表
+    
+    所有报表共享一次账本遍历得到的分桶发生额，相同的期间或截止日只计算一次。
+    单个报表失败不影响其他报表，结果中包含每个报表的计算耗时。
+    """
+    try:
+        total_start = time.perf_counter()
+        
+        # 拆解每个报表所需的期间和截止日
+        plans = []
+        income_periods: List[Tuple[date, date]] = []
+        balance_dates: List[date] = []
+        for spec in request.reports:
+            try:
+                periods, dates, assemble = _plan_report(spec)
+                income_periods.extend(periods)
+                balance_dates.extend(dates)
+                plans.append((spec, assemble, None))
+            except ValueError as e:
+                plans.append((spec, None, f"报表参数无效: {str(e)}"))
+        
+        shared_start = time.perf_counter()
+        aggregates = beancount_service.build_report_aggregates(income_periods, balance_dates)
+        shared_elapsed_ms = (time.perf_counter() - shared_start) * 1000
+        
+        income_cache = {}
+        balance_cache = {}
+        
+        def income(start_date: date, end_date: date) -> IncomeStatement:
+            key = (start_date, end_date)
+            if key not in income_cache:
+                income_cache[key] = beancount_service.get_income_statement_from_aggregates(
+                    aggregates, start_date, end_date
+                )
+            return income_cache[key]
+        
+        def balance(as_of_date: date) -> BalanceResponse:
+            if as_of_date not in balance_cache:
+                balance_cache[as_of_date] = beancount_service.get_balance_sheet_from_aggregates(
+                    aggregates, as_of_date
+                )
+            return balance_cache[as_of_date]
+        
+        results = []
+        for spec, assemble, error in plans:
+            report_start = time.perf_counter()
+            data = None
+            if assemble is not None:
+                try:
+                    data = assemble(income, balance)
+                except Exception as e:
+                    error = f"生成报表失败: {str(e)}"
+            
+            results.append(ReportBatchResult(
+                id=spec.id,
+                type=spec.type,
+                success=error is None,
+                data=data,
+                error=error,
+                elapsed_ms=round((time.perf_counter() - report_start) * 1000, 3)
+            ))
+        
+        return ReportBatchResponse(
+            results=results,
+            shared_elapsed_ms=round(shared_elapsed_ms, 3),
+            total_elapsed_ms=round((time.perf_counter() - total_start) * 1000, 3)
+        )
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"批量获取报表失败: {str(e)}")
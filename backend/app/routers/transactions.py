@@ -15,33 +15,6 @@ from app.core.config import settings
 
 router = APIRouter()
 
-async def add_transaction_to_yearly_file(transaction_data: dict) -> bool:
-    """
-    将交易添加到对应年份的文件中
-    
-    Args:
-        transaction_data: 交易数据字典
-        
-    Returns:
-        bool: 是否成功添加
-    """
-    try:
-        # 解析交易日期
-        transaction_date = date.fromisoformat(transaction_data["date"])
-        
-        # 生成Beancount格式的交易内容
-        transaction_content = format_transaction_content(transaction_data)
-        
-        # 添加到年份文件
-        success = yearly_file_manager.add_transaction_to_yearly_file(
-            transaction_date, transaction_content
-        )
-        
-        return success
-    except Exception as e:
-        print(f"添加交易到年份文件失败: {e}")
-        return False
-
 def format_transaction_content(transaction_data: dict) -> str:
     """
     将交易数据格式化为Beancount格式
@@ -242,13 +215,12 @@ async def create_transaction(
             ]
         }
         
-        # 使用年份文件管理器添加交易
-        success = await add_transaction_to_yearly_file(transaction_data)
+        # 通过交易仓储写入对应年份文件并重新加载，同时通知交易变动监听者
+        success = beancount_service.add_transaction(
+            transaction_data, format_transaction_content(transaction_data)
+        )
         
         if success:
-            # 重新加载beancount数据以包含新交易
-            beancount_service.loader.load_entries(force_reload=True)
-            
             # 安排延迟同步任务，避免频繁同步
             schedule_delayed_sync(db)
             return {"message": "交易创建成功", "success": True}
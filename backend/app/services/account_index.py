@@ -0,0 +1,127 @@
+"""
+账户层级索引
+将账户编号为整数，使任意账户及其所有子账户对应一段连续的编号区间
+"""
+from bisect import bisect_right
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class AccountIndex:
+    """
+    账户层级索引
+
+    账户按名称的层级分段排序（父账户排在其所有子账户之前，子账户彼此相邻），
+    因此"某账户及其所有子账户"就是编号区间 [start, end]，判断归属只需两次整数比较。
+    索引会补全所有祖先账户，便于自底向上汇总。
+    """
+
+    def __init__(self, accounts: Iterable[str]):
+        names = set()
+        for account in accounts:
+            parts = account.split(':')
+            for i in range(1, len(parts) + 1):
+                names.add(':'.join(parts[:i]))
+
+        self.names: List[str] = sorted(names, key=lambda name: name.split(':'))
+        self.ids: Dict[str, int] = {name: i for i, name in enumerate(self.names)}
+        self.parents: List[int] = [
+            self.ids[name.rsplit(':', 1)[0]] if ':' in name else -1 for name in self.names
+        ]
+
+        # 子树的最后一个编号：子账户编号大于父账户，倒序遍历即可向上传递
+        self.subtree_ends: List[int] = list(range(len(self.names)))
+        for account_id in range(len(self.names) - 1, -1, -1):
+            parent_id = self.parents[account_id]
+            if parent_id >= 0 and self.subtree_ends[account_id] > self.subtree_ends[parent_id]:
+                self.subtree_ends[parent_id] = self.subtree_ends[account_id]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, account: str) -> bool:
+        return account in self.ids
+
+    def id_of(self, account: str) -> Optional[int]:
+        """获取账户编号，不存在时返回 None"""
+        return self.ids.get(account)
+
+    def subtree_range(self, account: str) -> Optional[Tuple[int, int]]:
+        """获取账户及其子账户的编号区间（闭区间）"""
+        account_id = self.ids.get(account)
+        if account_id is None:
+            return None
+        return account_id, self.subtree_ends[account_id]
+
+    def subtree_accounts(self, account: str) -> List[str]:
+        """获取账户及其所有子账户名称"""
+        id_range = self.subtree_range(account)
+        if id_range is None:
+            return []
+        return self.names[id_range[0]:id_range[1] + 1]
+
+    def is_in_subtree(self, account: str, root: str) -> bool:
+        """判断 account 是否为 root 本身或其子账户"""
+        account_id = self.ids.get(account)
+        id_range = self.subtree_range(root)
+        if account_id is None or id_range is None:
+            return False
+        return id_range[0] <= account_id <= id_range[1]
+
+    def match_ranges(self, keyword: str) -> List[Tuple[int, int]]:
+        """
+        获取名称中包含 keyword 的账户对应的编号区间
+
+        账户名包含 keyword 时其子账户名也必然包含，所以匹配结果是若干棵完整的子树，
+        返回按起点排序、互不重叠的区间列表，可配合 in_ranges 使用。
+        """
+        ranges = []
+        account_id = 0
+        while account_id < len(self.names):
+            if keyword in self.names[account_id]:
+                end = self.subtree_ends[account_id]
+                ranges.append((account_id, end))
+                account_id = end + 1
+            else:
+                account_id += 1
+        return ranges
+
+    @staticmethod
+    def in_ranges(account_id: Optional[int], ranges: List[Tuple[int, int]]) -> bool:
+        """判断编号是否落在 match_ranges 返回的区间内"""
+        if account_id is None or not ranges:
+            return False
+        pos = bisect_right(ranges, (account_id, float('inf'))) - 1
+        return pos >= 0 and ranges[pos][0] <= account_id <= ranges[pos][1]
+
+    def rollup(self, amounts: Dict[Tuple[str, str], Decimal]) -> Dict[Tuple[str, str], Decimal]:
+        """
+        自底向上汇总 (账户, 币种) 金额
+
+        返回结果中每个账户的金额包含其所有子账户，不在索引中的账户保持原值。
+        """
+        by_id: Dict[int, Dict[str, Decimal]] = {}
+        result: Dict[Tuple[str, str], Decimal] = {}
+        for (account, currency), amount in amounts.items():
+            account_id = self.ids.get(account)
+            if account_id is None:
+                result[(account, currency)] = result.get((account, currency), Decimal('0')) + amount
+                continue
+            currencies = by_id.setdefault(account_id, {})
+            currencies[currency] = currencies.get(currency, Decimal('0')) + amount
+
+        # 子账户编号总是大于父账户，倒序处理保证子账户先汇总完成
+        for account_id in range(len(self.names) - 1, -1, -1):
+            currencies = by_id.get(account_id)
+            if not currencies:
+                continue
+            parent_id = self.parents[account_id]
+            if parent_id >= 0:
+                parent_currencies = by_id.setdefault(parent_id, {})
+                for currency, amount in currencies.items():
+                    parent_currencies[currency] = parent_currencies.get(currency, Decimal('0')) + amount
+
+        for account_id, currencies in by_id.items():
+            for currency, amount in currencies.items():
+                result[(self.names[account_id], currency)] = amount
+        return result
@@ -0,0 +1,92 @@
+"""
+账户生命周期索引
+一次遍历账本，汇总每个账户的开启/关闭日期、约束币种、记账方法和记账行统计
+"""
+from datetime import date
+from typing import Any, Dict, Iterator, List, Optional
+
+from beancount.core import getters
+from beancount.core.data import Close, Open, Transaction
+
+
+class AccountLifecycle:
+    """单个账户的生命周期信息"""
+
+    __slots__ = ('account', 'open_date', 'close_date', 'currencies', 'booking_method',
+                 'first_posting_date', 'last_posting_date', 'posting_count')
+
+    def __init__(self, account: str):
+        self.account = account
+        self.open_date: Optional[date] = None
+        self.close_date: Optional[date] = None
+        self.currencies: List[str] = []
+        self.booking_method: Optional[str] = None
+        self.first_posting_date: Optional[date] = None
+        self.last_posting_date: Optional[date] = None
+        self.posting_count = 0
+
+    @property
+    def is_closed(self) -> bool:
+        return self.close_date is not None
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class AccountLifecycleIndex:
+    """
+    账户生命周期索引
+
+    包含账本中出现过的所有账户（与 getters.get_accounts 一致），未通过 Open 指令开启的账户
+    开启日期为 None。条目按日期排序，因此首条/末条记账行日期只需按遍历顺序记录。
+    """
+
+    def __init__(self, entries: List[Any]):
+        self.accounts: Dict[str, AccountLifecycle] = {
+            account: AccountLifecycle(account) for account in getters.get_accounts(entries)
+        }
+
+        for entry in entries:
+            if isinstance(entry, Transaction):
+                for posting in entry.postings:
+                    info = self.accounts[posting.account]
+                    if info.first_posting_date is None:
+                        info.first_posting_date = entry.date
+                    info.last_posting_date = entry.date
+                    info.posting_count += 1
+            elif isinstance(entry, Open):
+                info = self.accounts[entry.account]
+                # 重复的 Open 指令以第一条为准（重复本身会在加载时报错）
+                if info.open_date is None:
+                    info.open_date = entry.date
+                    info.currencies = list(entry.currencies or [])
+                    info.booking_method = entry.booking.name if entry.booking else None
+            elif isinstance(entry, Close):
+                info = self.accounts[entry.account]
+                if info.close_date is None:
+                    info.close_date = entry.date
+
+    def __contains__(self, account: str) -> bool:
+        return account in self.accounts
+
+    def __iter__(self) -> Iterator[AccountLifecycle]:
+        return iter(self.accounts.values())
+
+    def get(self, account: str) -> Optional[AccountLifecycle]:
+        return self.accounts.get(account)
+
+    def all_accounts(self) -> List[str]:
+        """所有账户，按名称排序"""
+        return sorted(self.accounts)
+
+    def active_accounts(self) -> List[str]:
+        """未关闭的账户，按名称排序"""
+        return sorted(account for account, info in self.accounts.items() if info.close_date is None)
+
+    def archived_accounts(self) -> List[str]:
+        """已关闭的账户，按名称排序"""
+        return sorted(account for account, info in self.accounts.items() if info.close_date is not None)
+
+    def opened_accounts(self) -> List[AccountLifecycle]:
+        """通过 Open 指令开启的账户"""
+        return [info for info in self.accounts.values() if info.open_date is not None]
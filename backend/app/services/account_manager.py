@@ -5,8 +5,8 @@
 import re
 from datetime import date
 from typing import List, Optional, Tuple
-from beancount.core import getters
-from beancount.core.data import Close
+
+from app.utils.write_lock import ledger_write_lock
 
 
 class AccountManager:
@@ -26,17 +26,16 @@ class AccountManager:
             raise ValueError(f"无效的账户名称格式: {error_message}")
         
         # 检查账户是否已存在
-        entries, _, _ = self.loader.load_entries()
-        existing_accounts = getters.get_accounts(entries)
-        if account_name in existing_accounts:
+        if account_name in self.loader.get_account_lifecycle():
             raise ValueError(f"账户已存在: {account_name}")
         
         # 构建open指令字符串
         open_directive = self._build_open_directive(account_name, open_date, currencies, booking_method)
         
         # 追加到主文件
-        with open(self.main_file, 'a', encoding='utf-8') as f:
-            f.write('\n' + open_directive + '\n')
+        with ledger_write_lock:
+            with open(self.main_file, 'a', encoding='utf-8') as f:
+                f.write('\n' + open_directive + '\n')
         
         # 重新加载条目
         self.loader.load_entries(force_reload=True)
@@ -46,22 +45,21 @@ class AccountManager:
         """归档账户（添加close指令）"""
         try:
             # 检查账户是否存在
-            entries, _, _ = self.loader.load_entries()
-            existing_accounts = getters.get_accounts(entries)
-            if account_name not in existing_accounts:
+            info = self.loader.get_account_lifecycle().get(account_name)
+            if info is None:
                 raise ValueError(f"账户不存在: {account_name}")
             
             # 检查账户是否已经关闭
-            for entry in entries:
-                if isinstance(entry, Close) and entry.account == account_name:
-                    raise ValueError(f"账户已经关闭: {account_name}")
+            if info.is_closed:
+                raise ValueError(f"账户已经关闭: {account_name}")
             
             # 构建close指令字符串
             close_directive = self._build_close_directive(account_name, close_date)
             
             # 追加到主文件
-            with open(self.main_file, 'a', encoding='utf-8') as f:
-                f.write('\n' + close_directive + '\n')
+            with ledger_write_lock:
+                with open(self.main_file, 'a', encoding='utf-8') as f:
+                    f.write('\n' + close_directive + '\n')
             
             # 重新加载条目
             self.loader.load_entries(force_reload=True)
@@ -75,57 +73,52 @@ class AccountManager:
         """恢复账户（删除close指令）"""
         try:
             # 检查账户是否存在且已关闭
-            entries, _, _ = self.loader.load_entries()
-            
-            close_entry = None
-            for entry in entries:
-                if isinstance(entry, Close) and entry.account == account_name:
-                    close_entry = entry
-                    break
-            
-            if not close_entry:
+            info = self.loader.get_account_lifecycle().get(account_name)
+            if info is None or not info.is_closed:
                 raise ValueError(f"账户未归档或不存在: {account_name}")
             
-            # 读取主文件内容
-            with open(self.main_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # 构建要删除的close指令（构建可能的close指令格式）
-            close_date_str = close_entry.date.strftime('%Y-%m-%d')
-            close_directive_patterns = [
-                f"{close_date_str} close {account_name}",
-                f"{close_date_str} close {account_name} ",
-                f"\n{close_date_str} close {account_name}\n",
-                f"\n{close_date_str} close {account_name} \n"
-            ]
-            
-            # 尝试删除close指令
-            modified = False
-            for pattern in close_directive_patterns:
-                if pattern in content:
-                    content = content.replace(pattern, "")
-                    modified = True
-                    break
-            
-            if not modified:
-                # 如果精确匹配失败，尝试使用正则表达式
-                pattern = f"^{re.escape(close_date_str)} close {re.escape(account_name)}.*$"
-                lines = content.split('\n')
-                new_lines = []
-                for line in lines:
-                    if not re.match(pattern, line.strip()):
-                        new_lines.append(line)
-                    else:
+            with ledger_write_lock:
+                # 读取主文件内容
+                with open(self.main_file, 'r', encoding='utf-8') as f:
+                    content = f.read()
+                
+                # 构建要删除的close指令（构建可能的close指令格式）
+                close_date_str = info.close_date.strftime('%Y-%m-%d')
+                close_directive_patterns = [
+                    f"{close_date_str} close {account_name}",
+                    f"{close_date_str} close {account_name} ",
+                    f"\n{close_date_str} close {account_name}\n",
+                    f"\n{close_date_str} close {account_name} \n"
+                ]
+                
+                # 尝试删除close指令
+                modified = False
+                for pattern in close_directive_patterns:
+                    if pattern in content:
+                        content = content.replace(pattern, "")
                         modified = True
+                        break
+                
+                if not modified:
+                    # 如果精确匹配失败，尝试使用正则表达式
+                    pattern = f"^{re.escape(close_date_str)} close {re.escape(account_name)}.*$"
+                    lines = content.split('\n')
+                    new_lines = []
+                    for line in lines:
+                        if not re.match(pattern, line.strip()):
+                            new_lines.append(line)
+                        else:
+                            modified = True
+                
+                    if modified:
+                        content = '\n'.join(new_lines)
                 
                 if modified:
-                    content = '\n'.join(new_lines)
+                    # 写回文件
+                    with open(self.main_file, 'w', encoding='utf-8') as f:
+                        f.write(content)
             
             if modified:
-                # 写回文件
-                with open(self.main_file, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                
                 # 重新加载条目
                 self.loader.load_entries(force_reload=True)
                 return True
@@ -1,6 +1,8 @@
+import copy
 import json
+import threading
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, func
 from app.core.config import settings
@@ -8,17 +10,76 @@ from app.database import get_db
 from app.models.account_order import AccountOrder
 
 
+DEFAULT_CATEGORY_ORDER = ["Assets", "Liabilities", "Income", "Expenses", "Equity"]
+
 class AccountOrderService:
     def __init__(self):
         self.data_dir = settings.data_dir
         self.order_file = self.data_dir / "account_order.json"
+        # 排序配置缓存，由 _save_* 方法失效
+        self._lock = threading.Lock()
+        self._config: Optional[Dict] = None
+        # 由配置预先计算的排名表，以及每个账户的排序键
+        self._category_ranks: Dict[str, int] = {}
+        self._subcategory_ranks: Dict[Tuple[str, str], int] = {}
+        self._account_ranks: Dict[Tuple[str, str], Dict[str, int]] = {}
+        self._sort_keys: Dict[str, Tuple] = {}
         
     def _get_db_session(self) -> Session:
         """获取数据库会话"""
         return next(get_db())
         
     def _load_order_config(self) -> Dict:
-        """从数据库加载账户排序配置"""
+        """获取账户排序配置，优先使用内存缓存"""
+        with self._lock:
+            if self._config is not None:
+                return self._config
+        
+        try:
+            config = self._read_order_config()
+        except Exception:
+            # 使用默认配置，静默处理错误（不缓存，下次重新读取）
+            return {
+                "category_order": list(DEFAULT_CATEGORY_ORDER),
+                "subcategory_order": {category: [] for category in DEFAULT_CATEGORY_ORDER},
+                "account_order": {category: {} for category in DEFAULT_CATEGORY_ORDER}
+            }
+        
+        with self._lock:
+            self._config = config
+            self._build_ranks(config)
+        return config
+    
+    def _invalidate_cache(self):
+        """排序配置发生变化后清除缓存"""
+        with self._lock:
+            self._config = None
+            self._category_ranks = {}
+            self._subcategory_ranks = {}
+            self._account_ranks = {}
+            self._sort_keys = {}
+    
+    def _build_ranks(self, config: Dict):
+        """根据配置预先计算分类、子分类和账户的排名表"""
+        self._category_ranks = {}
+        for idx, category in enumerate(config["category_order"]):
+            self._category_ranks.setdefault(category, idx)
+        
+        self._subcategory_ranks = {}
+        for category, subcategories in config["subcategory_order"].items():
+            for idx, subcategory in enumerate(subcategories):
+                self._subcategory_ranks.setdefault((category, subcategory), idx)
+        
+        self._account_ranks = {}
+        for category, subcategories in config["account_order"].items():
+            for subcategory, accounts in subcategories.items():
+                ranks = self._account_ranks.setdefault((category, subcategory), {})
+                for idx, account in enumerate(accounts):
+                    ranks.setdefault(account, idx)
+        self._sort_keys = {}
+    
+    def _read_order_config(self) -> Dict:
+        """从数据库读取账户排序配置"""
         db = self._get_db_session()
         try:
             # 获取分类排序
@@ -28,7 +89,7 @@ class AccountOrderService:
             
             category_order = [order.item_name for order in category_orders]
             if not category_order:
-                category_order = ["Assets", "Liabilities", "Income", "Expenses", "Equity"]
+                category_order = list(DEFAULT_CATEGORY_ORDER)
             
             # 获取子分类排序
             subcategory_order = {}
@@ -69,25 +130,6 @@ class AccountOrderService:
                 "subcategory_order": subcategory_order,
                 "account_order": account_order
             }
-        except Exception as e:
-            # 使用默认配置，静默处理错误
-            return {
-                "category_order": ["Assets", "Liabilities", "Income", "Expenses", "Equity"],
-                "subcategory_order": {
-                    "Assets": [],
-                    "Liabilities": [],
-                    "Income": [],
-                    "Expenses": [],
-                    "Equity": []
-                },
-                "account_order": {
-                    "Assets": {},
-                    "Liabilities": {},
-                    "Income": {},
-                    "Expenses": {},
-                    "Equity": {}
-                }
-            }
         finally:
             db.close()
     
@@ -115,6 +157,7 @@ class AccountOrderService:
             raise Exception(f"保存分类排序配置失败: {e}")
         finally:
             db.close()
+            self._invalidate_cache()
     
     def _save_subcategory_order(self, category: str, subcategory_order: List[str]):
         """保存子分类排序到数据库"""
@@ -145,6 +188,7 @@ class AccountOrderService:
             raise Exception(f"保存子分类排序配置失败: {e}")
         finally:
             db.close()
+            self._invalidate_cache()
     
     def _save_account_order(self, category: str, subcategory: str, account_order: List[str]):
         """保存账户排序到数据库"""
@@ -176,117 +220,89 @@ class AccountOrderService:
             raise Exception(f"保存账户排序配置失败: {e}")
         finally:
             db.close()
+            self._invalidate_cache()
     
     def get_order_config(self) -> Dict:
-        """获取账户排序配置"""
-        return self._load_order_config()
+        """获取账户排序配置（返回副本，调用方修改不影响缓存）"""
+        return copy.deepcopy(self._load_order_config())
     
     def update_category_order(self, category_order: List[str]) -> Dict:
         """更新账户分类排序"""
         self._save_category_order(category_order)
-        return self._load_order_config()
+        return self.get_order_config()
     
     def update_subcategory_order(self, category: str, subcategory_order: List[str]) -> Dict:
         """更新子分类排序"""
         self._save_subcategory_order(category, subcategory_order)
-        return self._load_order_config()
+        return self.get_order_config()
     
     def update_account_order(self, category: str, subcategory: str, account_order: List[str]) -> Dict:
         """更新指定子分类的账户排序"""
         self._save_account_order(category, subcategory, account_order)
-        return self._load_order_config()
+        return self.get_order_config()
     
     def sort_accounts(self, accounts: List[str]) -> List[str]:
         """根据配置对账户列表进行排序"""
-        config = self._load_order_config()
-        
-        # 按分类分组
-        categorized_accounts = {}
-        for account in accounts:
-            if ':' in account:
-                category = account.split(':')[0]
-                if category not in categorized_accounts:
-                    categorized_accounts[category] = []
-                categorized_accounts[category].append(account)
-            else:
-                # 处理顶级账户
-                if 'top_level' not in categorized_accounts:
-                    categorized_accounts['top_level'] = []
-                categorized_accounts['top_level'].append(account)
-        
-        sorted_accounts = []
-        
-        # 按配置的分类顺序排序
-        category_order = config.get("category_order", ["Assets", "Liabilities", "Equity", "Income", "Expenses"])
-        
-        for category in category_order:
-            if category in categorized_accounts:
-                category_accounts = categorized_accounts[category]
-                sorted_category_accounts = self._sort_accounts_in_category(category, category_accounts, config)
-                sorted_accounts.extend(sorted_category_accounts)
-        
-        # 添加其他未配置的分类
-        for category, category_accounts in categorized_accounts.items():
-            if category not in category_order and category != 'top_level':
-                sorted_category_accounts = self._sort_accounts_in_category(category, category_accounts, config)
-                sorted_accounts.extend(sorted_category_accounts)
-        
-        # 添加顶级账户
-        if 'top_level' in categorized_accounts:
-            sorted_accounts.extend(sorted(categorized_accounts['top_level']))
-        
-        return sorted_accounts
+        return sorted(accounts, key=self._get_sort_key_func(accounts))
     
-    def _sort_accounts_in_category(self, category: str, accounts: List[str], config: Dict) -> List[str]:
-        """对分类内的账户进行排序"""
-        subcategory_order = config.get("subcategory_order", {}).get(category, [])
-        account_order_config = config.get("account_order", {}).get(category, {})
+    def _get_sort_key_func(self, accounts: List[str]):
+        """
+        获取账户排序键函数
         
-        # 按子分类分组
-        subcategorized_accounts = {}
-        for account in accounts:
-            parts = account.split(':')
-            if len(parts) >= 2:
-                subcategory = parts[1]
-                if subcategory not in subcategorized_accounts:
-                    subcategorized_accounts[subcategory] = []
-                subcategorized_accounts[subcategory].append(account)
+        配置中的分类、子分类按配置顺序排列，未配置的保持其在输入中首次出现的顺序；
+        子分类内配置的账户按配置顺序，其余按字母顺序；顶级账户排在最后并按字母顺序。
+        与输入无关的部分按账户缓存，配置变化时随缓存一起失效。
+        """
+        self._load_order_config()
+        with self._lock:
+            static_keys = self._sort_keys
+            category_ranks = self._category_ranks
+            subcategory_ranks = self._subcategory_ranks
+            account_ranks = self._account_ranks
         
-        sorted_accounts = []
+        def static_key(account: str) -> Tuple:
+            key = static_keys.get(account)
+            if key is not None:
+                return key
+            
+            parts = account.split(':')
+            if len(parts) < 2:
+                key = (None, None, None, None, None)
+            else:
+                category, subcategory = parts[0], parts[1]
+                idx = account_ranks.get((category, subcategory), {}).get(account)
+                key = (
+                    category,
+                    category_ranks.get(category),
+                    subcategory,
+                    subcategory_ranks.get((category, subcategory)),
+                    (0, idx, '') if idx is not None else (1, 0, account)
+                )
+            static_keys[account] = key
+            return key
         
-        # 按配置的子分类顺序排序
-        for subcategory in subcategory_order:
-            if subcategory in subcategorized_accounts:
-                subcategory_accounts = subcategorized_accounts[subcategory]
-                
-                # 如果有具体的账户排序配置，使用配置的顺序
-                if subcategory in account_order_config:
-                    ordered_accounts = account_order_config[subcategory]
-                    # 先添加配置中的账户（按配置顺序）
-                    for account in ordered_accounts:
-                        if account in subcategory_accounts:
-                            sorted_accounts.append(account)
-                    # 再添加未配置的账户（按字母顺序）
-                    remaining_accounts = [acc for acc in subcategory_accounts if acc not in ordered_accounts]
-                    sorted_accounts.extend(sorted(remaining_accounts))
-                else:
-                    # 没有具体配置，按字母顺序排序
-                    sorted_accounts.extend(sorted(subcategory_accounts))
+        # 未配置的分类和子分类按首次出现的位置排序
+        first_seen: Dict = {}
+        for account in accounts:
+            category, _, subcategory, _, _ = static_key(account)
+            if category is not None:
+                first_seen.setdefault(category, len(first_seen))
+                first_seen.setdefault((category, subcategory), len(first_seen))
         
-        # 添加其他未配置的子分类
-        for subcategory, subcategory_accounts in subcategorized_accounts.items():
-            if subcategory not in subcategory_order:
-                if subcategory in account_order_config:
-                    ordered_accounts = account_order_config[subcategory]
-                    for account in ordered_accounts:
-                        if account in subcategory_accounts:
-                            sorted_accounts.append(account)
-                    remaining_accounts = [acc for acc in subcategory_accounts if acc not in ordered_accounts]
-                    sorted_accounts.extend(sorted(remaining_accounts))
-                else:
-                    sorted_accounts.extend(sorted(subcategory_accounts))
+        def sort_key(account: str) -> Tuple:
+            category, category_rank, subcategory, subcategory_rank, account_part = static_key(account)
+            if category is None:
+                # 顶级账户排在最后，按字母顺序
+                return (1, (0, 0), (0, 0), (1, 0, account))
+            return (
+                0,
+                (0, category_rank) if category_rank is not None else (1, first_seen[category]),
+                (0, subcategory_rank) if subcategory_rank is not None
+                else (1, first_seen[(category, subcategory)]),
+                account_part
+            )
         
-        return sorted_accounts
+        return sort_key
     
     def get_subcategories(self, category: str, accounts: List[str]) -> List[str]:
         """获取指定分类下的所有子分类"""
@@ -320,7 +336,7 @@ class AccountOrderService:
     def get_accounts_by_category(self, category: str, accounts: List[str]) -> List[str]:
         """获取指定分类下的所有账户"""
         category_accounts = [acc for acc in accounts if acc.startswith(f"{category}:")]
-        return self._sort_accounts_in_category(category, category_accounts, self._load_order_config())
+        return self.sort_accounts(category_accounts)
     
     def get_accounts_in_subcategory(self, category: str, subcategory: str, accounts: List[str]) -> List[str]:
         """获取指定子分类下的所有账户"""
@@ -329,21 +345,7 @@ class AccountOrderService:
             if acc.startswith(f"{category}:{subcategory}:")
         ]
         
-        config = self._load_order_config()
-        account_order_config = config.get("account_order", {}).get(category, {}).get(subcategory, [])
-        
-        if account_order_config:
-            sorted_accounts = []
-            # 先添加配置中的账户（按配置顺序）
-            for account in account_order_config:
-                if account in subcategory_accounts:
-                    sorted_accounts.append(account)
-            # 再添加未配置的账户（按字母顺序）
-            remaining_accounts = [acc for acc in subcategory_accounts if acc not in account_order_config]
-            sorted_accounts.extend(sorted(remaining_accounts))
-            return sorted_accounts
-        else:
-            return sorted(subcategory_accounts)
+        return self.sort_accounts(subcategory_accounts)
 
     def migrate_from_json(self) -> bool:
         """从JSON文件迁移数据到数据库"""
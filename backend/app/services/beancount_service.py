@@ -2,17 +2,19 @@
 重构后的 Beancount 服务
 作为统一的服务接口，协调各个专门的服务模块
 """
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional, Tuple
 from datetime import date
 
+from app.core.cache import cached, cache_manager
 from app.core.config import settings
 from app.models.schemas import (
     TransactionResponse, BalanceResponse, IncomeStatement, 
-    TransactionFilter
+    TransactionFilter, AccountTreeResponse, AccountRegisterResponse,
+    NetWorthSeriesResponse
 )
 from .ledger_loader import LedgerLoader
 from .ledger_query import LedgerQuery
-from .report_generator import ReportGenerator
+from .report_generator import ReportGenerator, PostingAggregates
 from .exchange_service import ExchangeService
 from .transaction_validator import TransactionValidator
 from .transaction_repository import TransactionRepository
@@ -54,6 +56,7 @@ class BeancountService:
     # 交易查询相关方法 - 委托给 LedgerQuery
     # =============================================================================
     
+    @cached("transactions", ignore_self=True)
     def get_transactions(self, filter_params: Optional[TransactionFilter] = None) -> List[TransactionResponse]:
         """获取交易列表"""
         return self.query.get_transactions(filter_params)
@@ -74,6 +77,16 @@ class BeancountService:
         """获取活跃账户列表（排除已归档的账户）"""
         return self.query.get_active_accounts()
     
+    def get_account_stats(self, account: str) -> Optional[Dict[str, Any]]:
+        """获取账户的生命周期信息和记账行统计"""
+        return self.query.get_account_stats(account)
+    
+    def get_account_register(self, account: str, page: int = 1, page_size: int = 50,
+                             start_date: Optional[date] = None, end_date: Optional[date] = None,
+                             reverse: bool = True) -> Optional[AccountRegisterResponse]:
+        """获取账户明细（分页，含累计余额）"""
+        return self.query.get_account_register(account, page, page_size, start_date, end_date, reverse)
+    
     def get_all_payees(self) -> List[str]:
         """获取所有收付方列表"""
         return self.query.get_all_payees()
@@ -84,12 +97,42 @@ class BeancountService:
     
     def get_balance_sheet(self, date_filter: Optional[date] = None) -> BalanceResponse:
         """获取资产负债表"""
+        # 先确定截止日期，避免"今天"的结果跨日后仍被命中
+        return self._get_balance_sheet(date_filter or settings.now().date())
+    
+    @cached("balance_sheet", ignore_self=True)
+    def _get_balance_sheet(self, date_filter: date) -> BalanceResponse:
         return self.report_generator.get_balance_sheet(date_filter)
     
+    @cached("account_tree", ignore_self=True)
+    def get_account_tree(self, date_filter: date, include_archived: bool = False) -> AccountTreeResponse:
+        """获取截止日的账户余额树（各节点包含子账户汇总）"""
+        return self.report_generator.get_account_tree(date_filter, include_archived)
+    
+    @cached("net_worth_series", ignore_self=True)
+    def get_net_worth_series(self, start_date: date, end_date: date, interval: str,
+                             account: Optional[str] = None) -> NetWorthSeriesResponse:
+        """获取净资产时间序列（一次遍历账本计算所有采样点）"""
+        return self.report_generator.get_net_worth_series(start_date, end_date, interval, account)
+    
+    @cached("income_statement", ignore_self=True)
     def get_income_statement(self, start_date: date, end_date: date) -> IncomeStatement:
         """获取损益表"""
         return self.report_generator.get_income_statement(start_date, end_date)
     
+    def build_report_aggregates(self, income_periods: List[Tuple[date, date]], balance_dates: List[date]) -> PostingAggregates:
+        """一次遍历账本，生成批量报表共享的分桶发生额"""
+        return self.report_generator.build_aggregates(income_periods, balance_dates)
+    
+    def get_balance_sheet_from_aggregates(self, aggregates: PostingAggregates, date_filter: date) -> BalanceResponse:
+        """基于共享发生额获取资产负债表"""
+        return self.report_generator.get_balance_sheet_from_aggregates(aggregates, date_filter)
+    
+    def get_income_statement_from_aggregates(self, aggregates: PostingAggregates,
+                                             start_date: date, end_date: date) -> IncomeStatement:
+        """基于共享发生额获取损益表"""
+        return self.report_generator.get_income_statement_from_aggregates(aggregates, start_date, end_date)
+    
     # =============================================================================
     # 交易验证相关方法 - 委托给 TransactionValidator
     # =============================================================================
@@ -102,9 +145,15 @@ class BeancountService:
     # 交易CRUD相关方法 - 委托给 TransactionRepository
     # =============================================================================
     
-    def add_transaction(self, transaction_data: Dict) -> bool:
+    def add_transaction(self, transaction_data: Dict, transaction_str: Optional[str] = None) -> bool:
         """添加新交易到账本文件"""
-        return self.transaction_repo.add_transaction(transaction_data)
+        return self.transaction_repo.add_transaction(transaction_data, transaction_str)
+    
+    def add_transactions_batch(self, transactions: List[Dict]) -> List[Optional[str]]:
+        """批量添加交易（一次校验、一次写入、一次重新加载），返回每条交易的错误信息"""
+        return self.transaction_repo.add_transactions_batch(
+            [(transaction_data, None) for transaction_data in transactions], self.validator
+        )
     
     def update_transaction_by_location(self, filename: str, lineno: int, transaction_data: Dict) -> bool:
         """根据文件名和行号更新交易"""
@@ -135,3 +184,6 @@ class BeancountService:
 
 # 创建全局服务实例
 beancount_service = BeancountService()
+
+# 缓存键跟随账本内容哈希，账本变化后旧结果不再命中，内容未变时重启后仍可命中
+cache_manager.set_version_provider(beancount_service.loader.get_content_hash)
@@ -9,6 +9,8 @@ from typing import List, Dict, Any
 from beancount.core import data, realization
 import re
 
+from app.core.cache import cached
+
 
 class BQLService:
     """简化的查询服务，兼容 Beancount 3.0"""
@@ -16,6 +18,7 @@ class BQLService:
     def __init__(self, loader):
         self.loader = loader
     
+    @cached("bql", ignore_self=True)
     def execute_query(self, query_str: str) -> Dict[str, Any]:
         """
         执行简化的查询（支持预定义的查询模式）
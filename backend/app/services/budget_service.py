@@ -1,14 +1,19 @@
 """
 预算管理服务
 """
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from datetime import date, datetime, timedelta
 from decimal import Decimal
 from sqlalchemy.orm import Session
 from calendar import monthrange
+from bisect import bisect_right
 
+from app.core.cache import cached
 from app.models.budget import Budget
-from app.models.schemas import BudgetCreate, BudgetUpdate, BudgetResponse, BudgetProgress, BudgetSummary
+from app.models.schemas import (
+    BudgetCreate, BudgetUpdate, BudgetResponse, BudgetProgress, BudgetSummary,
+    BudgetHistory, BudgetHistoryCategory, BudgetHistoryPoint
+)
 from app.services.beancount_service import beancount_service
 from beancount.core.data import Transaction
 
@@ -89,6 +94,16 @@ class BudgetService:
         if not budget:
             return None
         
+        # 预算记录（含更新时间）即该预算的修订版本，与当天日期一起参与缓存键
+        return self._build_budget_progress(self._to_response(budget), date.today())
+    
+    @cached("budget_progress", ignore_self=True)
+    def _build_budget_progress(self, budget: BudgetResponse, today: date) -> BudgetProgress:
+        """计算单个预算的执行进度"""
+        return self._to_progress(budget)
+    
+    def _to_progress(self, budget: BudgetResponse) -> BudgetProgress:
+        """根据实际支出生成预算进度"""
         # 获取实际支出（包含货币参数）
         spent = self._calculate_spent(budget.category, budget.period_type, budget.period_value, budget.currency)
         
@@ -101,7 +116,7 @@ class BudgetService:
         days_remaining = self._calculate_days_remaining(budget.period_type, budget.period_value)
         
         return BudgetProgress(
-            budget=self._to_response(budget),
+            budget=budget,
             spent=spent,
             remaining=remaining,
             percentage=round(percentage, 2),
@@ -135,29 +150,23 @@ class BudgetService:
                 currency="CNY"
             )
         
-        # 计算每个预算的进度
+        # 预算记录（含更新时间）和当天日期都参与缓存键，修改预算或跨日后重新计算
+        return self._build_budget_summary([self._to_response(b) for b in budgets], date.today())
+    
+    @cached("budget_summary", ignore_self=True)
+    def _build_budget_summary(self, budgets: List[BudgetResponse], today: date) -> BudgetSummary:
+        """计算预算汇总"""
+        # 计算每个预算的进度（同一周期的支出只遍历一次账本）
         budget_progresses = []
         total_budget = Decimal(0)
         total_spent = Decimal(0)
         
         for budget in budgets:
-            spent = self._calculate_spent(budget.category, budget.period_type, budget.period_value, budget.currency)
-            remaining = Decimal(budget.amount) - spent
-            percentage = float((spent / Decimal(budget.amount)) * 100) if budget.amount > 0 else 0
-            is_exceeded = spent > Decimal(budget.amount)
-            days_remaining = self._calculate_days_remaining(budget.period_type, budget.period_value)
-            
-            budget_progresses.append(BudgetProgress(
-                budget=self._to_response(budget),
-                spent=spent,
-                remaining=remaining,
-                percentage=round(percentage, 2),
-                is_exceeded=is_exceeded,
-                days_remaining=days_remaining
-            ))
+            progress = self._to_progress(budget)
+            budget_progresses.append(progress)
             
             total_budget += Decimal(budget.amount)
-            total_spent += spent
+            total_spent += progress.spent
         
         total_remaining = total_budget - total_spent
         overall_percentage = float((total_spent / total_budget) * 100) if total_budget > 0 else 0
@@ -171,6 +180,121 @@ class BudgetService:
             currency=budgets[0].currency if budgets else "CNY"
         )
     
+    def get_budget_history(
+        self,
+        period_type: str = "month",
+        periods: int = 12,
+        end_period: Optional[str] = None
+    ) -> BudgetHistory:
+        """获取截至 end_period 的最近若干周期内所有预算的执行情况和预测"""
+        if not end_period:
+            end_period = self._get_current_period(period_type)
+        period_values = [self._shift_period(period_type, end_period, offset) for offset in range(1 - periods, 1)]
+        
+        budgets = self.db.query(Budget).filter(
+            Budget.period_type == period_type,
+            Budget.period_value.in_(period_values)
+        ).order_by(Budget.category, Budget.id).all()
+        
+        # 预算记录和当天日期参与缓存键
+        return self._build_budget_history(
+            period_type, period_values, [self._to_response(b) for b in budgets], date.today()
+        )
+    
+    @cached("budget_history", ignore_self=True)
+    def _build_budget_history(self, period_type: str, period_values: List[str],
+                              budgets: List[BudgetResponse], today: date) -> BudgetHistory:
+        """基于类别 × 周期的支出矩阵计算预算历史"""
+        period_ranges = [self._parse_period(period_type, value) for value in period_values]
+        spend_matrix = self._get_spending_matrix(period_ranges)
+        
+        # 同一类别、周期、币种的多个预算金额合并
+        budget_amounts: Dict[Tuple[str, str], Dict[str, Decimal]] = {}
+        for budget in budgets:
+            amounts = budget_amounts.setdefault((budget.category, budget.currency), {})
+            amounts[budget.period_value] = amounts.get(budget.period_value, Decimal(0)) + Decimal(budget.amount)
+        
+        categories = []
+        for (category, currency), amounts in budget_amounts.items():
+            points = []
+            for period_value, (start_date, end_date), spending in zip(period_values, period_ranges, spend_matrix):
+                spent = spending.get((category, currency), Decimal(0))
+                budget_amount = amounts.get(period_value)
+                days_remaining = self._calculate_days_remaining(period_type, period_value)
+                projected_spent = self._project_spent(spent, start_date, end_date, days_remaining)
+                
+                point = BudgetHistoryPoint(
+                    period_value=period_value,
+                    start_date=start_date,
+                    end_date=end_date,
+                    budget_amount=budget_amount,
+                    spent=spent,
+                    days_remaining=days_remaining,
+                    projected_spent=projected_spent
+                )
+                if budget_amount is not None:
+                    point.remaining = budget_amount - spent
+                    point.percentage = round(float((spent / budget_amount) * 100), 2) if budget_amount > 0 else 0
+                    point.is_exceeded = spent > budget_amount
+                    point.projected_exceeded = projected_spent is not None and projected_spent > budget_amount
+                points.append(point)
+            
+            categories.append(BudgetHistoryCategory(category=category, currency=currency, points=points))
+        
+        return BudgetHistory(period_type=period_type, periods=period_values, categories=categories)
+    
+    def _get_spending_matrix(self, period_ranges: List[Tuple[date, date]]) -> List[Dict[Tuple[str, str], Decimal]]:
+        """
+        一次遍历账本得到每个周期各账户的支出合计（含子账户汇总）
+        
+        结果同时写入按周期缓存的支出数据，供预算汇总和进度复用。
+        """
+        loader = beancount_service.loader
+        account_index = loader.get_account_index()
+        starts = [start_date for start_date, _ in period_ranges]
+        
+        def scan() -> List[Dict[Tuple[str, str], Decimal]]:
+            entries, _, _ = loader.load_entries()
+            raw: List[Dict[Tuple[str, str], Decimal]] = [{} for _ in period_ranges]
+            for entry in entries:
+                if not isinstance(entry, Transaction):
+                    continue
+                
+                # 定位交易所在的周期
+                index = bisect_right(starts, entry.date) - 1
+                if index < 0 or entry.date > period_ranges[index][1]:
+                    continue
+                
+                spending = raw[index]
+                for posting in entry.postings:
+                    # 只统计支出账户（Expenses开头）且金额为正的记录，负值是退款
+                    if posting.units and posting.account.startswith("Expenses:") and posting.units.number > 0:
+                        key = (posting.account, posting.units.currency)
+                        spending[key] = spending.get(key, Decimal(0)) + posting.units.number
+            return [account_index.rollup(spending) for spending in raw]
+        
+        matrix = loader.get_derived(('budget_spending_matrix', tuple(period_ranges)), scan)
+        for (start_date, end_date), spending in zip(period_ranges, matrix):
+            loader.get_derived(('budget_spending', start_date, end_date), lambda spending=spending: spending)
+        return matrix
+    
+    @staticmethod
+    def _project_spent(spent: Decimal, start_date: date, end_date: date,
+                       days_remaining: Optional[int]) -> Optional[Decimal]:
+        """按已过天数的平均支出速度预测周期末支出"""
+        if days_remaining is None:
+            return None
+        if days_remaining == 0:
+            # 周期已结束，实际支出即最终支出
+            return spent
+        
+        total_days = (end_date - start_date).days + 1
+        elapsed_days = total_days - days_remaining
+        if elapsed_days <= 0:
+            # 周期尚未开始，无法预测
+            return None
+        return (spent / elapsed_days * total_days).quantize(Decimal('0.01'))
+    
     def _calculate_spent(self, category: str, period_type: str, period_value: str, currency: str = "CNY") -> Decimal:
         """计算实际支出金额
         
@@ -182,15 +306,33 @@ class BudgetService:
         """
         # 解析周期
         start_date, end_date = self._parse_period(period_type, period_value)
+        spending = self._get_period_spending(start_date, end_date)
+        
+        # 汇总结果中的类别金额已包含其所有子账户
+        return spending.get((category, currency), Decimal(0))
+    
+    def _get_period_spending(self, start_date: date, end_date: date) -> Dict[Tuple[str, str], Decimal]:
+        """
+        获取周期内各账户、各币种的支出合计（含子账户汇总）
         
+        每个账本快照每个周期只遍历一次账本，再按账户层级自底向上汇总一次。
+        """
+        loader = beancount_service.loader
+        return loader.get_derived(
+            ('budget_spending', start_date, end_date),
+            lambda: loader.get_account_index().rollup(self._scan_spending(start_date, end_date))
+        )
+    
+    @staticmethod
+    def _scan_spending(start_date: date, end_date: date) -> Dict[Tuple[str, str], Decimal]:
         # 从 beancount 获取交易数据
         entries, _, _ = beancount_service.loader.load_entries()
         
-        spent = Decimal(0)
+        spending: Dict[Tuple[str, str], Decimal] = {}
         for entry in entries:
             if not isinstance(entry, Transaction):
                 continue
-                
+            
             # 检查日期是否在周期内
             if entry.date < start_date or entry.date > end_date:
                 continue
@@ -200,25 +342,12 @@ class BudgetService:
                 if not posting.units:
                     continue
                 
-                # 账户匹配：完全匹配或者是子账户
-                account_matches = (posting.account == category or 
-                                 posting.account.startswith(category + ":"))
-                
-                if not account_matches:
-                    continue
-                
-                # 检查货币类型
-                if posting.units.currency != currency:
-                    continue
-                
-                # 只统计支出账户（Expenses开头）且金额为正的记录
-                if posting.account.startswith("Expenses:"):
-                    amount = Decimal(str(posting.units.number))
-                    # 只累加正值（支出），负值是退款
-                    if amount > 0:
-                        spent += amount
-        
-        return spent
+                # 只统计支出账户（Expenses开头）且金额为正的记录，负值是退款
+                if posting.account.startswith("Expenses:") and posting.units.number > 0:
+                    key = (posting.account, posting.units.currency)
+                    spending[key] = spending.get(key, Decimal(0)) + posting.units.number
+        
+        return spending
     
     def _parse_period(self, period_type: str, period_value: str) -> tuple:
         """解析周期为开始和结束日期"""
@@ -247,6 +376,22 @@ class BudgetService:
         
         return start_date, end_date
     
+    def _shift_period(self, period_type: str, period_value: str, offset: int) -> str:
+        """将周期值前后移动 offset 个周期"""
+        if period_type == "month":
+            year, month = map(int, period_value.split('-'))
+            index = year * 12 + month - 1 + offset
+            return f"{index // 12}-{index % 12 + 1:02d}"
+        elif period_type == "quarter":
+            year = int(period_value.split('-')[0])
+            quarter = int(period_value.split('-Q')[1])
+            index = year * 4 + quarter - 1 + offset
+            return f"{index // 4}-Q{index % 4 + 1}"
+        elif period_type == "year":
+            return str(int(period_value) + offset)
+        else:
+            raise ValueError(f"不支持的周期类型: {period_type}")
+    
     def _calculate_days_remaining(self, period_type: str, period_value: str) -> Optional[int]:
         """计算周期剩余天数"""
         try:
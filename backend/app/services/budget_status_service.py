@@ -0,0 +1,222 @@
+"""
+预算状态服务
+维护当前周期预算执行情况的物化表，交易写入后增量更新，并向订阅者推送变化
+"""
+import asyncio
+import threading
+from datetime import date
+from decimal import Decimal
+from typing import List, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.logging_config import get_logger
+from app.database import SessionLocal
+from app.models.budget import Budget, BudgetStatus
+from app.models.schemas import BudgetStatusItem, BudgetStatusResponse
+from app.services.beancount_service import beancount_service
+from app.services.budget_service import BudgetService
+from app.services.transaction_repository import TransactionChange
+
+logger = get_logger(__name__)
+
+PERIOD_TYPES = ("month", "quarter", "year")
+
+
+class BudgetStatusService:
+    """
+    预算状态服务
+
+    物化表中的每一行对应一个当前周期的预算，记录计算时的账本内容哈希和预算更新时间。
+    读取时如发现账本、预算或当前周期发生变化则全量重建；通过 TransactionRepository
+    写入交易时只把涉及的支出记账行增量累加到对应预算上。
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._subscribers: List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = []
+
+    def get_status(self, db: Session) -> BudgetStatusResponse:
+        """获取当前周期预算状态，必要时重建物化表"""
+        with self._lock:
+            rows, _ = self._ensure_fresh(db)
+            return self._to_response(rows)
+
+    def refresh(self, db: Session):
+        """预算增删改后调用，状态有变化时推送给订阅者"""
+        with self._lock:
+            rows, rebuilt = self._ensure_fresh(db)
+            response = self._to_response(rows)
+        if rebuilt:
+            self._publish(response)
+
+    def on_transactions_changed(self, change: TransactionChange):
+        """交易写入后增量更新预算状态"""
+        db = SessionLocal()
+        try:
+            with self._lock:
+                rows = db.query(BudgetStatus).all()
+                if not rows:
+                    # 尚未物化，等首次读取时再计算
+                    return
+
+                if (not change.complete or change.previous_hash is None
+                        or any(row.ledger_hash != change.previous_hash for row in rows)):
+                    # 变动不完整或状态已过期，全量重建
+                    rows, changed = self._ensure_fresh(db)
+                else:
+                    changed = self._apply_deltas(db, rows, change)
+                response = self._to_response(rows)
+
+            if changed:
+                self._publish(response)
+        finally:
+            db.close()
+
+    def subscribe(self) -> asyncio.Queue:
+        """订阅预算状态变化，需在事件循环中调用"""
+        queue: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers.append((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        """取消订阅"""
+        with self._lock:
+            self._subscribers = [(loop, q) for loop, q in self._subscribers if q is not queue]
+
+    def _ensure_fresh(self, db: Session) -> Tuple[List[BudgetStatus], bool]:
+        budgets = self._get_active_budgets(db)
+        rows = db.query(BudgetStatus).all()
+        current_hash = beancount_service.loader.get_content_hash()
+
+        if not self._is_stale(budgets, rows, current_hash):
+            return rows, False
+        return self._rebuild(db, budgets, current_hash), True
+
+    @staticmethod
+    def _get_active_budgets(db: Session) -> List[Budget]:
+        """获取各周期类型当前周期内的预算"""
+        service = BudgetService(db)
+        budgets = []
+        for period_type in PERIOD_TYPES:
+            budgets.extend(db.query(Budget).filter(
+                Budget.period_type == period_type,
+                Budget.period_value == service._get_current_period(period_type)
+            ).all())
+        return budgets
+
+    @staticmethod
+    def _is_stale(budgets: List[Budget], rows: List[BudgetStatus], current_hash: str) -> bool:
+        rows_by_id = {row.budget_id: row for row in rows}
+        if set(rows_by_id) != {budget.id for budget in budgets}:
+            return True
+
+        for budget in budgets:
+            row = rows_by_id[budget.id]
+            if row.ledger_hash != current_hash or row.budget_updated_at != budget.updated_at:
+                return True
+        return False
+
+    def _rebuild(self, db: Session, budgets: List[Budget], current_hash: str) -> List[BudgetStatus]:
+        service = BudgetService(db)
+        db.query(BudgetStatus).delete()
+
+        rows = []
+        for budget in budgets:
+            progress = service._to_progress(service._to_response(budget))
+            start_date, end_date = service._parse_period(budget.period_type, budget.period_value)
+            row = BudgetStatus(
+                budget_id=budget.id,
+                category=budget.category,
+                period_type=budget.period_type,
+                period_value=budget.period_value,
+                start_date=start_date,
+                end_date=end_date,
+                amount=budget.amount,
+                currency=budget.currency,
+                spent=progress.spent,
+                is_exceeded=progress.is_exceeded,
+                budget_updated_at=budget.updated_at,
+                ledger_hash=current_hash
+            )
+            db.add(row)
+            rows.append(row)
+
+        db.commit()
+        logger.info(f"预算状态已重建，共 {len(rows)} 个预算")
+        return rows
+
+    @staticmethod
+    def _apply_deltas(db: Session, rows: List[BudgetStatus], change: TransactionChange) -> bool:
+        """把支出记账行的变动累加到对应预算，返回是否有预算发生变化"""
+        # 与预算统计口径一致：只统计支出账户的正值记账行
+        deltas = [(d, account, currency, -number) for d, account, currency, number in change.removed
+                  if account.startswith("Expenses:") and number > 0]
+        deltas += [(d, account, currency, number) for d, account, currency, number in change.added
+                   if account.startswith("Expenses:") and number > 0]
+
+        changed = False
+        for row in rows:
+            delta = Decimal(0)
+            for posting_date, account, currency, number in deltas:
+                if (currency == row.currency and row.start_date <= posting_date <= row.end_date
+                        and (account == row.category or account.startswith(row.category + ":"))):
+                    delta += number
+
+            if delta:
+                row.spent = Decimal(row.spent) + delta
+                row.is_exceeded = Decimal(row.spent) > Decimal(row.amount)
+                changed = True
+            row.ledger_hash = change.current_hash
+
+        db.commit()
+        return changed
+
+    @staticmethod
+    def _to_response(rows: List[BudgetStatus]) -> BudgetStatusResponse:
+        today = date.today()
+        items = []
+        for row in sorted(rows, key=lambda r: (r.period_type, r.category, r.budget_id)):
+            amount = Decimal(row.amount)
+            spent = Decimal(row.spent)
+            items.append(BudgetStatusItem(
+                budget_id=row.budget_id,
+                category=row.category,
+                period_type=row.period_type,
+                period_value=row.period_value,
+                amount=amount,
+                currency=row.currency,
+                spent=spent,
+                remaining=amount - spent,
+                percentage=round(float((spent / amount) * 100), 2) if amount > 0 else 0,
+                is_exceeded=row.is_exceeded,
+                days_remaining=(row.end_date - today).days + 1 if today <= row.end_date else 0
+            ))
+
+        refreshed = [row.refreshed_at for row in rows if row.refreshed_at]
+        return BudgetStatusResponse(
+            items=items,
+            exceeded_count=sum(1 for item in items if item.is_exceeded),
+            ledger_hash=rows[0].ledger_hash if rows else None,
+            refreshed_at=max(refreshed) if refreshed else None
+        )
+
+    def _publish(self, response: BudgetStatusResponse):
+        payload = response.model_dump_json()
+        with self._lock:
+            subscribers = list(self._subscribers)
+
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, payload)
+            except RuntimeError:
+                # 事件循环已关闭
+                self.unsubscribe(queue)
+
+
+# 全局预算状态服务实例
+budget_status_service = BudgetStatusService()
+
+# 交易写入后增量更新预算状态
+beancount_service.transaction_repo.add_change_listener(budget_status_service.on_transactions_changed)
@@ -0,0 +1,174 @@
+"""
+本地 git 同步后端
+在数据目录中维护一个裸仓库，用 dulwich 以 pack 的形式与远端仓库交换对象
+"""
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from dulwich.client import get_transport_and_path
+from dulwich.object_store import MissingObjectFinder, commit_tree_changes
+from dulwich.objects import Blob, Commit
+from dulwich.pack import pack_objects_to_data
+from dulwich.repo import Repo
+
+from app.core.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# 本地裸仓库目录（位于数据目录下）
+GIT_DIR_NAME = ".sync-git"
+
+FILE_MODE = 0o100644
+AUTHOR = b"Beancount Web <beancount-web@localhost>"
+
+
+class GitSyncBackend:
+    """
+    本地 git 同步后端
+
+    推送时先拉取远端分支（一次往返），在远端最新树上应用本地变更并提交，
+    再把新对象打成带增量压缩的 pack 一次推送；恢复时拉取后直接从本地对象库读取文件。
+    """
+
+    def __init__(self, data_dir: Path, remote_url: str, branch: str,
+                 username: Optional[str] = None, password: Optional[str] = None):
+        self.data_dir = data_dir
+        self.remote_url = remote_url
+        self.branch_ref = f"refs/heads/{branch}".encode()
+        self.username = username
+        self.password = password
+
+        git_dir = data_dir / GIT_DIR_NAME
+        if (git_dir / "objects").exists():
+            self.repo = Repo(str(git_dir))
+        else:
+            self.repo = Repo.init_bare(str(git_dir), mkdir=True)
+
+    def _client(self):
+        return get_transport_and_path(self.remote_url, username=self.username, password=self.password)
+
+    def ls_remote(self) -> Dict[bytes, bytes]:
+        """获取远端引用，用于测试连接"""
+        client, path = self._client()
+        return dict(client.get_refs(path).refs)
+
+    def fetch(self) -> Optional[bytes]:
+        """拉取远端分支的对象，返回远端分支的提交 ID（分支不存在时为 None）"""
+        client, path = self._client()
+        branch_ref = self.branch_ref
+        object_store = self.repo.object_store
+
+        def determine_wants(refs, depth=None):
+            sha = refs.get(branch_ref)
+            return [sha] if sha and sha not in object_store else []
+
+        result = client.fetch(path, self.repo, determine_wants=determine_wants)
+        remote_head = result.refs.get(branch_ref)
+        if remote_head:
+            self.repo.refs[b"refs/remotes/origin/" + branch_ref[len(b"refs/heads/"):]] = remote_head
+        return remote_head
+
+    def push_files(self, changes: List[Tuple[str, Optional[bytes]]], message: str) -> Dict[str, str]:
+        """
+        在远端分支最新的树上应用变更并推送
+
+        Args:
+            changes: (相对路径, 文件内容) 列表，内容为 None 表示删除
+            message: 提交信息
+
+        Returns:
+            Dict[str, str]: 各文件写入的 blob SHA
+        """
+        remote_head = self.fetch()
+        object_store = self.repo.object_store
+
+        blob_shas = {}
+        tree_changes = []
+        for rel_path, content in changes:
+            path = Path(rel_path).as_posix().encode()
+            if content is None:
+                tree_changes.append((path, None, None))
+                continue
+            blob = Blob.from_string(content)
+            object_store.add_object(blob)
+            blob_shas[rel_path] = blob.id.decode()
+            tree_changes.append((path, FILE_MODE, blob.id))
+
+        base_tree = self.repo[remote_head].tree if remote_head else None
+        if base_tree is None:
+            # 空仓库：从空树开始，删除不存在的文件没有意义
+            tree_changes = [change for change in tree_changes if change[2] is not None]
+        tree_id = commit_tree_changes(object_store, base_tree or self._empty_tree(), tree_changes)
+        if tree_id == base_tree:
+            logger.info("远端内容已是最新，无需提交")
+            return blob_shas
+
+        commit = Commit()
+        commit.tree = tree_id
+        commit.parents = [remote_head] if remote_head else []
+        commit.author = commit.committer = AUTHOR
+        commit.author_time = commit.commit_time = int(time.time())
+        commit.author_timezone = commit.commit_timezone = -time.timezone
+        commit.encoding = b"UTF-8"
+        commit.message = message.encode("utf-8")
+        object_store.add_object(commit)
+
+        client, path = self._client()
+        branch_ref = self.branch_ref
+
+        def update_refs(refs):
+            refs = dict(refs)
+            refs[branch_ref] = commit.id
+            return refs
+
+        result = client.send_pack(path, update_refs, generate_pack_data=self._generate_pack_data)
+        error = (result.ref_status or {}).get(branch_ref)
+        if error:
+            raise Exception(f"推送被远端拒绝: {error}")
+
+        self.repo.refs[branch_ref] = commit.id
+        logger.info(f"已推送提交 {commit.id.decode()[:8]}，包含 {len(changes)} 个文件变更")
+        return blob_shas
+
+    def list_files(self, commit_hash: Optional[str] = None) -> List[Tuple[str, str, int]]:
+        """
+        拉取远端分支并列出指定提交（默认远端最新提交）中的所有文件
+
+        Returns:
+            List[Tuple[str, str, int]]: (相对路径, blob SHA, 大小)
+        """
+        remote_head = self.fetch()
+        commit_id = commit_hash.encode() if commit_hash else remote_head
+        if not commit_id:
+            return []
+
+        object_store = self.repo.object_store
+        files = []
+        for entry in object_store.iter_tree_contents(self.repo[commit_id].tree):
+            if entry.mode & 0o170000 != 0o100000:
+                continue
+            _, raw = object_store.get_raw(entry.sha)
+            files.append((entry.path.decode("utf-8"), entry.sha.decode(), len(raw)))
+        return files
+
+    def read_blob(self, sha: str) -> bytes:
+        """从本地对象库读取 blob 内容"""
+        return self.repo.object_store[sha.encode()].as_raw_string()
+
+    def _empty_tree(self) -> bytes:
+        from dulwich.objects import Tree
+        tree = Tree()
+        self.repo.object_store.add_object(tree)
+        return tree.id
+
+    def _generate_pack_data(self, have, want, *, shallow=None, progress=None, ofs_delta=True):
+        """生成待推送的 pack 数据，对对象做增量压缩"""
+        object_store = self.repo.object_store
+        missing = MissingObjectFinder(object_store, haves=have, wants=want, shallow=shallow, progress=progress)
+        return pack_objects_to_data(
+            [(object_store[oid], path) for oid, path in missing],
+            deltify=True,
+            ofs_delta=ofs_delta,
+            progress=progress,
+        )
@@ -4,12 +4,13 @@ import hashlib
 import base64
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple, Any
+from typing import List, Dict, NamedTuple, Optional, Set, Tuple, Any
 import asyncio
+import time
 import aiofiles
 from cryptography.fernet import Fernet
 
-from github import Github, GithubException
+from github import Github, GithubException, InputGitTreeElement
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
@@ -18,8 +19,16 @@ from app.models.sync_schemas import (
     SyncOperation, SyncStatusResponse, SyncHistoryItem, ConflictFile
 )
 from app.models.setting import Setting
-from app.models.sync import SyncLog
+from app.models.sync import SyncLog, SyncFileManifest
 from app.models.github_sync import GitHubSync
+from app.utils.write_lock import ledger_write_lock
+
+
+class RemoteFile(NamedTuple):
+    """远端文件：相对路径、blob SHA 和大小"""
+    path: str
+    sha: str
+    size: int
 
 
 class GitHubSyncService:
@@ -79,6 +88,8 @@ class GitHubSyncService:
                 "include_files": sync_config_db.include_files,
                 "exclude_files": sync_config_db.exclude_files,
                 "conflict_resolution": sync_config_db.conflict_resolution,
+                "backend": sync_config_db.backend or "rest",
+                "remote_url": sync_config_db.remote_url,
             }
             
             self._config = GitHubSyncConfig(**config_data)
@@ -110,7 +121,20 @@ class GitHubSyncService:
     def _init_github_client(self):
         """初始化GitHub客户端"""
         if self._config and self._config.token:
-            self._github_client = Github(self._config.token)
+            self._github_client = Github(self._config.token, base_url=settings.github_api_url)
+    
+    def _use_git_backend(self) -> bool:
+        return bool(self._config) and self._config.backend == "git"
+    
+    def _get_git_backend(self):
+        """创建本地 git 同步后端"""
+        from app.services.git_sync_backend import GitSyncBackend
+        
+        remote_url = self._config.remote_url or f"https://github.com/{self._config.repository}.git"
+        username = password = None
+        if remote_url.startswith(("http://", "https://")) and self._config.token:
+            username, password = "x-access-token", self._config.token
+        return GitSyncBackend(self.data_dir, remote_url, self._config.branch, username, password)
     
     def _match_patterns(self, file_path: str) -> bool:
         """检查文件是否匹配同步模式 - 只同步 beancount 文件"""
@@ -144,6 +168,13 @@ class GitHubSyncService:
     
     async def _test_github_connection(self):
         """测试GitHub连接"""
+        if self._use_git_backend():
+            try:
+                await asyncio.to_thread(lambda: self._get_git_backend().ls_remote())
+            except Exception as e:
+                raise Exception(f"git 远端连接失败: {str(e)}")
+            return
+        
         if not self._github_client:
             raise Exception("GitHub客户端未初始化")
         
@@ -164,6 +195,17 @@ class GitHubSyncService:
         try:
             await self._test_github_connection()
             
+            if self._use_git_backend():
+                return {
+                    "success": True,
+                    "message": "连接成功",
+                    "repository_info": {
+                        "full_name": self._config.repository,
+                        "remote_url": self._get_git_backend().remote_url,
+                        "branch": self._config.branch
+                    }
+                }
+            
             repo = self._github_client.get_repo(self._config.repository)
             repo_info = {
                 "name": repo.name,
@@ -184,41 +226,146 @@ class GitHubSyncService:
                 "repository_info": None
             }
     
-    def _calculate_file_hash(self, file_path: Path) -> str:
-        """计算文件哈希值"""
-        hash_md5 = hashlib.md5()
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
+    def _calculate_blob_sha(self, file_path: Path) -> str:
+        """计算文件的 git blob SHA（与 GitHub 上的 blob SHA 一致）"""
+        content = file_path.read_bytes()
+        digest = hashlib.sha1(f"blob {len(content)}\0".encode())
+        digest.update(content)
+        return digest.hexdigest()
     
-    async def _get_changed_files(self) -> List[FileChangeInfo]:
-        """获取变更的文件列表 - 只检查 beancount 文件"""
-        changed_files = []
-        
-        # 使用更高效的方式，直接搜索 .bean 和 .beancount 文件
-        bean_patterns = ["*.bean", "*.beancount"]
-        
-        for pattern in bean_patterns:
+    def _scan_local_files(self) -> Dict[str, os.stat_result]:
+        """扫描数据目录下需要同步的 beancount 文件，只做 stat 不读内容"""
+        files = {}
+        for pattern in ["*.bean", "*.beancount"]:
             for file_path in self.data_dir.rglob(pattern):
                 if file_path.is_file():
-                    rel_path = file_path.relative_to(self.data_dir)
-                    
-                    # 额外检查排除模式
-                    if self._match_patterns(str(rel_path)):
-                        file_stat = file_path.stat()
-                        file_hash = self._calculate_file_hash(file_path)
-                        
-                        changed_files.append(FileChangeInfo(
-                            file_path=str(rel_path),
-                            file_type="modified",  # 简化处理，实际应该检查是否为新文件
-                            size=file_stat.st_size,
-                            hash=file_hash,
-                            last_modified=datetime.fromtimestamp(file_stat.st_mtime)
-                        ))
+                    rel_path = str(file_path.relative_to(self.data_dir))
+                    if self._match_patterns(rel_path):
+                        files[rel_path] = file_path.stat()
+        return files
+    
+    def _refresh_manifest(self) -> Tuple[Dict[str, SyncFileManifest], Dict[str, os.stat_result]]:
+        """
+        根据本地文件刷新同步清单
+        
+        size 和 mtime_ns 都未变化的文件直接沿用清单中的 blob SHA，只有 stat 变化的文件才重新计算哈希。
+        本地已删除且从未推送过的文件从清单中移除。
+        
+        Returns:
+            (清单, 本地文件 stat)
+        """
+        manifest = {row.path: row for row in self.db.query(SyncFileManifest).all()}
+        local_files = self._scan_local_files()
+        
+        for rel_path, file_stat in local_files.items():
+            row = manifest.get(rel_path)
+            if row is not None and row.size == file_stat.st_size and row.mtime_ns == file_stat.st_mtime_ns:
+                continue
+            
+            blob_sha = self._calculate_blob_sha(self.data_dir / rel_path)
+            if row is None:
+                row = SyncFileManifest(path=rel_path)
+                self.db.add(row)
+                manifest[rel_path] = row
+            row.size = file_stat.st_size
+            row.mtime_ns = file_stat.st_mtime_ns
+            row.blob_sha = blob_sha
+        
+        for rel_path, row in list(manifest.items()):
+            if rel_path not in local_files and row.pushed_sha is None:
+                self.db.delete(row)
+                del manifest[rel_path]
         
+        self.db.commit()
+        return manifest, local_files
+    
+    def _manifest_change(self, row: SyncFileManifest, exists: bool) -> FileChangeInfo:
+        if not exists:
+            file_type = "deleted"
+        elif row.pushed_sha is None:
+            file_type = "added"
+        else:
+            file_type = "modified"
+        return FileChangeInfo(
+            file_path=row.path,
+            file_type=file_type,
+            size=row.size if exists else None,
+            hash=row.blob_sha if exists else None,
+            last_modified=datetime.fromtimestamp(row.mtime_ns / 1e9) if exists else None
+        )
+    
+    async def _get_changed_files(self, force: bool = False) -> List[FileChangeInfo]:
+        """
+        获取变更的文件列表 - 只检查 beancount 文件
+        
+        与最近一次推送的 blob SHA 比较，只返回内容确实变化的文件；force 时返回所有文件。
+        """
+        manifest, local_files = await asyncio.to_thread(self._refresh_manifest)
+        
+        changed_files = []
+        for rel_path in sorted(manifest):
+            row = manifest[rel_path]
+            exists = rel_path in local_files
+            if force or not exists or row.blob_sha != row.pushed_sha:
+                changed_files.append(self._manifest_change(row, exists))
         return changed_files
     
+    def _mark_pushed(self, files: List[FileChangeInfo]):
+        """推送成功后记录各文件推送时的 blob SHA"""
+        paths = [file_info.file_path for file_info in files]
+        rows = {row.path: row for row in self.db.query(SyncFileManifest).filter(SyncFileManifest.path.in_(paths)).all()}
+        for file_info in files:
+            row = rows.get(file_info.file_path)
+            if row is None:
+                continue
+            if file_info.file_type == "deleted":
+                self.db.delete(row)
+            elif file_info.hash:
+                row.pushed_sha = file_info.hash
+        self.db.commit()
+    
+    def _mark_restored(self, rel_path: str, remote_sha: str):
+        """从远端恢复（或确认与远端一致）后记录远端 blob SHA，并刷新本地 stat 信息"""
+        file_stat = (self.data_dir / rel_path).stat()
+        row = self.db.query(SyncFileManifest).filter(SyncFileManifest.path == rel_path).first()
+        if row is None:
+            row = SyncFileManifest(path=rel_path)
+            self.db.add(row)
+        row.size = file_stat.st_size
+        row.mtime_ns = file_stat.st_mtime_ns
+        # 恢复时按原始字节写入，本地内容的 blob SHA 即远端 SHA
+        row.blob_sha = remote_sha
+        row.pushed_sha = remote_sha
+    
+    def _apply_restore(self, fetched: List[Tuple[RemoteFile, bytes]], skipped: List[RemoteFile]):
+        """持有账本写锁写入恢复的文件并更新清单，之后重新加载账本"""
+        with ledger_write_lock:
+            for item, content in fetched:
+                self._write_file_atomic(self.data_dir / item.path, content)
+                self._mark_restored(item.path, item.sha)
+            for item in skipped:
+                self._mark_restored(item.path, item.sha)
+            self.db.commit()
+        
+        if fetched:
+            from app.services.beancount_service import beancount_service
+            beancount_service.loader.load_entries(force_reload=True)
+    
+    @staticmethod
+    def _write_file_atomic(path: Path, content: bytes):
+        """先写临时文件再替换，避免读取到写了一半的账本文件"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f".{path.name}.restore.tmp")
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+    
     async def get_sync_status(self) -> SyncStatusResponse:
         """获取同步状态"""
         await self._ensure_initialized()
@@ -251,24 +398,24 @@ class GitHubSyncService:
         if self._current_status == SyncStatus.SYNCING:
             raise Exception("正在同步中，请稍后再试")
         
-        if not self._config or not self._github_client:
+        if not self._config or not (self._github_client or self._use_git_backend()):
             raise Exception("同步配置未设置")
         
         try:
             self._current_status = SyncStatus.SYNCING
             
-            # 获取要同步的文件
+            # 获取要同步的文件（force 时忽略清单，推送所有文件）
+            sync_files = await self._get_changed_files(force=force)
             if files:
-                sync_files = [FileChangeInfo(file_path=f, file_type="modified") for f in files]
-            else:
-                sync_files = await self._get_changed_files()
+                sync_files = [file_info for file_info in sync_files if file_info.file_path in set(files)]
             
-            if not sync_files and not force:
+            if not sync_files:
                 self._current_status = SyncStatus.IDLE
                 return True
             
             # 执行同步
             await self._sync_files_to_github(sync_files)
+            self._mark_pushed(sync_files)
             
             self._current_status = SyncStatus.SUCCESS
             await self._add_history_record(operation_type, SyncStatus.SUCCESS, len(sync_files))
@@ -281,46 +428,118 @@ class GitHubSyncService:
             raise
     
     async def _sync_files_to_github(self, files: List[FileChangeInfo]):
-        """同步文件到GitHub"""
-        repo = self._github_client.get_repo(self._config.repository)
+        """
+        同步文件到GitHub
         
-        for file_info in files:
-            file_path = self.data_dir / file_info.file_path
+        通过 Git 数据 API 把所有文件作为一次提交推送：并发上传 blob → 基于当前分支的树创建新树
+        → 创建提交 → 更新分支引用。阻塞的 HTTP 请求都放到线程中执行，不占用事件循环。
+        推送成功后各文件的 hash 更新为实际上传的 blob SHA。
+        配置为 git 同步方式时改为通过本地 git 仓库推送。
+        """
+        if self._use_git_backend():
+            await self._sync_files_with_git(files)
+            return
+        
+        repo = await asyncio.to_thread(self._github_client.get_repo, self._config.repository)
+        branch = self._config.branch
+        
+        # 1. 获取分支当前提交（空仓库或新分支没有引用）
+        try:
+            ref = await asyncio.to_thread(repo.get_git_ref, f"heads/{branch}")
+            base_commit = await asyncio.to_thread(repo.get_git_commit, ref.object.sha)
+        except GithubException as e:
+            if e.status not in (404, 409):
+                raise
+            ref, base_commit = None, None
+        
+        # 只有远端树中存在的文件才能删除，删除不存在的路径 GitHub 会返回 422
+        deleted_paths = [f.file_path for f in files if f.file_type == "deleted"]
+        remote_paths = set()
+        if deleted_paths and base_commit is not None:
+            remote_paths = await asyncio.to_thread(self._existing_remote_paths, repo, base_commit, deleted_paths)
+        
+        # 2. 并发上传 blob
+        semaphore = asyncio.Semaphore(max(1, settings.sync_upload_concurrency))
+        
+        async def upload(file_info: FileChangeInfo) -> Optional[InputGitTreeElement]:
+            if file_info.file_type == "deleted":
+                # sha 为 None 表示从树中删除该文件
+                if file_info.file_path not in remote_paths:
+                    return None
+                return InputGitTreeElement(file_info.file_path, "100644", "blob", sha=None)
             
+            file_path = self.data_dir / file_info.file_path
             if not file_path.exists():
-                continue
+                return None
             
-            # 读取文件内容 - 直接读取为文本，不进行base64编码
-            async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
+            async with aiofiles.open(file_path, 'rb') as f:
                 content = await f.read()
-            
+            async with semaphore:
+                blob = await asyncio.to_thread(
+                    repo.create_git_blob, base64.b64encode(content).decode('ascii'), "base64"
+                )
+            file_info.hash = blob.sha
+            return InputGitTreeElement(file_info.file_path, "100644", "blob", sha=blob.sha)
+        
+        elements = [element for element in await asyncio.gather(*(upload(f) for f in files)) if element is not None]
+        if not elements:
+            return
+        
+        # 3. 创建树和提交，再更新分支引用
+        message = f"Sync {len(elements)} file(s) from Beancount Web"
+        if base_commit is not None:
+            tree = await asyncio.to_thread(repo.create_git_tree, elements, base_commit.tree)
+            commit = await asyncio.to_thread(repo.create_git_commit, message, tree, [base_commit])
+        else:
+            tree = await asyncio.to_thread(repo.create_git_tree, elements)
+            commit = await asyncio.to_thread(repo.create_git_commit, message, tree, [])
+        
+        if ref is not None:
+            await asyncio.to_thread(ref.edit, commit.sha)
+        else:
+            await asyncio.to_thread(repo.create_git_ref, f"refs/heads/{branch}", commit.sha)
+    
+    @staticmethod
+    def _existing_remote_paths(repo, base_commit, paths: List[str]) -> Set[str]:
+        """返回 paths 中存在于分支当前树里的文件路径"""
+        tree = repo.get_git_tree(base_commit.tree.sha, recursive=True)
+        existing = {element.path for element in tree.tree if element.type == "blob"}
+        found = {path for path in paths if path in existing}
+        if not getattr(tree, 'truncated', False):
+            return found
+        
+        # 仓库过大时递归树会被截断，未找到的路径逐个确认
+        for path in paths:
+            if path in found:
+                continue
             try:
-                # 检查文件是否存在
-                try:
-                    existing_file = repo.get_contents(file_info.file_path, ref=self._config.branch)
-                    # 更新文件
-                    repo.update_file(
-                        file_info.file_path,
-                        f"Update {file_info.file_path}",
-                        content,
-                        existing_file.sha,
-                        branch=self._config.branch
-                    )
-                except GithubException as e:
-                    if e.status == 404:
-                        # 文件不存在，创建新文件
-                        repo.create_file(
-                            file_info.file_path,
-                            f"Add {file_info.file_path}",
-                            content,
-                            branch=self._config.branch
-                        )
-                    else:
-                        raise
-                        
-            except Exception as e:
-                # 异常会在上层处理和记录
-                raise
+                repo.get_contents(path, ref=base_commit.sha)
+                found.add(path)
+            except GithubException as e:
+                if e.status != 404:
+                    raise
+        return found
+    
+    async def _sync_files_with_git(self, files: List[FileChangeInfo]):
+        """通过本地 git 仓库把所有变更作为一次提交推送"""
+        changes = []
+        for file_info in files:
+            file_path = self.data_dir / file_info.file_path
+            if file_info.file_type == "deleted":
+                changes.append((file_info.file_path, None))
+            elif file_path.exists():
+                async with aiofiles.open(file_path, 'rb') as f:
+                    changes.append((file_info.file_path, await f.read()))
+        if not changes:
+            return
+        
+        backend = self._get_git_backend()
+        blob_shas = await asyncio.to_thread(
+            backend.push_files, changes, f"Sync {len(changes)} file(s) from Beancount Web"
+        )
+        for file_info in files:
+            if file_info.file_path in blob_shas:
+                file_info.hash = blob_shas[file_info.file_path]
     
     async def _add_history_record(self, operation_type: str, status: SyncStatus, files_count: int, message: str = None, duration: Optional[float] = None):
         """添加历史记录到数据库"""
@@ -353,73 +572,83 @@ class GitHubSyncService:
         }
     
     async def restore_from_github(self, commit_hash: Optional[str] = None, force: bool = False) -> bool:
-        """从GitHub恢复数据"""
+        """
+        从GitHub恢复数据
+        
+        比较远端树中的 blob SHA 与本地文件的 blob SHA，只并发下载内容不同的文件（force 时全部下载），
+        原子写入后重新加载一次账本，并在同步日志中记录下载与跳过的文件数和字节数。
+        """
         await self._ensure_initialized()
-        if not self._config or not self._github_client:
+        if not self._config or not (self._github_client or self._use_git_backend()):
             raise Exception("同步配置未设置")
         
+        started = time.perf_counter()
         try:
             self._current_status = SyncStatus.SYNCING
             
-            repo = self._github_client.get_repo(self._config.repository)
-            
-            # 获取指定提交或最新提交的文件
-            if commit_hash:
-                commit = repo.get_commit(commit_hash)
-                tree = commit.commit.tree
+            if self._use_git_backend():
+                # 一次拉取远端 pack，之后的读取都在本地对象库中完成
+                backend = self._get_git_backend()
+                remote_files = [RemoteFile(*item) for item in await asyncio.to_thread(backend.list_files, commit_hash)]
+                
+                async def download(sha: str) -> bytes:
+                    return await asyncio.to_thread(backend.read_blob, sha)
             else:
-                tree = repo.get_git_tree(self._config.branch, recursive=True)
+                repo = await asyncio.to_thread(self._github_client.get_repo, self._config.repository)
+                
+                # 获取指定提交或最新提交的文件树
+                if commit_hash:
+                    commit = await asyncio.to_thread(repo.get_git_commit, commit_hash)
+                    tree_sha = commit.tree.sha
+                else:
+                    tree_sha = self._config.branch
+                tree = await asyncio.to_thread(repo.get_git_tree, tree_sha, True)
+                remote_files = [RemoteFile(item.path, item.sha, item.size or 0)
+                                for item in tree.tree if item.type == "blob"]
+                
+                async def download(sha: str) -> bytes:
+                    blob = await asyncio.to_thread(repo.get_git_blob, sha)
+                    return base64.b64decode(blob.content)
+            
+            # 只恢复 beancount 文件
+            items = [item for item in remote_files if self._match_patterns(item.path)]
+            
+            manifest, local_files = await asyncio.to_thread(self._refresh_manifest)
+            to_fetch, skipped = [], []
+            for item in items:
+                row = manifest.get(item.path)
+                if not force and item.path in local_files and row is not None and row.blob_sha == item.sha:
+                    skipped.append(item)
+                else:
+                    to_fetch.append(item)
+            
+            # 并发下载不同的 blob
+            semaphore = asyncio.Semaphore(max(1, settings.sync_upload_concurrency))
+            
+            async def fetch(item: RemoteFile) -> bytes:
+                async with semaphore:
+                    return await download(item.sha)
+            
+            contents = await asyncio.gather(*(fetch(item) for item in to_fetch))
             
-            restored_count = 0
+            # 全部下载成功后再写入（在线程中执行，避免阻塞事件循环）
+            await asyncio.to_thread(self._apply_restore, list(zip(to_fetch, contents)), skipped)
             
-            for item in tree.tree:
-                if item.type == "blob" and self._match_patterns(item.path):
-                    # 只恢复 beancount 文件
-                    item_path_lower = item.path.lower()
-                    if not (item_path_lower.endswith('.bean') or item_path_lower.endswith('.beancount')):
-                        continue
-                    
-                    # 下载文件内容
-                    blob = repo.get_git_blob(item.sha)
-                    
-                    # 尝试直接获取文本内容，如果失败则尝试base64解码
-                    try:
-                        # 首先尝试直接作为文本内容
-                        content_bytes = base64.b64decode(blob.content)
-                        content_text = content_bytes.decode('utf-8')
-                        
-                        # 检查是否是有效的beancount文本内容
-                        if any(line.strip().startswith(('open ', 'close ', 'option ', ';', '19', '20')) 
-                               for line in content_text.split('\n')[:10]):
-                            # 直接使用解码后的文本
-                            content = content_text
-                        else:
-                            # 可能是双重编码，尝试再次解码
-                            try:
-                                content = base64.b64decode(content_text).decode('utf-8')
-                            except:
-                                content = content_text
-                    except Exception:
-                        # 如果解码失败，使用原始内容
-                        content = base64.b64decode(blob.content).decode('utf-8')
-                    
-                    # 保存到本地
-                    local_path = self.data_dir / item.path
-                    local_path.parent.mkdir(parents=True, exist_ok=True)
-                    
-                    async with aiofiles.open(local_path, 'w', encoding='utf-8') as f:
-                        await f.write(content)
-                    
-                    restored_count += 1
+            fetched_bytes = sum(len(content) for content in contents)
+            skipped_bytes = sum(item.size for item in skipped)
+            message = (f"下载 {len(to_fetch)} 个文件（{fetched_bytes} 字节），"
+                       f"跳过 {len(skipped)} 个未变化文件（{skipped_bytes} 字节）")
             
             self._current_status = SyncStatus.SUCCESS
-            await self._add_history_record("restore", SyncStatus.SUCCESS, restored_count)
+            await self._add_history_record("restore", SyncStatus.SUCCESS, len(to_fetch), message,
+                                           duration=time.perf_counter() - started)
             
             return True
             
         except Exception as e:
             self._current_status = SyncStatus.FAILED
-            await self._add_history_record("restore", SyncStatus.FAILED, 0, str(e))
+            await self._add_history_record("restore", SyncStatus.FAILED, 0, str(e),
+                                           duration=time.perf_counter() - started)
             raise
     
     async def get_config(self) -> Optional[GitHubSyncConfig]:
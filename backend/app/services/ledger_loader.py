@@ -2,16 +2,60 @@
 Beancount账本文件加载器
 负责文件加载、缓存和基础数据管理
 """
+import hashlib
+import os
+import uuid
+from pathlib import Path
+
 from beancount import loader
+from beancount.core import getters
+from beancount.ops.summarize import conversions
 from beancount.parser import options
-from typing import Optional, Tuple, List, Any
+from collections import OrderedDict
+from datetime import date
+import threading
+from contextvars import ContextVar
+from threading import Condition, Lock
+from typing import Optional, Tuple, List, Any, Callable, Hashable, Dict, NamedTuple
 
+from app.core.cache import UNSTABLE_VERSION_PREFIX
 from app.core.config import settings
 from app.core.exceptions import FileNotFoundError
 from app.core.logging_config import get_logger
+from .account_index import AccountIndex
+from .account_lifecycle import AccountLifecycleIndex
+from .posting_index import PostingIndex
+from app.utils.include_graph import include_graph
 
 logger = get_logger(__name__)
 
+# 每个快照最多保留的 conversions() 结果数量（每个结果都是完整条目列表的副本）
+MAX_CONVERSION_SNAPSHOTS = 8
+
+# 当前请求中写入产生的版本令牌（由中间件设置一个列表，写入时追加），用于只返回请求自己的写入令牌
+request_write_tokens: ContextVar[Optional[List[int]]] = ContextVar('request_write_tokens', default=None)
+
+# 加载期间文件被修改时重新加载的最多次数
+MAX_LOAD_ATTEMPTS = 3
+
+# 文件指纹：(size, mtime_ns, ctime_ns, inode)
+Fingerprint = Tuple[int, int, int, int]
+
+
+def normalize_path(file_path) -> str:
+    """文件指纹和错误索引统一使用的路径键（绝对路径并解析符号链接，与数据目录是否为相对路径无关）"""
+    return os.path.realpath(str(file_path))
+
+
+def _fingerprint(stat: os.stat_result) -> Fingerprint:
+    return (stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns, stat.st_ino)
+
+
+class ErrorIndex(NamedTuple):
+    """快照的错误索引：按来源文件（normalize_path 规范化）分组、按行号排序的错误，以及各文件的条目数"""
+    errors_by_file: Dict[str, List[Tuple[int, Any]]]
+    entries_by_file: Dict[str, int]
+
 
 class LedgerLoader:
     """Beancount账本加载器"""
@@ -22,32 +66,399 @@ class LedgerLoader:
         self._entries = None
         self._errors = None
         self._options_map = None
+        # 账本版本号，每次重新加载后递增，用于派生数据和缓存失效
+        self.version = 0
+        # 账本内容哈希（主文件及所有 include 文件），跨进程稳定，用于持久化缓存
+        self.content_hash: Optional[str] = None
+        # 快照中各文件的指纹，用于判断文件在加载后是否被修改
+        self.file_fingerprints: Dict[str, Fingerprint] = {}
+        # 基于当前快照计算的派生数据
+        self._derived = {}
+        self._derived_lock = Lock()
+        # 合并重新加载：写入序号（版本令牌）、最近一次加载已覆盖到的写入序号，
+        # 以及最近一次失败的加载本应覆盖到的写入序号（失败时唤醒等待者，不让其等到超时）
+        self._write_seq = 0
+        self._loaded_seq = 0
+        self._failed_seq = 0
+        self._reload_cond = Condition()
+        self._reload_lock = Lock()
+        self._reload_timer: Optional[threading.Timer] = None
+        self._reload_callbacks: List[Tuple[int, Callable[[int, Optional[str]], None]]] = []
+        # 账本内容变化后的重新加载监听者
+        self._reload_listeners: List[Callable[[], None]] = []
         
     def load_entries(self, force_reload: bool = False) -> Tuple[List[Any], List[Any], dict]:
         """加载Beancount条目"""
+        covered_seq = None
         try:
             if self._entries is None or force_reload:
                 if not self.main_file.exists():
                     raise FileNotFoundError(str(self.main_file))
                 
-                logger.info(f"Loading beancount file: {self.main_file}")
-                self._entries, self._errors, self._options_map = loader.load_file(str(self.main_file))
+                with self._reload_lock:
+                    # 读取文件前记录写入序号，此前完成的写入都包含在本次加载中
+                    with self._reload_cond:
+                        covered_seq = self._write_seq
+                    
+                    entries, errors, options_map, content_hash, fingerprints = self._load_consistent()
+                    changed = self._entries is not None and content_hash != self.content_hash
+                    with self._derived_lock:
+                        self._entries, self._errors, self._options_map = entries, errors, options_map
+                        self.version += 1
+                        self.content_hash = content_hash
+                        self.file_fingerprints = fingerprints
+                        self._derived = {}
                 
-                if self._errors:
-                    logger.warning(f"Loaded with {len(self._errors)} errors")
-                    for i, error in enumerate(self._errors[:3]):  # 只记录前3个错误
+                if errors:
+                    logger.warning(f"Loaded with {len(errors)} errors")
+                    for i, error in enumerate(errors[:3]):  # 只记录前3个错误
                         logger.warning(f"Error {i+1}: {error}")
                 else:
-                    logger.info(f"Successfully loaded {len(self._entries)} entries")
+                    logger.info(f"Successfully loaded {len(entries)} entries")
+                
+                self._mark_loaded(covered_seq, content_hash)
+                if changed:
+                    self._notify_reload_listeners()
                         
             return self._entries, self._errors, self._options_map
         
         except Exception as e:
             logger.error(f"Failed to load beancount file: {e}")
+            if covered_seq is not None:
+                self._mark_failed(covered_seq)
             raise
     
+    def schedule_reload(self, callback: Optional[Callable[[int, Optional[str]], None]] = None,
+                        on_token: Optional[Callable[[int], None]] = None) -> int:
+        """
+        写入账本文件后调用，安排一次合并的重新加载
+        
+        窗口期（settings.reload_coalesce_ms）内的多次写入共用一次重新加载，
+        窗口为 0 时立即重新加载。callback 在覆盖本次写入的加载完成后以
+        (该次加载覆盖到的写入序号, 该次加载的内容哈希) 调用；on_token 在分配令牌后、
+        任何加载开始前调用，用于把令牌与调用方的待处理数据关联。
+        
+        Returns:
+            int: 本次写入的版本令牌，可用 wait_for_token 等待其生效
+        """
+        window = settings.reload_coalesce_ms / 1000
+        with self._reload_cond:
+            self._write_seq += 1
+            token = self._write_seq
+            if on_token is not None:
+                on_token(token)
+            if callback is not None:
+                self._reload_callbacks.append((token, callback))
+            if window > 0 and self._reload_timer is None:
+                self._reload_timer = threading.Timer(window, self._run_scheduled_reload)
+                self._reload_timer.daemon = True
+                self._reload_timer.start()
+        
+        # 记录到当前请求，响应中只返回请求自己写入的令牌
+        tokens = request_write_tokens.get()
+        if tokens is not None:
+            tokens.append(token)
+        
+        if window <= 0:
+            self.load_entries(force_reload=True)
+        return token
+    
+    def flush_pending_reload(self):
+        """如有尚未生效的写入，立即重新加载（需要基于最新快照修改文件前调用）"""
+        with self._reload_cond:
+            pending = self._loaded_seq < self._write_seq
+            timer, self._reload_timer = self._reload_timer, None
+        if timer is not None:
+            timer.cancel()
+        if pending:
+            self.load_entries(force_reload=True)
+    
+    def wait_for_token(self, token: int, timeout: Optional[float] = None) -> bool:
+        """
+        等待版本令牌对应的写入在快照中生效，超时返回 False
+        
+        覆盖该写入的加载失败时立即在当前线程重试一次加载，仍失败则返回 False，不等到超时。
+        """
+        with self._reload_cond:
+            # 令牌大于当前写入序号（如服务已重启）时按最新写入处理
+            token = min(token, self._write_seq)
+            self._reload_cond.wait_for(
+                lambda: self._loaded_seq >= token or self._failed_seq >= token, timeout
+            )
+            if self._loaded_seq >= token:
+                return True
+            failed = self._failed_seq >= token
+        
+        if failed:
+            try:
+                self.flush_pending_reload()
+            except Exception:
+                # load_entries 已记录错误
+                pass
+        with self._reload_cond:
+            return self._loaded_seq >= token
+    
+    def get_write_token(self) -> int:
+        """获取最近一次写入的版本令牌"""
+        return self._write_seq
+    
+    def _run_scheduled_reload(self):
+        with self._reload_cond:
+            self._reload_timer = None
+            pending = self._loaded_seq < self._write_seq
+        if pending:
+            try:
+                self.load_entries(force_reload=True)
+            except Exception:
+                # load_entries 已记录错误，等待下一次写入或读取时重试
+                pass
+    
+    def add_reload_listener(self, listener: Callable[[], None]):
+        """注册重新加载监听者：首次加载之后，账本内容变化的重新加载完成时调用"""
+        self._reload_listeners.append(listener)
+    
+    def _notify_reload_listeners(self):
+        for listener in self._reload_listeners:
+            try:
+                listener()
+            except Exception as e:
+                logger.warning(f"重新加载监听者处理失败: {e}")
+    
+    def _mark_failed(self, covered_seq: int):
+        """记录加载失败，唤醒等待该加载的请求"""
+        with self._reload_cond:
+            self._failed_seq = max(self._failed_seq, covered_seq)
+            self._reload_cond.notify_all()
+    
+    def _mark_loaded(self, covered_seq: int, content_hash: Optional[str]):
+        """
+        记录加载已覆盖的写入序号，唤醒等待者并调用已生效写入的回调
+        
+        只调用本次加载覆盖的写入（令牌不大于 covered_seq）的回调，回调得到的内容哈希即包含这些写入的快照。
+        """
+        with self._reload_cond:
+            self._loaded_seq = max(self._loaded_seq, covered_seq)
+            ready = [callback for token, callback in self._reload_callbacks if token <= covered_seq]
+            self._reload_callbacks = [
+                (token, callback) for token, callback in self._reload_callbacks if token > covered_seq
+            ]
+            self._reload_cond.notify_all()
+        
+        for callback in ready:
+            try:
+                callback(covered_seq, content_hash)
+            except Exception as e:
+                logger.warning(f"重新加载回调处理失败: {e}")
+    
+    def get_version(self) -> int:
+        """获取当前快照的版本号（必要时先加载账本）"""
+        self.load_entries()
+        return self.version
+    
+    def get_content_hash(self) -> str:
+        """获取当前快照的内容哈希（必要时先加载账本）"""
+        self.load_entries()
+        return self.content_hash
+    
+    def _load_consistent(self) -> Tuple[List[Any], List[Any], dict, str, Dict[str, Fingerprint]]:
+        """
+        解析账本并计算与解析结果一致的内容哈希和文件指纹
+        
+        解析前记录各文件的指纹，解析后读取文件计算哈希时再次核对；
+        期间有文件被修改则重新解析，多次仍不一致时使用不会被持久化缓存复用的临时哈希。
+        """
+        for attempt in range(1, MAX_LOAD_ATTEMPTS + 1):
+            before = self._stat_files(self._candidate_files())
+            logger.info(f"Loading beancount file: {self.main_file}")
+            entries, errors, options_map = loader.load_file(str(self.main_file))
+            result = self._compute_content_hash(options_map, before)
+            if result is not None:
+                return (entries, errors, options_map) + result
+            logger.warning(f"账本文件在加载期间被修改，重新加载（第 {attempt} 次）")
+        
+        # 文件持续被修改：快照仍然可用，但哈希不描述确定的文件内容，不能跨进程复用
+        return entries, errors, options_map, f"{UNSTABLE_VERSION_PREFIX}{uuid.uuid4().hex}", {}
+    
+    def _candidate_files(self) -> List[str]:
+        """解析前需要记录指纹的文件：当前 include 依赖图和上一快照中的文件"""
+        files = {normalize_path(path) for path in include_graph.get_all_files(self.main_file.resolve())}
+        files.update(self.file_fingerprints)
+        files.add(normalize_path(self.main_file))
+        return sorted(files)
+    
+    @staticmethod
+    def _stat_files(files: List[str]) -> Dict[str, Optional[Fingerprint]]:
+        fingerprints = {}
+        for file_path in files:
+            try:
+                fingerprints[file_path] = _fingerprint(os.stat(file_path))
+            except OSError:
+                fingerprints[file_path] = None
+        return fingerprints
+    
+    def _compute_content_hash(self, options_map: dict,
+                              before: Dict[str, Optional[Fingerprint]]) -> Optional[Tuple[str, Dict[str, Fingerprint]]]:
+        """
+        按文件相对路径和内容计算账本哈希，同时记录各文件的指纹
+        
+        解析结果用到的文件必须在解析前已记录指纹，且读取前后指纹都与之相同，否则返回 None。
+        """
+        digest = hashlib.sha256()
+        fingerprints = {}
+        files = sorted({normalize_path(path) for path in options_map.get('include') or [self.main_file]})
+        for file_path in files:
+            if file_path not in before:
+                # 解析期间新增的 include 文件，无法确认解析时读取的内容
+                return None
+            path = Path(file_path)
+            try:
+                name = str(path.relative_to(normalize_path(self.data_dir)))
+            except ValueError:
+                name = file_path
+            digest.update(name.encode('utf-8') + b'\0')
+            try:
+                fingerprint = _fingerprint(path.stat())
+                data = path.read_bytes()
+                if fingerprint != before[file_path] or _fingerprint(path.stat()) != fingerprint:
+                    return None
+                digest.update(data)
+                fingerprints[file_path] = fingerprint
+            except OSError:
+                if before[file_path] is not None:
+                    return None
+                digest.update(b'<missing>')
+            digest.update(b'\0')
+        return digest.hexdigest(), fingerprints
+    
+    def is_file_current(self, file_path: Path) -> bool:
+        """判断文件属于当前快照且加载后未被修改"""
+        self.load_entries()
+        fingerprint = self.file_fingerprints.get(normalize_path(file_path))
+        if fingerprint is None:
+            return False
+        try:
+            stat = file_path.stat()
+        except OSError:
+            return False
+        return fingerprint == _fingerprint(stat)
+    
+    def is_snapshot_current(self) -> bool:
+        """判断快照涉及的所有文件在加载后都未被修改（不触发加载）"""
+        fingerprints = self.file_fingerprints
+        if self._entries is None or not fingerprints:
+            return False
+        for file_path, fingerprint in fingerprints.items():
+            try:
+                if _fingerprint(os.stat(file_path)) != fingerprint:
+                    return False
+            except OSError:
+                return False
+        return True
+    
+    def get_derived(self, key: Hashable, builder: Callable[[], Any]) -> Any:
+        """
+        获取基于当前快照的派生数据
+        
+        首次访问时调用 builder 计算，之后直接返回；账本重新加载后自动失效。
+        """
+        self.load_entries()
+        version = self.version
+        with self._derived_lock:
+            if key in self._derived:
+                return self._derived[key]
+        
+        value = builder()
+        
+        with self._derived_lock:
+            # 计算期间账本被重新加载时不保存过期结果
+            if self.version == version:
+                value = self._derived.setdefault(key, value)
+        return value
+    
+    def get_conversion_entries(self, date_filter: date, conversion_currency: str) -> List[Any]:
+        """获取插入了转换分录的条目列表，按截止日期缓存"""
+        snapshots = self.get_derived('conversion_entries', OrderedDict)
+        key = (date_filter, conversion_currency)
+        
+        with self._derived_lock:
+            if key in snapshots:
+                snapshots.move_to_end(key)
+                return snapshots[key]
+        
+        entries, _, _ = self.load_entries()
+        current_conversions_account = self.get_default_accounts()['current_conversions']
+        converted = conversions(entries, current_conversions_account, conversion_currency, date_filter)
+        
+        with self._derived_lock:
+            snapshots[key] = converted
+            while len(snapshots) > MAX_CONVERSION_SNAPSHOTS:
+                snapshots.popitem(last=False)
+        return converted
+    
+    def get_account_index(self) -> AccountIndex:
+        """获取当前快照的账户层级索引"""
+        return self.get_derived('account_index', self._build_account_index)
+    
+    def _build_account_index(self) -> AccountIndex:
+        entries, _, _ = self.load_entries()
+        return AccountIndex(getters.get_accounts(entries))
+    
+    def get_account_lifecycle(self) -> AccountLifecycleIndex:
+        """获取当前快照的账户生命周期索引"""
+        return self.get_derived('account_lifecycle', self._build_account_lifecycle)
+    
+    def _build_account_lifecycle(self) -> AccountLifecycleIndex:
+        entries, _, _ = self.load_entries()
+        return AccountLifecycleIndex(entries)
+    
+    def get_posting_index(self) -> PostingIndex:
+        """获取当前快照的账户记账行索引（含累计余额）"""
+        return self.get_derived('posting_index', self._build_posting_index)
+    
+    def _build_posting_index(self) -> PostingIndex:
+        entries, _, _ = self.load_entries()
+        return PostingIndex(entries)
+    
+    def get_error_index(self) -> ErrorIndex:
+        """获取当前快照按来源文件分组的错误索引"""
+        return self.get_derived('error_index', self._build_error_index)
+    
+    def _build_error_index(self) -> ErrorIndex:
+        entries, errors, _ = self.load_entries()
+        
+        # 同一文件名只规范化一次
+        keys: Dict[str, str] = {}
+        
+        def file_key(filename: str) -> str:
+            if filename.startswith('<'):
+                return filename
+            key = keys.get(filename)
+            if key is None:
+                key = keys[filename] = normalize_path(filename)
+            return key
+        
+        errors_by_file: Dict[str, List[Tuple[int, Any]]] = {}
+        for error in errors:
+            source = getattr(error, 'source', None) or {}
+            filename = file_key(source.get('filename') or '<load>')
+            errors_by_file.setdefault(filename, []).append((source.get('lineno') or 0, error))
+        for file_errors in errors_by_file.values():
+            file_errors.sort(key=lambda item: item[0])
+        
+        entries_by_file: Dict[str, int] = {}
+        for entry in entries:
+            filename = entry.meta.get('filename') if entry.meta else None
+            if filename and not filename.startswith('<'):
+                filename = file_key(filename)
+                entries_by_file[filename] = entries_by_file.get(filename, 0) + 1
+        
+        return ErrorIndex(errors_by_file, entries_by_file)
+    
     def get_default_accounts(self) -> dict:
         """获取Beancount默认配置的账户名称"""
+        return dict(self.get_derived('default_accounts', self._build_default_accounts))
+    
+    def _build_default_accounts(self) -> dict:
         entries, errors, options_map = self.load_entries()
         
         # 获取当期收益和转换账户名称
@@ -64,34 +475,58 @@ class LedgerLoader:
             'previous_conversions': account_previous_conversions
         }
     
-    def get_account_configuration(self) -> dict:
-        """获取账户配置信息，用于调试和验证"""
+    def get_ledger_stats(self) -> dict:
+        """获取账本级别的账户与币种统计，每个快照只计算一次"""
+        return self.get_derived('ledger_stats', self._build_ledger_stats)
+    
+    def _build_ledger_stats(self) -> dict:
         entries, errors, options_map = self.load_entries()
-        default_accounts = self.get_default_accounts()
+        current_conversions_account = self.get_default_accounts()['current_conversions']
         
         # 分析账户情况
         all_accounts = set()
-        equity_accounts = []
-        conversion_accounts = []
+        equity_accounts = set()
+        conversion_accounts = set()
         currencies = set()
         multi_currency_transactions = 0
+        conversion_entries_count = 0
         
         for entry in entries:
             if hasattr(entry, 'postings'):
                 entry_currencies = set()
+                uses_current_conversions = False
                 for posting in entry.postings:
+                    if posting.account == current_conversions_account:
+                        uses_current_conversions = True
                     if posting.units:
                         all_accounts.add(posting.account)
                         currencies.add(posting.units.currency)
                         entry_currencies.add(posting.units.currency)
                         
                         if posting.account.startswith('Equity:'):
-                            equity_accounts.append(posting.account)
+                            equity_accounts.add(posting.account)
                         if 'Conversions' in posting.account:
-                            conversion_accounts.append(posting.account)
+                            conversion_accounts.add(posting.account)
                 
                 if len(entry_currencies) > 1:
                     multi_currency_transactions += 1
+                if uses_current_conversions:
+                    conversion_entries_count += 1
+        
+        return {
+            'total_accounts': len(all_accounts),
+            'equity_accounts': frozenset(equity_accounts),
+            'conversion_accounts': frozenset(conversion_accounts),
+            'currencies': frozenset(currencies),
+            'multi_currency_transactions': multi_currency_transactions,
+            'conversion_entries_count': conversion_entries_count
+        }
+    
+    def get_account_configuration(self) -> dict:
+        """获取账户配置信息，用于调试和验证"""
+        entries, errors, options_map = self.load_entries()
+        default_accounts = self.get_default_accounts()
+        stats = self.get_ledger_stats()
         
         return {
             'default_currency': options_map.get('operating_currency', ['CNY'])[0],
@@ -104,33 +539,26 @@ class LedgerLoader:
             'conversion_currency': options_map.get('conversion_currency', 'USD'),
             # 调试信息
             'debug_info': {
-                'total_accounts': len(all_accounts),
-                'equity_accounts': list(set(equity_accounts)),
-                'conversion_accounts': list(set(conversion_accounts)),
-                'currencies': list(currencies),
-                'multi_currency_transactions': multi_currency_transactions,
-                'has_conversions_current': default_accounts['current_conversions'] in conversion_accounts
+                'total_accounts': stats['total_accounts'],
+                'equity_accounts': list(stats['equity_accounts']),
+                'conversion_accounts': list(stats['conversion_accounts']),
+                'currencies': list(stats['currencies']),
+                'multi_currency_transactions': stats['multi_currency_transactions'],
+                'has_conversions_current': default_accounts['current_conversions'] in stats['conversion_accounts']
             }
         }
     
     def get_conversion_account_info(self) -> dict:
         """获取转换账户的说明信息"""
-        entries, errors, options_map = self.load_entries()
         default_accounts = self.get_default_accounts()
         
         # 检查实际的转换账户使用情况
-        conversion_entries = []
-        for entry in entries:
-            if hasattr(entry, 'postings'):
-                for posting in entry.postings:
-                    if posting.account == default_accounts['current_conversions']:
-                        conversion_entries.append(entry)
-                        break
+        conversion_entries_count = self.get_ledger_stats()['conversion_entries_count']
         
         return {
             'current_conversions_account': default_accounts['current_conversions'],
-            'account_exists_in_data': len(conversion_entries) > 0,
-            'conversion_entries_count': len(conversion_entries),
+            'account_exists_in_data': conversion_entries_count > 0,
+            'conversion_entries_count': conversion_entries_count,
             'explanation': {
                 'when_created': [
                     '存在多币种交易需要平衡时',
@@ -12,6 +12,7 @@ import logging
 from app.core.config import settings
 from app.models.schemas import PriceEntry, PriceFilter
 from app.services.ledger_loader import LedgerLoader
+from app.utils.write_lock import ledger_write_lock
 
 logger = logging.getLogger(__name__)
 
@@ -36,50 +37,51 @@ class LedgerOptionsService:
     def update_operating_currency(self, new_currency: str) -> bool:
         """更新主币种"""
         try:
-            # 验证货币代码格式
-            if not self._validate_currency_code(new_currency):
-                raise ValueError(f"无效的货币代码: {new_currency}")
-            
-            # 读取主文件内容
-            if not self.main_file.exists():
-                raise FileNotFoundError(f"主文件不存在: {self.main_file}")
-            
-            with open(self.main_file, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            
-            # 查找并更新 operating_currency 行
-            updated = False
-            operating_currency_pattern = re.compile(r'^option\s+"operating_currency"\s+"([^"]+)"')
-            
-            for i, line in enumerate(lines):
-                match = operating_currency_pattern.match(line.strip())
-                if match:
-                    lines[i] = f'option "operating_currency" "{new_currency}"\n'
-                    updated = True
-                    break
-            
-            # 如果没有找到，在文件开头添加
-            if not updated:
-                # 找到合适的位置插入（在其他 option 之后，在 include 之前）
-                insert_pos = 0
+            with ledger_write_lock:
+                # 验证货币代码格式
+                if not self._validate_currency_code(new_currency):
+                    raise ValueError(f"无效的货币代码: {new_currency}")
+                
+                # 读取主文件内容
+                if not self.main_file.exists():
+                    raise FileNotFoundError(f"主文件不存在: {self.main_file}")
+                
+                with open(self.main_file, 'r', encoding='utf-8') as f:
+                    lines = f.readlines()
+                
+                # 查找并更新 operating_currency 行
+                updated = False
+                operating_currency_pattern = re.compile(r'^option\s+"operating_currency"\s+"([^"]+)"')
+                
                 for i, line in enumerate(lines):
-                    if line.strip().startswith('option '):
-                        insert_pos = i + 1
-                    elif line.strip().startswith('include ') and insert_pos == 0:
-                        insert_pos = i
+                    match = operating_currency_pattern.match(line.strip())
+                    if match:
+                        lines[i] = f'option "operating_currency" "{new_currency}"\n'
+                        updated = True
                         break
                 
-                lines.insert(insert_pos, f'option "operating_currency" "{new_currency}"\n')
-            
-            # 写回文件
-            with open(self.main_file, 'w', encoding='utf-8') as f:
-                f.writelines(lines)
-            
-            # 重新加载账本
-            self.ledger_loader.load_entries(force_reload=True)
-            
-            logger.info(f"成功更新主币种为: {new_currency}")
-            return True
+                # 如果没有找到，在文件开头添加
+                if not updated:
+                    # 找到合适的位置插入（在其他 option 之后，在 include 之前）
+                    insert_pos = 0
+                    for i, line in enumerate(lines):
+                        if line.strip().startswith('option '):
+                            insert_pos = i + 1
+                        elif line.strip().startswith('include ') and insert_pos == 0:
+                            insert_pos = i
+                            break
+                
+                    lines.insert(insert_pos, f'option "operating_currency" "{new_currency}"\n')
+                
+                # 写回文件
+                with open(self.main_file, 'w', encoding='utf-8') as f:
+                    f.writelines(lines)
+                
+                # 重新加载账本
+                self.ledger_loader.load_entries(force_reload=True)
+                
+                logger.info(f"成功更新主币种为: {new_currency}")
+                return True
             
         except Exception as e:
             logger.error(f"更新主币种失败: {e}")
@@ -115,56 +117,57 @@ class LedgerOptionsService:
                   to_currency: Optional[str] = None, rate: Decimal = None) -> bool:
         """添加或更新价格"""
         try:
-            # 验证参数
-            if not self._validate_currency_code(from_currency):
-                raise ValueError(f"无效的源货币代码: {from_currency}")
-            
-            if to_currency is None:
-                to_currency = self.get_operating_currency()
-            
-            if not self._validate_currency_code(to_currency):
-                raise ValueError(f"无效的目标货币代码: {to_currency}")
-            
-            if rate <= 0:
-                raise ValueError("汇率必须大于0")
-            
-            # 禁止主币→主币且汇率不为1
-            if from_currency == to_currency and rate != 1:
-                raise ValueError("同一货币的汇率必须为1")
-            
-            # 格式化价格行
-            price_line = f'{date_} price {from_currency} {rate:.4f} {to_currency}\n'
-            
-            # 查找合适的文件添加价格
-            target_file = self._find_or_create_price_file(date_.year)
-            
-            # 读取文件内容
-            with open(target_file, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            
-            # 查找是否已存在同日期同货币对的价格
-            existing_line_index = self._find_existing_price_line(
-                lines, date_, from_currency, to_currency
-            )
-            
-            if existing_line_index is not None:
-                # 替换现有行
-                lines[existing_line_index] = price_line
-                logger.info(f"更新价格: {date_} {from_currency} -> {to_currency}")
-            else:
-                # 找到合适位置插入（按日期排序）
-                insert_pos = self._find_price_insert_position(lines, date_)
-                lines.insert(insert_pos, price_line)
-                logger.info(f"添加价格: {date_} {from_currency} -> {to_currency}")
-            
-            # 写回文件
-            with open(target_file, 'w', encoding='utf-8') as f:
-                f.writelines(lines)
-            
-            # 重新加载账本
-            self.ledger_loader.load_entries(force_reload=True)
-            
-            return True
+            with ledger_write_lock:
+                # 验证参数
+                if not self._validate_currency_code(from_currency):
+                    raise ValueError(f"无效的源货币代码: {from_currency}")
+                
+                if to_currency is None:
+                    to_currency = self.get_operating_currency()
+                
+                if not self._validate_currency_code(to_currency):
+                    raise ValueError(f"无效的目标货币代码: {to_currency}")
+                
+                if rate <= 0:
+                    raise ValueError("汇率必须大于0")
+                
+                # 禁止主币→主币且汇率不为1
+                if from_currency == to_currency and rate != 1:
+                    raise ValueError("同一货币的汇率必须为1")
+                
+                # 格式化价格行
+                price_line = f'{date_} price {from_currency} {rate:.4f} {to_currency}\n'
+                
+                # 查找合适的文件添加价格
+                target_file = self._find_or_create_price_file(date_.year)
+                
+                # 读取文件内容
+                with open(target_file, 'r', encoding='utf-8') as f:
+                    lines = f.readlines()
+                
+                # 查找是否已存在同日期同货币对的价格
+                existing_line_index = self._find_existing_price_line(
+                    lines, date_, from_currency, to_currency
+                )
+                
+                if existing_line_index is not None:
+                    # 替换现有行
+                    lines[existing_line_index] = price_line
+                    logger.info(f"更新价格: {date_} {from_currency} -> {to_currency}")
+                else:
+                    # 找到合适位置插入（按日期排序）
+                    insert_pos = self._find_price_insert_position(lines, date_)
+                    lines.insert(insert_pos, price_line)
+                    logger.info(f"添加价格: {date_} {from_currency} -> {to_currency}")
+                
+                # 写回文件
+                with open(target_file, 'w', encoding='utf-8') as f:
+                    f.writelines(lines)
+                
+                # 重新加载账本
+                self.ledger_loader.load_entries(force_reload=True)
+                
+                return True
             
         except Exception as e:
             logger.error(f"添加价格失败: {e}")
@@ -342,17 +345,18 @@ class LedgerOptionsService:
             return False
         
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            
-            line_index = self._find_existing_price_line(lines, date_, from_currency, to_currency)
-            if line_index is not None:
-                lines.pop(line_index)
+            with ledger_write_lock:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    lines = f.readlines()
                 
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.writelines(lines)
+                line_index = self._find_existing_price_line(lines, date_, from_currency, to_currency)
+                if line_index is not None:
+                    lines.pop(line_index)
                 
-                return True
+                    with open(file_path, 'w', encoding='utf-8') as f:
+                        f.writelines(lines)
+                
+                    return True
             
         except Exception as e:
             logger.error(f"从文件删除价格失败 {file_path}: {e}")
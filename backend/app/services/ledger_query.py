@@ -2,18 +2,30 @@
 账本查询服务
 负责数据查询、筛选和基本数据操作
 """
+import os
 from beancount.core.data import Transaction
-from beancount.core import getters
 from datetime import date
 from typing import List, Optional, Dict, Any
 from decimal import Decimal
 
 from app.models.schemas import (
-    TransactionResponse, AccountInfo, TransactionFilter, PostingBase
+    TransactionResponse, AccountInfo, TransactionFilter, PostingBase,
+    AccountRegisterItem, AccountRegisterResponse
 )
 from .exchange_service import ExchangeService
 from .ledger_options_service import LedgerOptionsService
 
+# 五类根账户
+ACCOUNT_TYPES = frozenset(['Assets', 'Liabilities', 'Equity', 'Income', 'Expenses'])
+
+# 判断交易类型时各类账户的归类
+TRANSACTION_ACCOUNT_TYPES = {
+    'Income': 'income',
+    'Expenses': 'expense',
+    'Assets': 'asset_liability',
+    'Liabilities': 'asset_liability',
+}
+
 
 class LedgerQuery:
     """账本查询服务"""
@@ -27,6 +39,12 @@ class LedgerQuery:
         """获取交易列表"""
         entries, _, _ = self.loader.load_entries()
 
+        # 账户筛选：名称包含关键词的账户是若干棵完整子树，转换为编号区间后只需整数比较
+        account_ranges = None
+        if filter_params and filter_params.account:
+            account_index = self.loader.get_account_index()
+            account_ranges = account_index.match_ranges(filter_params.account)
+
         transactions = []
         for entry in entries:
             if isinstance(entry, Transaction):
@@ -54,8 +72,8 @@ class LedgerQuery:
                         if filter_params.narration and filter_params.narration.lower() not in entry.narration.lower():
                             continue
 
-                    if filter_params.account:
-                        account_match = any(filter_params.account in posting.account
+                    if account_ranges is not None:
+                        account_match = any(account_index.in_ranges(account_index.id_of(posting.account), account_ranges)
                                           for posting in entry.postings)
                         if not account_match:
                             continue
@@ -86,7 +104,6 @@ class LedgerQuery:
                     entry_lineno = entry.meta.get('lineno') if entry.meta else None
                     
                     if entry_filename and entry_lineno:
-                        import os
                         entry_basename = os.path.basename(entry_filename)
                         if entry_basename == filename and entry_lineno == lineno:
                             # 找到匹配的交易，转换为响应格式
@@ -100,45 +117,84 @@ class LedgerQuery:
     
     def get_all_accounts(self) -> List[str]:
         """获取所有账户列表（包括所有类型的账户）"""
-        entries, _, _ = self.loader.load_entries()
-        
-        # 使用Beancount的内置方法获取所有账户
-        # 这会获取所有在任何条目中出现的账户，包括Open、Transaction等
-        all_accounts = getters.get_accounts(entries)
-        
-        return sorted(list(all_accounts))
+        # 所有在任何条目中出现的账户，包括Open、Transaction等
+        return self.loader.get_account_lifecycle().all_accounts()
     
     def get_archived_accounts(self) -> List[str]:
         """获取已归档的账户列表"""
-        entries, _, _ = self.loader.load_entries()
-        
-        # 获取已关闭的账户
-        from beancount.core.data import Close
-        closed_accounts = set()
-        for entry in entries:
-            if isinstance(entry, Close):
-                closed_accounts.add(entry.account)
-        
-        return sorted(list(closed_accounts))
+        return self.loader.get_account_lifecycle().archived_accounts()
     
     def get_active_accounts(self) -> List[str]:
         """获取活跃账户列表（排除已归档的账户）"""
-        entries, _, _ = self.loader.load_entries()
+        return self.loader.get_account_lifecycle().active_accounts()
+    
+    def get_account_stats(self, account: str) -> Optional[Dict[str, Any]]:
+        """获取账户的生命周期信息和记账行统计，账户不存在时返回 None"""
+        lifecycle = self.loader.get_account_lifecycle()
+        info = lifecycle.get(account)
+        if info is None:
+            return None
         
-        # 获取所有账户
-        all_accounts = getters.get_accounts(entries)
+        stats = info.to_dict()
+        stats['is_closed'] = info.is_closed
+        # 层级索引包含补齐的中间层级名称，只统计账本中实际存在的子账户
+        stats['subaccount_count'] = sum(
+            1 for name in self.loader.get_account_index().subtree_accounts(account)
+            if name != account and name in lifecycle
+        )
+        return stats
+    
+    def get_account_register(self, account: str, page: int = 1, page_size: int = 50,
+                             start_date: Optional[date] = None, end_date: Optional[date] = None,
+                             reverse: bool = True) -> Optional[AccountRegisterResponse]:
+        """
+        获取账户明细（分页），累计余额直接取自记账行索引
         
-        # 获取已关闭的账户
-        from beancount.core.data import Close
-        closed_accounts = set()
-        for entry in entries:
-            if isinstance(entry, Close):
-                closed_accounts.add(entry.account)
+        reverse 为 True 时按时间倒序返回；账户不存在时返回 None。
+        """
+        if account not in self.loader.get_account_lifecycle():
+            return None
         
-        # 过滤掉已关闭的账户
-        active_accounts = [account for account in all_accounts if account not in closed_accounts]
+        posting_index = self.loader.get_posting_index()
+        postings = posting_index.get(account)
+        start, end = postings.date_range(start_date, end_date) if postings else (0, 0)
+        total = end - start
         
-        return sorted(active_accounts)
+        offset = (page - 1) * page_size
+        if reverse:
+            positions = range(end - 1 - offset, max(start, end - offset - page_size) - 1, -1)
+        else:
+            positions = range(start + offset, min(end, start + offset + page_size))
+        
+        items = []
+        for position in positions:
+            entry = posting_index.entries[postings.entry_indices[position]]
+            filename = entry.meta.get('filename') if entry.meta else None
+            lineno = entry.meta.get('lineno') if entry.meta else None
+            items.append(AccountRegisterItem(
+                date=postings.dates[position],
+                flag=entry.flag,
+                payee=entry.payee,
+                narration=entry.narration,
+                amount=postings.numbers[position],
+                currency=postings.currencies[position],
+                balance=postings.balances[position],
+                other_accounts=list(dict.fromkeys(
+                    posting.account for posting in entry.postings if posting.account != account
+                )),
+                filename=filename,
+                lineno=lineno,
+                transaction_id=f"{os.path.basename(filename)}:{lineno}" if filename and lineno else None
+            ))
+        
+        return AccountRegisterResponse(
+            account=account,
+            data=items,
+            total=total,
+            page=page,
+            page_size=page_size,
+            total_pages=(total + page_size - 1) // page_size
+        )
     
     def get_all_payees(self) -> List[str]:
         """获取所有收付方列表"""
@@ -205,7 +261,6 @@ class LedgerQuery:
         transaction_id = None
         if filename and lineno:
             # 使用相对路径和行号组成唯一ID
-            import os
             relative_filename = os.path.basename(filename) if filename else 'unknown'
             transaction_id = f"{relative_filename}:{lineno}"
         
@@ -227,14 +282,7 @@ class LedgerQuery:
         # 检查所有posting的账户类型
         account_types = set()
         for posting in entry.postings:
-            if posting.account.startswith('Income:'):
-                account_types.add('income')
-            elif posting.account.startswith('Expenses:'):
-                account_types.add('expense')
-            elif posting.account.startswith('Assets:') or posting.account.startswith('Liabilities:'):
-                account_types.add('asset_liability')
-            else:
-                account_types.add('other')
+            account_types.add(TRANSACTION_ACCOUNT_TYPES.get(self.get_account_type(posting.account), 'other'))
         
         # 根据账户类型组合判断交易类型
         if 'income' in account_types:
@@ -251,15 +299,7 @@ class LedgerQuery:
     @staticmethod
     def get_account_type(account: str) -> str:
         """获取账户类型"""
-        if account.startswith('Assets:'):
-            return 'Assets'
-        elif account.startswith('Liabilities:'):
-            return 'Liabilities'
-        elif account.startswith('Equity:'):
-            return 'Equity'
-        elif account.startswith('Income:'):
-            return 'Income'
-        elif account.startswith('Expenses:'):
-            return 'Expenses'
-        else:
-            return 'Other'
+        root, separator, _ = account.partition(':')
+        if separator and root in ACCOUNT_TYPES:
+            return root
+        return 'Other'
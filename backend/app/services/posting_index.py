@@ -0,0 +1,70 @@
+"""
+账户记账行索引
+按账户记录每条记账行所在的条目位置、日期、金额和记账后的累计余额
+"""
+from bisect import bisect_left, bisect_right
+from datetime import date
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from beancount.core.data import Transaction
+
+
+class AccountPostings:
+    """
+    单个账户的记账行（按账本顺序）
+
+    各字段为等长的并列列表，balances[i] 为第 i 条记账行记账后该币种的累计余额，
+    因此任意一页的余额都可以直接读取，无需从头累加。
+    """
+
+    __slots__ = ('entry_indices', 'dates', 'currencies', 'numbers', 'balances')
+
+    def __init__(self):
+        self.entry_indices: List[int] = []
+        self.dates: List[date] = []
+        self.currencies: List[str] = []
+        self.numbers: List[Decimal] = []
+        self.balances: List[Decimal] = []
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def date_range(self, start_date: Optional[date] = None, end_date: Optional[date] = None) -> Tuple[int, int]:
+        """获取日期范围内的记账行位置区间（左闭右开），记账行按日期有序，二分查找即可"""
+        start = bisect_left(self.dates, start_date) if start_date else 0
+        end = bisect_right(self.dates, end_date) if end_date else len(self.dates)
+        return start, max(start, end)
+
+
+class PostingIndex:
+    """账户记账行索引，对账本只遍历一次"""
+
+    def __init__(self, entries: List[Any]):
+        self.entries = entries
+        self.accounts: Dict[str, AccountPostings] = {}
+
+        running: Dict[Tuple[str, str], Decimal] = {}
+        for entry_index, entry in enumerate(entries):
+            if not isinstance(entry, Transaction):
+                continue
+            for posting in entry.postings:
+                if not posting.units:
+                    continue
+                currency = posting.units.currency
+                number = posting.units.number
+                key = (posting.account, currency)
+                balance = running.get(key, Decimal('0')) + number
+                running[key] = balance
+
+                postings = self.accounts.get(posting.account)
+                if postings is None:
+                    postings = self.accounts[posting.account] = AccountPostings()
+                postings.entry_indices.append(entry_index)
+                postings.dates.append(entry.date)
+                postings.currencies.append(currency)
+                postings.numbers.append(number)
+                postings.balances.append(balance)
+
+    def get(self, account: str) -> Optional[AccountPostings]:
+        return self.accounts.get(account)
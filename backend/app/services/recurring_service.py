@@ -1,7 +1,7 @@
 import uuid
 import logging
 from datetime import date, datetime, timedelta
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
 from sqlalchemy.orm import Session
 from sqlalchemy import text
@@ -282,7 +282,12 @@ class RecurringTransactionService:
             raise
 
     def execute_pending_transactions(self, db: Session, execution_date: Optional[date] = None):
-        """执行待处理的周期记账"""
+        """
+        执行待处理的周期记账
+        
+        下次执行日期不晚于 execution_date 的周期记账按其计划日期（next_execution）记账和记录日志，
+        停机后补执行时日期与发生日期一致，之后的补记不会重复记账。
+        """
         if execution_date is None:
             execution_date = date.today()
         
@@ -301,85 +306,217 @@ class RecurringTransactionService:
         pending_transactions = query.all()
         logger.info(f"找到 {len(pending_transactions)} 个待执行的周期记账")
         
+        executed_count, failed_count, details = self._execute_occurrences(
+            db, [(transaction, transaction.next_execution) for transaction in pending_transactions]
+        )
+        
+        # 提交数据库更改
+        try:
+            db.commit()
+            logger.info("数据库提交成功")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"数据库提交失败: {str(e)}")
+            raise
+        
+        result = {
+            "success": failed_count == 0,
+            "message": f"执行完成，成功 {executed_count} 个，失败 {failed_count} 个",
+            "executed_count": executed_count,
+            "failed_count": failed_count,
+            "details": details
+        }
+        
+        logger.info(f"周期记账执行完成: {result}")
+        return result
+    
+    def _execute_occurrences(self, db: Session, occurrences: List[Tuple[RecurringModel, date]]) -> Tuple[int, int, List[dict]]:
+        """
+        批量执行周期记账的若干次发生
+        
+        所有交易一次校验、一次写入、一次重新加载，逐条记录执行日志，
+        并把成功执行的最晚日期记为 last_executed。调用方负责提交数据库。
+        """
         executed_count = 0
         failed_count = 0
         details = []
         
-        for transaction in pending_transactions:
-            logger.info(f"执行周期记账: {transaction.name} (ID: {transaction.id})")
-            execution_log = None
-            
+        # 1. 转换所有待执行的交易，转换失败的直接记为失败
+        batch = []
+        errors = {}
+        for index, (transaction, execution_date) in enumerate(occurrences):
+            logger.info(f"执行周期记账: {transaction.name} (ID: {transaction.id})，日期: {execution_date}")
             try:
-                # 2. 使用beancount_service创建交易
-                transaction_data = self._convert_to_beancount_transaction(transaction, execution_date)
-                success = beancount_service.add_transaction(transaction_data)
-                
-                if not success:
-                    raise Exception("写入账本文件失败")
-                
-                # 生成交易ID用于记录
-                created_transaction_id = f"recurring_{transaction.id}_{execution_date}"
-                
-                # 3. 更新执行记录
-                transaction.last_executed = execution_date
-                transaction.next_execution = self._calculate_next_execution(transaction)
-                
-                # 4. 创建执行日志（成功）
-                execution_log = RecurringExecutionLog(
+                batch.append((index, self._convert_to_beancount_transaction(transaction, execution_date)))
+            except Exception as e:
+                errors[index] = str(e)
+        
+        # 2. 一次校验、一次写入、一次重新加载
+        if batch:
+            try:
+                results = beancount_service.add_transactions_batch([data for _, data in batch])
+            except Exception as e:
+                results = [f"写入账本文件失败: {str(e)}"] * len(batch)
+            for (index, _), error in zip(batch, results):
+                if error:
+                    errors[index] = error
+        
+        executed = {}
+        for index, (transaction, execution_date) in enumerate(occurrences):
+            if index not in errors:
+                # 3. 创建执行日志（成功）
+                db.add(RecurringExecutionLog(
                     recurring_transaction_id=transaction.id,
                     execution_date=execution_date,
                     success=True,
-                    created_transaction_id=created_transaction_id
-                )
-                db.add(execution_log)
+                    created_transaction_id=f"recurring_{transaction.id}_{execution_date}"
+                ))
+                
+                if not transaction.last_executed or execution_date > transaction.last_executed:
+                    transaction.last_executed = execution_date
+                executed[transaction.id] = transaction
                 
                 executed_count += 1
                 details.append({
                     "name": transaction.name,
+                    "execution_date": str(execution_date),
                     "success": True,
                     "message": "执行成功"
                 })
-                logger.info(f"周期记账 {transaction.name} 执行成功，下次执行: {transaction.next_execution}")
-                
-            except Exception as e:
+            else:
                 failed_count += 1
-                error_msg = f"执行失败: {str(e)}"
+                error_msg = f"执行失败: {errors[index]}"
                 
-                # 4. 创建执行日志（失败）
-                execution_log = RecurringExecutionLog(
+                # 3. 创建执行日志（失败）
+                db.add(RecurringExecutionLog(
                     recurring_transaction_id=transaction.id,
                     execution_date=execution_date,
                     success=False,
                     error_message=error_msg
-                )
-                db.add(execution_log)
+                ))
                 
                 details.append({
                     "name": transaction.name,
+                    "execution_date": str(execution_date),
                     "success": False,
                     "message": error_msg
                 })
-                logger.error(f"周期记账 {transaction.name} 执行失败: {str(e)}")
+                logger.error(f"周期记账 {transaction.name} ({execution_date}) 执行失败: {errors[index]}")
+        
+        # 4. 更新下次执行日期
+        for transaction in executed.values():
+            transaction.next_execution = self._calculate_next_execution(transaction)
+            logger.info(f"周期记账 {transaction.name} 执行成功，下次执行: {transaction.next_execution}")
+        
+        return executed_count, failed_count, details
+    
+    def get_missed_occurrences(self, db: Session, until: Optional[date] = None,
+                               transaction_ids: Optional[List[int]] = None) -> List[Tuple[RecurringModel, List[date]]]:
+        """
+        计算启用的周期记账自上次执行以来错过的所有发生日期（含 until 当天）
+        
+        调度器按计划日期执行，last_executed 之后的发生日期都尚未记账；从未执行过的周期记账
+        从开始日期和创建日期中较晚者算起，创建之前的日期不算错过。已有成功执行日志的日期会被排除。
+        """
+        if until is None:
+            until = date.today()
+        
+        query = db.query(RecurringModel).filter(RecurringModel.is_active == True)
+        if transaction_ids:
+            query = query.filter(RecurringModel.id.in_(transaction_ids))
+        transactions = query.order_by(RecurringModel.id).all()
+        if not transactions:
+            return []
+        
+        executed_dates = {}
+        logs = db.query(RecurringExecutionLog.recurring_transaction_id, RecurringExecutionLog.execution_date).filter(
+            RecurringExecutionLog.success == True,
+            RecurringExecutionLog.recurring_transaction_id.in_([t.id for t in transactions])
+        ).all()
+        for transaction_id, execution_date in logs:
+            executed_dates.setdefault(transaction_id, set()).add(execution_date)
+        
+        result = []
+        for transaction in transactions:
+            # 与 _calculate_next_execution 一致：从上次执行日期（或开始日期）之后开始
+            after = transaction.last_executed
+            if after is None:
+                after = transaction.start_date
+                if transaction.created_at is not None:
+                    after = max(after, transaction.created_at.date() - timedelta(days=1))
+            end = min(until, transaction.end_date) if transaction.end_date else until
+            done = executed_dates.get(transaction.id, set())
+            dates = [d for d in self._occurrence_dates(transaction, after, end) if d not in done]
+            if dates:
+                result.append((transaction, dates))
+        return result
+    
+    def backfill_missed_transactions(self, db: Session, until: Optional[date] = None,
+                                     transaction_ids: Optional[List[int]] = None):
+        """补记错过的周期记账，所有交易一次写入、一次重新加载"""
+        missed = self.get_missed_occurrences(db, until, transaction_ids)
+        occurrences = [(transaction, d) for transaction, dates in missed for d in dates]
+        logger.info(f"开始补记周期记账，共 {len(occurrences)} 笔")
+        
+        executed_count, failed_count, details = self._execute_occurrences(db, occurrences)
         
-        # 提交数据库更改
         try:
             db.commit()
-            logger.info("数据库提交成功")
         except Exception as e:
             db.rollback()
             logger.error(f"数据库提交失败: {str(e)}")
             raise
         
-        result = {
+        return {
             "success": failed_count == 0,
-            "message": f"执行完成，成功 {executed_count} 个，失败 {failed_count} 个",
+            "message": f"补记完成，成功 {executed_count} 笔，失败 {failed_count} 笔",
             "executed_count": executed_count,
             "failed_count": failed_count,
             "details": details
         }
+    
+    def _occurrence_dates(self, transaction: RecurringModel, after: date, until: date) -> List[date]:
+        """
+        按日历直接计算 (after, until] 区间内的所有发生日期
         
-        logger.info(f"周期记账执行完成: {result}")
-        return result
+        按天、按周的规则用序数日期和步长生成，按月的规则逐月枚举指定日期，
+        不需要像 _calculate_next_execution 那样逐次推进。
+        """
+        import calendar
+        
+        if until <= after:
+            return []
+        
+        first, last = after.toordinal() + 1, until.toordinal()
+        recurrence_type = transaction.recurrence_type
+        
+        if recurrence_type == "daily":
+            ordinals = range(first, last + 1)
+        elif recurrence_type == "weekly" and not transaction.weekly_days:
+            ordinals = range(after.toordinal() + 7, last + 1, 7)
+        elif recurrence_type in ("weekly", "weekdays"):
+            weekdays = transaction.weekly_days if recurrence_type == "weekly" else [0, 1, 2, 3, 4]
+            # 从 first 所在周的周一开始，每个指定周几按 7 天步长生成
+            monday = first - date.fromordinal(first).weekday()
+            ordinals = sorted(
+                ordinal
+                for weekday in set(weekdays)
+                for ordinal in range(monday + weekday, last + 1, 7)
+                if ordinal >= first
+            )
+        elif recurrence_type == "monthly":
+            days = sorted(set(transaction.monthly_days or [after.day]))
+            dates = []
+            for month_index in range(after.year * 12 + after.month - 1, until.year * 12 + until.month):
+                year, month = divmod(month_index, 12)
+                max_day = calendar.monthrange(year, month + 1)[1]
+                dates.extend(date(year, month + 1, day) for day in days if day <= max_day)
+            return [d for d in dates if after < d <= until]
+        else:
+            logger.warning(f"未知的周期类型: {recurrence_type}")
+            return []
+        
+        return [date.fromordinal(ordinal) for ordinal in ordinals]
     
     def get_execution_logs(self, db: Session, transaction_id: Optional[int] = None, days: int = 30) -> List[RecurringExecutionLog]:
         """获取执行日志"""
@@ -2,18 +2,109 @@
 报表生成服务
 负责生成资产负债表、损益表等各类财务报表
 """
-from beancount.core.data import Transaction
-from beancount.ops.summarize import conversions
+from beancount.core.data import Price, Transaction
+from beancount.core import convert
+from bisect import bisect_right
+from collections import defaultdict
 from decimal import Decimal
-from datetime import date
-from typing import List, Dict, Any, Optional
+from calendar import monthrange
+from datetime import date, timedelta
+from typing import List, Dict, Any, Optional, Iterable, Tuple
 
-from app.models.schemas import BalanceResponse, IncomeStatement, AccountInfo
+from app.models.schemas import (
+    BalanceResponse, IncomeStatement, AccountInfo, AccountTreeNode, AccountTreeResponse,
+    NetWorthSeriesResponse
+)
 from app.core.config import settings
+from .account_index import AccountIndex
 from .exchange_service import ExchangeService
 from .ledger_query import LedgerQuery
 
 
+class PostingAggregates:
+    """
+    按边界日期分桶的分录发生额
+    
+    对账本只遍历一次，把每条分录累加到其日期所在的桶中；
+    之后任意期间发生额、截止日余额都可以由若干个桶相加得到，
+    用于一次请求生成多个报表时共享计算结果。
+    """
+    
+    def __init__(self, entries: List[Any], boundaries: Iterable[date]):
+        # 第 i 个桶覆盖 [boundaries[i-1], boundaries[i]) 的日期
+        self.boundaries = sorted(set(boundaries))
+        bucket_count = len(self.boundaries) + 1
+        self._units = [defaultdict(Decimal) for _ in range(bucket_count)]
+        self._costs = [defaultdict(Decimal) for _ in range(bucket_count)]
+        
+        for entry in entries:
+            if not isinstance(entry, Transaction):
+                continue
+            
+            bucket = self._bucket(entry.date)
+            units = self._units[bucket]
+            costs = self._costs[bucket]
+            for posting in entry.postings:
+                if posting.units:
+                    units[(posting.account, posting.units.currency)] += posting.units.number
+                    cost = convert.get_cost(posting)
+                    costs[cost.currency] += cost.number
+    
+    def _bucket(self, date_: date) -> int:
+        return bisect_right(self.boundaries, date_)
+    
+    @staticmethod
+    def _merge(buckets: List[Dict], result: Dict) -> Dict:
+        # 按桶的时间顺序合并，保持与逐条遍历一致的首次出现顺序
+        for bucket in buckets:
+            for key, amount in bucket.items():
+                result[key] = result.get(key, Decimal('0')) + amount
+        return result
+    
+    def period_balances(self, start_date: date, end_date: date) -> Dict[Tuple[str, str], Decimal]:
+        """期间 [start_date, end_date] 内的账户发生额，要求两端日期已作为边界"""
+        return self._merge(self._units[self._bucket(start_date):self._bucket(end_date) + 1], {})
+    
+    def balances_before(self, date_: date) -> Dict[Tuple[str, str], Decimal]:
+        """date_ 之前（不含当天）的账户余额"""
+        return self._merge(self._units[:self._bucket(date_ - timedelta(days=1)) + 1], {})
+    
+    def day_balances(self, date_: date) -> Dict[Tuple[str, str], Decimal]:
+        """date_ 当天的账户发生额"""
+        return dict(self._units[self._bucket(date_)])
+    
+    def cost_balance_before(self, date_: date) -> Dict[str, Decimal]:
+        """date_ 之前按成本计的各币种余额，对应 conversions() 生成的转换分录"""
+        return self._merge(self._costs[:self._bucket(date_ - timedelta(days=1)) + 1], {})
+
+
+# 时间序列最多的采样点数
+MAX_SERIES_POINTS = 3660
+
+
+def series_points(start_date: date, end_date: date, interval: str) -> List[date]:
+    """
+    生成时间序列的采样日期：每个周期的最后一天（周以周日结束），最后一个点为结束日期
+    """
+    points = []
+    current = start_date
+    while current < end_date:
+        if interval == "month":
+            point = current.replace(day=monthrange(current.year, current.month)[1])
+        elif interval == "week":
+            point = current + timedelta(days=6 - current.weekday())
+        else:
+            point = current
+        if point >= end_date:
+            break
+        points.append(point)
+        if len(points) > MAX_SERIES_POINTS:
+            raise ValueError(f"采样点过多（超过 {MAX_SERIES_POINTS} 个），请缩小日期范围或使用更大的间隔")
+        current = point + timedelta(days=1)
+    points.append(end_date)
+    return points
+
+
 class ReportGenerator:
     """报表生成器"""
     
@@ -31,16 +122,11 @@ class ReportGenerator:
         
         # 获取默认账户名称
         default_accounts = self.loader.get_default_accounts()
-        current_conversions_account = default_accounts['current_conversions']
         
-        # 运行beancount的转换处理，确保转换账户能够正确生成
-        conversion_currency = options_map.get('conversion_currency', 'CNY')
+        # 运行beancount的转换处理，确保转换账户能够正确生成（按快照和日期缓存）
+        conversion_currency = self._get_conversion_currency(options_map)
         
-        # 如果conversion_currency是'NOTHING'，使用operating_currency
-        if conversion_currency == 'NOTHING':
-            conversion_currency = options_map.get('operating_currency', ['CNY'])[0]
-        
-        entries = conversions(entries, current_conversions_account, conversion_currency, date_filter)
+        entries = self.loader.get_conversion_entries(date_filter, conversion_currency)
         
         # 获取默认货币
         default_currency = options_map.get('operating_currency', ['CNY'])[0]
@@ -48,6 +134,13 @@ class ReportGenerator:
         # 获取所有账户余额
         account_balances = self._calculate_account_balances(entries, date_filter, default_currency)
         
+        return self._build_balance_sheet(account_balances, entries, date_filter, default_currency, default_accounts)
+    
+    def _build_balance_sheet(self, account_balances: Dict, entries: List[Any], date_filter: date,
+                             default_currency: str, default_accounts: dict) -> BalanceResponse:
+        """根据账户余额构建资产负债表"""
+        current_conversions_account = default_accounts['current_conversions']
+        
         # 分类账户和计算收支
         assets, liabilities, equity, income_total, expense_total = self._categorize_accounts(
             account_balances, entries, date_filter, default_currency
@@ -97,6 +190,208 @@ class ReportGenerator:
             currency=default_currency
         )
     
+    def get_account_tree(self, date_filter: date, include_archived: bool = False) -> AccountTreeResponse:
+        """
+        获取截止日的账户余额树
+        
+        余额与资产负债表同口径（含转换分录），按账户层级索引自底向上汇总后，
+        每个节点按截止日汇率折算为主币种；已归档且余额为零的账户默认不返回。
+        """
+        _, _, options_map = self.loader.load_entries()
+        default_currency = options_map.get('operating_currency', ['CNY'])[0]
+        conversion_currency = self._get_conversion_currency(options_map)
+        entries = self.loader.get_conversion_entries(date_filter, conversion_currency)
+        
+        account_balances = self._calculate_account_balances(entries, date_filter, default_currency)
+        exchange_rates = self.exchange_service.get_latest_exchange_rates(entries, date_filter, default_currency)
+        lifecycle = self.loader.get_account_lifecycle()
+        
+        # 转换分录可能引入快照索引中没有的账户，此时为本次计算单独建立索引
+        account_index = self.loader.get_account_index()
+        if any(account not in account_index for account, _ in account_balances):
+            account_index = AccountIndex(list(account_index.names) + [account for account, _ in account_balances])
+        
+        rolled_up: Dict[int, Dict[str, Decimal]] = {}
+        for (account, currency), amount in account_index.rollup(account_balances).items():
+            if amount:
+                rolled_up.setdefault(account_index.ids[account], {})[currency] = amount
+        
+        # 子账户编号大于父账户：倒序确定需要返回的节点（自身可见或有可见的子账户）
+        # 没有 Open 指令的中间层级只在有可见的子账户（或自身有余额）时返回
+        visible = [False] * len(account_index)
+        for account_id in range(len(account_index) - 1, -1, -1):
+            if not visible[account_id]:
+                info = lifecycle.get(account_index.names[account_id])
+                if include_archived or account_id in rolled_up:
+                    visible[account_id] = True
+                elif info is not None:
+                    visible[account_id] = not info.is_closed
+            parent_id = account_index.parents[account_id]
+            if visible[account_id] and parent_id >= 0:
+                visible[parent_id] = True
+        
+        # 正序构建树：父节点总是先于子节点创建
+        unconverted = set()
+        nodes: Dict[int, AccountTreeNode] = {}
+        roots = []
+        for account_id, account in enumerate(account_index.names):
+            if not visible[account_id]:
+                continue
+            balances = rolled_up.get(account_id, {})
+            converted = Decimal('0')
+            for currency, amount in balances.items():
+                if currency in exchange_rates:
+                    converted += amount * exchange_rates[currency]
+                else:
+                    unconverted.add(currency)
+            info = lifecycle.get(account)
+            node = AccountTreeNode(
+                name=account.rsplit(':', 1)[-1],
+                account=account,
+                balance=converted,
+                balances=balances,
+                is_closed=info is not None and info.is_closed
+            )
+            nodes[account_id] = node
+            parent_id = account_index.parents[account_id]
+            if parent_id >= 0:
+                nodes[parent_id].children.append(node)
+            else:
+                roots.append(node)
+        
+        return AccountTreeResponse(
+            as_of_date=date_filter,
+            currency=default_currency,
+            roots=roots,
+            unconverted_currencies=sorted(unconverted)
+        )
+    
+    def get_net_worth_series(self, start_date: date, end_date: date, interval: str,
+                             account: Optional[str] = None) -> NetWorthSeriesResponse:
+        """
+        按时间顺序遍历账本一次，计算各采样日的资产、负债和净资产
+        
+        每个采样日使用当日生效的最新价格折算，口径与同一日期的资产负债表一致
+        （没有汇率的币种按原金额计入）。指定 account 时同时返回该账户及其子账户的折算余额。
+        """
+        entries, _, options_map = self.loader.load_entries()
+        default_currency = options_map.get('operating_currency', ['CNY'])[0]
+        points = series_points(start_date, end_date, interval)
+        
+        account_range = None
+        account_index = self.loader.get_account_index()
+        if account:
+            account_range = account_index.subtree_range(account)
+        
+        # 资产、负债和指定账户的各币种累计余额，以及各币种到主币种的最新汇率
+        assets: Dict[str, Decimal] = defaultdict(Decimal)
+        liabilities: Dict[str, Decimal] = defaultdict(Decimal)
+        selected: Dict[str, Decimal] = defaultdict(Decimal)
+        rates: Dict[str, Decimal] = {default_currency: Decimal('1')}
+        
+        def convert_total(balances: Dict[str, Decimal]) -> Decimal:
+            return sum((number * rates.get(currency, Decimal('1')) for currency, number in balances.items()),
+                       Decimal('0'))
+        
+        series = {'assets': [], 'liabilities': [], 'net_worth': [], 'account_balance': []}
+        
+        def emit():
+            total_assets = convert_total(assets)
+            total_liabilities = abs(convert_total(liabilities))
+            series['assets'].append(total_assets)
+            series['liabilities'].append(total_liabilities)
+            series['net_worth'].append(total_assets - total_liabilities)
+            if account:
+                series['account_balance'].append(convert_total(selected))
+        
+        point_index = 0
+        for entry in entries:
+            # 条目按日期排序：越过采样日时先输出该采样日的结果
+            while point_index < len(points) and entry.date > points[point_index]:
+                emit()
+                point_index += 1
+            if point_index == len(points):
+                break
+            
+            if isinstance(entry, Transaction):
+                for posting in entry.postings:
+                    if not posting.units:
+                        continue
+                    name = posting.account
+                    if name.startswith('Assets:'):
+                        assets[posting.units.currency] += posting.units.number
+                    elif name.startswith('Liabilities:'):
+                        liabilities[posting.units.currency] += posting.units.number
+                    if account_range is not None:
+                        account_id = account_index.id_of(name)
+                        if account_id is not None and account_range[0] <= account_id <= account_range[1]:
+                            selected[posting.units.currency] += posting.units.number
+            elif isinstance(entry, Price) and entry.amount.currency == default_currency:
+                rates[entry.currency] = entry.amount.number
+        
+        while point_index < len(points):
+            emit()
+            point_index += 1
+        
+        return NetWorthSeriesResponse(
+            interval=interval,
+            currency=default_currency,
+            dates=points,
+            assets=series['assets'],
+            liabilities=series['liabilities'],
+            net_worth=series['net_worth'],
+            account=account,
+            account_balance=series['account_balance'] if account else None
+        )
+    
+    def build_aggregates(self, income_periods: List[Tuple[date, date]], balance_dates: List[date]) -> PostingAggregates:
+        """一次遍历账本，生成多个报表共享的分桶发生额"""
+        entries, _, _ = self.loader.load_entries()
+        
+        boundaries = []
+        for start_date, end_date in income_periods:
+            boundaries.extend([start_date, end_date + timedelta(days=1)])
+        for date_filter in balance_dates:
+            boundaries.extend([date_filter, date_filter + timedelta(days=1)])
+        
+        return PostingAggregates(entries, boundaries)
+    
+    def get_balance_sheet_from_aggregates(self, aggregates: PostingAggregates, date_filter: date) -> BalanceResponse:
+        """基于共享发生额生成资产负债表，结果与 get_balance_sheet 一致"""
+        entries, _, options_map = self.loader.load_entries()
+        default_accounts = self.loader.get_default_accounts()
+        current_conversions_account = default_accounts['current_conversions']
+        default_currency = options_map.get('operating_currency', ['CNY'])[0]
+        
+        # 截止日前一天的余额
+        account_balances = aggregates.balances_before(date_filter)
+        
+        # 等价于 conversions() 插入在前一天末尾的转换分录
+        for currency, number in aggregates.cost_balance_before(date_filter).items():
+            if number:
+                key = (current_conversions_account, currency)
+                account_balances[key] = account_balances.get(key, Decimal('0')) - number
+        
+        # 截止日当天的发生额
+        for key, amount in aggregates.day_balances(date_filter).items():
+            account_balances[key] = account_balances.get(key, Decimal('0')) + amount
+        
+        # 确保所有已定义的账户都在余额字典中（即使余额为0）
+        for key in self._get_opened_account_keys(default_currency):
+            if key not in account_balances:
+                account_balances[key] = Decimal('0')
+        
+        return self._build_balance_sheet(account_balances, entries, date_filter, default_currency, default_accounts)
+    
+    def get_income_statement_from_aggregates(self, aggregates: PostingAggregates,
+                                             start_date: date, end_date: date) -> IncomeStatement:
+        """基于共享发生额生成损益表，结果与 get_income_statement 一致"""
+        entries, _, options_map = self.loader.load_entries()
+        default_currency = options_map.get('operating_currency', ['CNY'])[0]
+        
+        account_balances = aggregates.period_balances(start_date, end_date)
+        return self._build_income_statement(account_balances, entries, end_date, default_currency)
+    
     def get_income_statement(self, start_date: date, end_date: date) -> IncomeStatement:
         """获取损益表"""
         entries, _, options_map = self.loader.load_entries()
@@ -121,6 +416,11 @@ class ReportGenerator:
         
         default_currency = options_map.get('operating_currency', ['CNY'])[0]
         
+        return self._build_income_statement(account_balances, entries, end_date, default_currency)
+    
+    def _build_income_statement(self, account_balances: Dict, entries: List[Any], end_date: date,
+                                default_currency: str) -> IncomeStatement:
+        """根据期间发生额构建损益表"""
         # 获取汇率信息用于转换
         exchange_rates = self.exchange_service.get_latest_exchange_rates(entries, end_date, default_currency)
         
@@ -134,16 +434,17 @@ class ReportGenerator:
             if currency != default_currency and currency in exchange_rates:
                 converted_balance = balance * exchange_rates[currency]
             
+            account_type = self.query_service.get_account_type(account)
             account_info = AccountInfo(
                 name=account,
                 balance=converted_balance,
                 currency=default_currency,
-                account_type=self.query_service.get_account_type(account),
+                account_type=account_type,
                 original_balance=balance,
                 original_currency=currency
             )
             
-            if account.startswith('Income:'):
+            if account_type == 'Income':
                 # 合并同名收入账户
                 if account in merged_income_accounts:
                     merged_income_accounts[account].balance += converted_balance
@@ -153,7 +454,7 @@ class ReportGenerator:
                         merged_income_accounts[account].original_balance = None
                 else:
                     merged_income_accounts[account] = account_info
-            elif account.startswith('Expenses:'):
+            elif account_type == 'Expenses':
                 # 合并同名支出账户
                 if account in merged_expense_accounts:
                     merged_expense_accounts[account].balance += converted_balance
@@ -190,16 +491,7 @@ class ReportGenerator:
         account_balances = {}
         
         # 首先获取所有已定义的账户（通过Open指令）
-        all_opened_accounts = {}
-        for entry in entries:
-            if hasattr(entry, 'account') and hasattr(entry, 'currencies'):
-                # 这是一个Open指令
-                account = entry.account
-                currencies = entry.currencies or [default_currency]
-                for currency in currencies:
-                    key = (account, currency)
-                    if key not in all_opened_accounts:
-                        all_opened_accounts[key] = Decimal('0')
+        all_opened_accounts = self._get_opened_account_keys(default_currency)
         
         # 然后计算账户余额
         for entry in entries:
@@ -225,6 +517,24 @@ class ReportGenerator:
         
         return account_balances
     
+    def _get_opened_account_keys(self, default_currency: str) -> Dict:
+        """获取所有通过Open指令定义的 (账户, 币种)"""
+        all_opened_accounts = {}
+        for info in self.loader.get_account_lifecycle().opened_accounts():
+            for currency in info.currencies or [default_currency]:
+                all_opened_accounts[(info.account, currency)] = Decimal('0')
+        return all_opened_accounts
+    
+    @staticmethod
+    def _get_conversion_currency(options_map: dict) -> str:
+        """获取转换分录使用的币种"""
+        conversion_currency = options_map.get('conversion_currency', 'CNY')
+        
+        # 如果conversion_currency是'NOTHING'，使用operating_currency
+        if conversion_currency == 'NOTHING':
+            conversion_currency = options_map.get('operating_currency', ['CNY'])[0]
+        return conversion_currency
+    
     def _categorize_accounts(self, account_balances: Dict, entries: List[Any], date_filter: date, default_currency: str):
         """分类账户并计算收支"""
         assets = []
@@ -237,28 +547,29 @@ class ReportGenerator:
         exchange_rates = self.exchange_service.get_latest_exchange_rates(entries, date_filter, default_currency)
         
         for (account, currency), balance in account_balances.items():
+            account_type = self.query_service.get_account_type(account)
             account_info = AccountInfo(
                 name=account,
                 balance=balance,
                 currency=currency,
-                account_type=self.query_service.get_account_type(account),
+                account_type=account_type,
                 original_balance=balance,
                 original_currency=currency
             )
             
-            if account.startswith('Assets:'):
+            if account_type == 'Assets':
                 assets.append(account_info)
-            elif account.startswith('Liabilities:'):
+            elif account_type == 'Liabilities':
                 liabilities.append(account_info)
-            elif account.startswith('Equity:'):
+            elif account_type == 'Equity':
                 equity.append(account_info)
-            elif account.startswith('Income:'):
+            elif account_type == 'Income':
                 # 计算收入总额（用于当期收益计算）
                 if currency == default_currency:
                     income_total += balance
                 elif currency in exchange_rates:
                     income_total += balance * exchange_rates[currency]
-            elif account.startswith('Expenses:'):
+            elif account_type == 'Expenses':
                 # 计算支出总额（用于当期收益计算）
                 if currency == default_currency:
                     expense_total += balance
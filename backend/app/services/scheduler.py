@@ -1,9 +1,12 @@
+import asyncio
 import logging
 from datetime import datetime, timedelta
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.date import DateTrigger
 from app.services.recurring_service import recurring_service
+from app.services.warmup_service import warmup_service
+from app.services.beancount_service import beancount_service
 from app.core.config import settings
 from sqlalchemy.orm import Session
 
@@ -156,6 +159,38 @@ class RecurringTransactionScheduler:
         except Exception as e:
             logger.error(f"执行延迟同步任务时发生错误: {e}")
     
+    def schedule_warmup(self, delay_seconds: int = 0):
+        """安排后台预热任务，已有未执行的预热任务时重新计时
+        
+        Args:
+            delay_seconds: 延迟秒数
+        """
+        if not settings.warmup_enabled:
+            return
+        try:
+            run_time = datetime.now() + timedelta(seconds=delay_seconds)
+            self.scheduler.add_job(
+                func=self._execute_warmup,
+                trigger=DateTrigger(run_date=run_time),
+                id="ledger_warmup",
+                name="账本预热",
+                replace_existing=True
+            )
+            logger.info(f"已安排预热任务，将在 {delay_seconds} 秒后执行")
+        except Exception as e:
+            logger.error(f"安排预热任务失败: {e}")
+    
+    async def _execute_warmup(self):
+        """执行预热任务（在线程中运行，不阻塞事件循环）"""
+        try:
+            await asyncio.to_thread(warmup_service.warm_up)
+        except Exception as e:
+            logger.error(f"执行预热任务时发生错误: {e}")
+    
+    def on_ledger_reloaded(self):
+        """账本内容变化并重新加载后安排预热（交易写入、文件编辑、同步恢复等所有写入路径）"""
+        self.schedule_warmup(delay_seconds=settings.warmup_delay_seconds)
+    
     def cancel_delayed_sync(self):
         """取消延迟同步任务"""
         try:
@@ -170,4 +205,7 @@ class RecurringTransactionScheduler:
             return False
 
 # 创建全局调度器实例
-scheduler = RecurringTransactionScheduler() 
\ No newline at end of file
+scheduler = RecurringTransactionScheduler()
+
+# 账本重新加载后重新预热
+beancount_service.loader.add_reload_listener(scheduler.on_ledger_reloaded) 
\ No newline at end of file
@@ -4,9 +4,32 @@
 """
 import os
 import re
-from typing import Dict, Optional
+import threading
+from collections import defaultdict
+from decimal import Decimal
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
 from datetime import date
+from beancount.core.amount import Amount
 from beancount.core.data import Transaction
+from beancount.parser import parser
+
+from app.core.logging_config import get_logger
+from app.utils.write_lock import ledger_write_lock
+
+logger = get_logger(__name__)
+
+# 记账行变动：(日期, 账户, 币种, 金额)
+PostingDelta = Tuple[date, str, str, Decimal]
+
+
+class TransactionChange(NamedTuple):
+    """一次交易写入引起的记账行变动"""
+    removed: List[PostingDelta]
+    added: List[PostingDelta]
+    # 新增记账行的金额无法确定（多币种自动配平等）时为 False，监听者应全量刷新
+    complete: bool
+    previous_hash: Optional[str]
+    current_hash: Optional[str]
 
 
 class TransactionRepository:
@@ -18,15 +41,26 @@ class TransactionRepository:
         # 导入年份文件管理器
         from app.services.yearly_file_manager import yearly_file_manager
         self.yearly_file_manager = yearly_file_manager
+        # 交易写入后的变动监听者
+        self._change_listeners: List[Callable[[TransactionChange], None]] = []
+        # 已写入文件、等待重新加载后通知的变动
+        self._pending_changes: List[Tuple[int, TransactionChange]] = []
+        self._pending_lock = threading.Lock()
     
-    def add_transaction(self, transaction_data: Dict) -> bool:
-        """添加新交易到账本文件"""
+    def add_change_listener(self, listener: Callable[[TransactionChange], None]):
+        """注册交易变动监听者，交易增删改并重新加载账本后调用（合并窗口内的多次写入只通知一次）"""
+        self._change_listeners.append(listener)
+    
+    def add_transaction(self, transaction_data: Dict, transaction_str: Optional[str] = None) -> bool:
+        """添加新交易到账本文件，transaction_str 为已格式化好的交易内容"""
         try:
             # 构建交易字符串
-            transaction_str = self._build_transaction_string(transaction_data)
+            if transaction_str is None:
+                transaction_str = self._build_transaction_string(transaction_data)
             
             # 解析交易日期
             transaction_date = date.fromisoformat(transaction_data['date'])
+            previous_hash = self.loader.content_hash
             
             # 使用年份文件管理器将交易写入对应年份文件
             success = self.yearly_file_manager.add_transaction_to_yearly_file(
@@ -34,8 +68,8 @@ class TransactionRepository:
             )
             
             if success:
-                # 重新加载条目
-                self.loader.load_entries(force_reload=True)
+                # 安排重新加载条目
+                self._schedule_reload(None, [transaction_str], previous_hash)
                 return True
             else:
                 return False
@@ -44,117 +78,278 @@ class TransactionRepository:
             # Transaction addition failed
             return False
     
+    def add_transactions_batch(self, items: List[Tuple[Dict, Optional[str]]], validator) -> List[Optional[str]]:
+        """
+        批量添加交易
+        
+        所有交易先在同一个临时账本中校验一次，校验通过的交易按年份文件合并追加，
+        最后只重新加载一次账本。
+        
+        Args:
+            items: (交易数据, 已格式化的交易内容或 None) 列表
+            validator: TransactionValidator 实例
+            
+        Returns:
+            List[Optional[str]]: 每条交易的错误信息，None 表示成功
+        """
+        results: List[Optional[str]] = [None] * len(items)
+        prepared = []
+        for index, (transaction_data, transaction_str) in enumerate(items):
+            try:
+                if transaction_str is None:
+                    transaction_str = self._build_transaction_string(transaction_data)
+                prepared.append((index, date.fromisoformat(transaction_data['date']), transaction_str))
+            except Exception as e:
+                results[index] = f"构建交易失败: {str(e)}"
+        
+        if not prepared:
+            return results
+        
+        # 一次校验全部交易；快照与磁盘文件一致时直接用快照的错误作为对比基准，省去一次加载
+        try:
+            self.loader.flush_pending_reload()
+            base_errors = self.loader.load_entries()[1] if self.loader.is_snapshot_current() else None
+            validation_errors = validator.validate_transaction_strings(
+                [content for _, _, content in prepared], base_errors
+            )
+        except Exception as e:
+            logger.error(f"批量校验交易失败: {e}")
+            for index, _, _ in prepared:
+                results[index] = f"交易校验失败: {str(e)}"
+            return results
+        
+        valid = []
+        for (index, transaction_date, content), errors in zip(prepared, validation_errors):
+            if errors:
+                results[index] = "; ".join(errors)
+            else:
+                valid.append((index, transaction_date, content))
+        
+        if not valid:
+            return results
+        
+        previous_hash = self.loader.content_hash
+        written = self.yearly_file_manager.add_transactions_to_yearly_files(
+            [(transaction_date, content) for _, transaction_date, content in valid]
+        )
+        
+        added = []
+        for (index, _, content), success in zip(valid, written):
+            if success:
+                added.append(content)
+            else:
+                results[index] = "写入账本文件失败"
+        
+        if added:
+            # 安排重新加载条目
+            self._schedule_reload(None, added, previous_hash)
+        
+        return results
+    
     def update_transaction_by_location(self, filename: str, lineno: int, transaction_data: Dict) -> bool:
         """根据文件名和行号更新交易"""
         try:
-            # 首先找到要更新的交易
-            entries, _, _ = self.loader.load_entries()
-            target_entry = None
-            
-            for entry in entries:
-                if isinstance(entry, Transaction):
-                    entry_filename = entry.meta.get('filename') if entry.meta else None
-                    entry_lineno = entry.meta.get('lineno') if entry.meta else None
-                    
-                    if entry_filename and entry_lineno:
-                        entry_basename = os.path.basename(entry_filename)
-                        if entry_basename == filename and entry_lineno == lineno:
-                            target_entry = entry
-                            break
-            
-            if not target_entry:
-                return False
-            
-            # 读取原始文件内容
-            target_filename = target_entry.meta.get('filename')
-            if not target_filename:
+            # 定位、读取和写回期间持有写入锁，避免行号因其他写入而失效
+            with ledger_write_lock:
+                # 首先找到要更新的交易（先让尚未生效的写入生效，保证行号准确）
+                self.loader.flush_pending_reload()
+                entries, _, _ = self.loader.load_entries()
+                target_entry = None
+                
+                for entry in entries:
+                    if isinstance(entry, Transaction):
+                        entry_filename = entry.meta.get('filename') if entry.meta else None
+                        entry_lineno = entry.meta.get('lineno') if entry.meta else None
+                
+                        if entry_filename and entry_lineno:
+                            entry_basename = os.path.basename(entry_filename)
+                            if entry_basename == filename and entry_lineno == lineno:
+                                target_entry = entry
+                                break
+                
+                if not target_entry:
+                    return False
+                
+                # 读取原始文件内容
+                target_filename = target_entry.meta.get('filename')
+                if not target_filename:
+                    return False
+                previous_hash = self.loader.content_hash
+                
+                with open(target_filename, 'r', encoding='utf-8') as f:
+                    lines = f.readlines()
+                
+                # 构建新的交易字符串
+                new_transaction_str = self._build_transaction_string(transaction_data)
+                
+                # 找到交易的起始行和结束行
+                start_line, end_line = self._find_transaction_range(lines, lineno)
+                
+                # 替换整个交易块
+                if start_line < len(lines):
+                    # 删除原有的交易行
+                    del lines[start_line:end_line + 1]
+                
+                    # 在原位置插入新的交易内容
+                    new_lines = (new_transaction_str + '\n').split('\n')
+                    # 移除最后一个空行（split产生的）
+                    if new_lines and not new_lines[-1]:
+                        new_lines = new_lines[:-1]
+                
+                    for i, new_line in enumerate(new_lines):
+                        lines.insert(start_line + i, new_line + '\n')
+                
+                    # 写回文件
+                    with open(target_filename, 'w', encoding='utf-8') as f:
+                        f.writelines(lines)
+                
+                    # 安排重新加载条目
+                    self._schedule_reload(target_entry, [new_transaction_str], previous_hash)
+                    return True
+                
                 return False
             
-            with open(target_filename, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            
-            # 构建新的交易字符串
-            new_transaction_str = self._build_transaction_string(transaction_data)
-            
-            # 找到交易的起始行和结束行
-            start_line, end_line = self._find_transaction_range(lines, lineno)
-            
-            # 替换整个交易块
-            if start_line < len(lines):
-                # 删除原有的交易行
-                del lines[start_line:end_line + 1]
-                
-                # 在原位置插入新的交易内容
-                new_lines = (new_transaction_str + '\n').split('\n')
-                # 移除最后一个空行（split产生的）
-                if new_lines and not new_lines[-1]:
-                    new_lines = new_lines[:-1]
-                
-                for i, new_line in enumerate(new_lines):
-                    lines.insert(start_line + i, new_line + '\n')
-                
-                # 写回文件
-                with open(target_filename, 'w', encoding='utf-8') as f:
-                    f.writelines(lines)
-                
-                # 重新加载条目
-                self.loader.load_entries(force_reload=True)
-                return True
-            
-            return False
-            
         except Exception as e:
             return False
     
     def delete_transaction_by_location(self, filename: str, lineno: int) -> bool:
         """根据文件名和行号删除交易"""
         try:
-            # 首先找到要删除的交易
-            entries, _, _ = self.loader.load_entries()
-            target_entry = None
-            
-            for entry in entries:
-                if isinstance(entry, Transaction):
-                    entry_filename = entry.meta.get('filename') if entry.meta else None
-                    entry_lineno = entry.meta.get('lineno') if entry.meta else None
-                    
-                    if entry_filename and entry_lineno:
-                        entry_basename = os.path.basename(entry_filename)
-                        if entry_basename == filename and entry_lineno == lineno:
-                            target_entry = entry
-                            break
-            
-            if not target_entry:
-                return False
-            
-            # 读取原始文件内容
-            target_filename = target_entry.meta.get('filename')
-            if not target_filename:
+            # 定位、读取和写回期间持有写入锁，避免行号因其他写入而失效
+            with ledger_write_lock:
+                # 首先找到要删除的交易（先让尚未生效的写入生效，保证行号准确）
+                self.loader.flush_pending_reload()
+                entries, _, _ = self.loader.load_entries()
+                target_entry = None
+                
+                for entry in entries:
+                    if isinstance(entry, Transaction):
+                        entry_filename = entry.meta.get('filename') if entry.meta else None
+                        entry_lineno = entry.meta.get('lineno') if entry.meta else None
+                
+                        if entry_filename and entry_lineno:
+                            entry_basename = os.path.basename(entry_filename)
+                            if entry_basename == filename and entry_lineno == lineno:
+                                target_entry = entry
+                                break
+                
+                if not target_entry:
+                    return False
+                
+                # 读取原始文件内容
+                target_filename = target_entry.meta.get('filename')
+                if not target_filename:
+                    return False
+                previous_hash = self.loader.content_hash
+                
+                with open(target_filename, 'r', encoding='utf-8') as f:
+                    lines = f.readlines()
+                
+                # 找到交易的起始行和结束行
+                start_line, end_line = self._find_transaction_range(lines, lineno)
+                
+                # 直接删除整个交易块
+                if start_line < len(lines):
+                    # 删除交易的所有行
+                    del lines[start_line:end_line + 1]
+                
+                    # 写回文件
+                    with open(target_filename, 'w', encoding='utf-8') as f:
+                        f.writelines(lines)
+                
+                    # 安排重新加载条目
+                    self._schedule_reload(target_entry, None, previous_hash)
+                    return True
+                
                 return False
             
-            with open(target_filename, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
+        except Exception as e:
+            return False
+    
+    def _schedule_reload(self, removed_entry: Optional[Transaction], added_strs: Optional[List[str]],
+                         previous_hash: Optional[str]) -> int:
+        """记录本次写入的记账行变动（added_strs 为实际写入文件的交易内容）并安排合并重新加载，返回版本令牌"""
+        if self._change_listeners:
+            removed = []
+            if removed_entry is not None:
+                removed = [(removed_entry.date, posting.account, posting.units.currency, posting.units.number)
+                           for posting in removed_entry.postings if posting.units]
             
-            # 找到交易的起始行和结束行
-            start_line, end_line = self._find_transaction_range(lines, lineno)
+            added, complete = [], True
+            for transaction_str in added_strs or []:
+                postings, postings_complete = self._postings_from_text(transaction_str)
+                added.extend(postings)
+                complete = complete and postings_complete
             
-            # 直接删除整个交易块
-            if start_line < len(lines):
-                # 删除交易的所有行
-                del lines[start_line:end_line + 1]
-                
-                # 写回文件
-                with open(target_filename, 'w', encoding='utf-8') as f:
-                    f.writelines(lines)
-                
-                # 重新加载条目
-                self.loader.load_entries(force_reload=True)
-                return True
+            change = TransactionChange(removed, added, complete, previous_hash, None)
             
-            return False
+            def remember(token: int):
+                # 在任何加载开始前记录令牌，只有覆盖该令牌的加载才会通知这条变动
+                with self._pending_lock:
+                    self._pending_changes.append((token, change))
             
-        except Exception as e:
-            return False
+            return self.loader.schedule_reload(self._notify_changes, on_token=remember)
+        
+        return self.loader.schedule_reload()
+    
+    def _notify_changes(self, covered_seq: int, content_hash: Optional[str]):
+        """
+        重新加载完成后把该次加载覆盖的变动合并为一次通知，监听者异常不影响写入结果
+        
+        令牌大于 covered_seq 的写入不在该快照中，留给之后的加载通知。
+        """
+        with self._pending_lock:
+            pending = [change for token, change in self._pending_changes if token <= covered_seq]
+            self._pending_changes = [(token, change) for token, change in self._pending_changes if token > covered_seq]
+        if not pending:
+            return
+        
+        change = TransactionChange(
+            removed=[delta for item in pending for delta in item.removed],
+            added=[delta for item in pending for delta in item.added],
+            complete=all(item.complete for item in pending),
+            # 合并窗口内账本未重新加载，各次写入前的快照哈希相同
+            previous_hash=pending[0].previous_hash,
+            current_hash=content_hash
+        )
+        for listener in self._change_listeners:
+            try:
+                listener(change)
+            except Exception as e:
+                logger.warning(f"交易变动监听者处理失败: {e}")
+    
+    @staticmethod
+    def _postings_from_text(transaction_str: str) -> Tuple[List[PostingDelta], bool]:
+        """
+        从写入文件的交易内容中解析记账行，单币种时补全自动配平的金额
+        
+        金额取自实际写入的文本（格式化时可能已四舍五入），与重新加载后账本中的金额一致。
+        """
+        entries, errors, _ = parser.parse_string(transaction_str)
+        transactions = [entry for entry in entries if isinstance(entry, Transaction)]
+        if errors or len(transactions) != 1:
+            return [], False
+        
+        transaction = transactions[0]
+        postings = []
+        missing_accounts = []
+        totals = defaultdict(Decimal)
+        
+        for posting in transaction.postings:
+            units = posting.units
+            if not isinstance(units, Amount) or not isinstance(units.number, Decimal) or not isinstance(units.currency, str):
+                missing_accounts.append(posting.account)
+                continue
+            postings.append((transaction.date, posting.account, units.currency, units.number))
+            totals[units.currency] += units.number
+        
+        if not missing_accounts:
+            return postings, True
+        if len(missing_accounts) == 1 and len(totals) == 1:
+            currency, total = next(iter(totals.items()))
+            postings.append((transaction.date, missing_accounts[0], currency, -total))
+            return postings, True
+        return postings, False
     
     def _find_transaction_range(self, lines: list, lineno: int) -> tuple:
         """找到交易的起始行和结束行"""
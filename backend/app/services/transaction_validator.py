@@ -2,8 +2,12 @@
 交易验证服务
 负责交易数据的验证和错误处理
 """
-from typing import Dict, List
+import os
+from collections import Counter
+from datetime import date
+from typing import Dict, List, Optional, Tuple
 from beancount import loader
+from beancount.core.data import Balance
 
 from app.core.logging_config import get_logger
 
@@ -114,6 +118,117 @@ option "operating_currency" "CNY"
                 "transaction_str": ""
             }
     
+    def validate_transaction_strings(self, transaction_strs: List[str],
+                                     base_errors: Optional[List] = None) -> List[List[str]]:
+        """
+        在同一个临时账本中一次性校验多条交易
+        
+        所有交易追加到展开 include 后的账本末尾，只加载一次：
+        临时文件中交易所在行的错误归属到对应的交易；其他位置（包括被 include 的文件、
+        之后的 balance 断言）出现的错误与账本原有错误比较，新增的错误视为这批交易引起，
+        balance 断言错误计入日期在断言之前且涉及该账户的交易，其他错误计入所有交易。
+        
+        Args:
+            transaction_strs: 交易字符串列表
+            base_errors: 账本当前的错误列表（与磁盘文件一致的快照），为 None 时单独加载一次账本获取
+        
+        Returns:
+            List[List[str]]: 每条交易的友好错误信息，空列表表示校验通过
+        """
+        from app.core.config import settings
+        
+        main_file_path = settings.data_dir / settings.default_beancount_file
+        with open(main_file_path, 'r', encoding='utf-8') as f:
+            content = self._resolve_includes(f.read(), settings.data_dir)
+        
+        # 记录每条交易在临时文件中的行号范围（1 基）
+        lines = content.split('\n')
+        base_line_count = len(lines)
+        line_ranges = []
+        for transaction_str in transaction_strs:
+            lines.append('')
+            start_line = len(lines) + 1
+            lines.extend(transaction_str.split('\n'))
+            line_ranges.append((start_line, len(lines)))
+        
+        if base_errors is None:
+            base_errors, _ = self._load_temp_errors(settings.data_dir, lines[:base_line_count])
+        errors, temp_file = self._load_temp_errors(settings.data_dir, lines)
+        
+        results: List[List[str]] = [[] for _ in transaction_strs]
+        other_errors = []
+        for error in errors:
+            source = getattr(error, 'source', None)
+            source = source if isinstance(source, dict) else {}
+            filename, lineno = source.get('filename'), source.get('lineno')
+            index = None
+            if filename and lineno is not None and os.path.realpath(filename) == temp_file:
+                index = next((i for i, (start_line, end_line) in enumerate(line_ranges)
+                              if start_line <= lineno <= end_line), None)
+            if index is None:
+                other_errors.append(error)
+            else:
+                results[index].append(self._parse_validation_error(str(error)))
+        
+        # 账本原有的错误按 (类型, 消息) 抵消，剩下的是这批交易引起的错误
+        remaining = Counter(self._error_key(error) for error in base_errors)
+        transaction_dates = [self._transaction_date(transaction_str) for transaction_str in transaction_strs]
+        for error in other_errors:
+            key = self._error_key(error)
+            if remaining[key] > 0:
+                remaining[key] -= 1
+                continue
+            
+            message = self._parse_validation_error(str(error))
+            blamed = list(range(len(transaction_strs)))
+            entry = getattr(error, 'entry', None)
+            if isinstance(entry, Balance):
+                # balance 断言检查断言日期之前该账户（含子账户）的余额，只有更早且涉及该账户的交易会影响它
+                affecting = [
+                    index for index in blamed
+                    if (transaction_dates[index] is None or transaction_dates[index] < entry.date)
+                    and any(account == entry.account or account.startswith(entry.account + ':')
+                            for account in self._posting_accounts(transaction_strs[index]))
+                ]
+                blamed = affecting or blamed
+            for index in blamed:
+                results[index].append(message)
+        
+        return results
+    
+    def _load_temp_errors(self, data_dir, lines: List[str]) -> Tuple[List, str]:
+        """把内容写入数据目录下的临时文件并加载，返回错误列表和临时文件的规范化路径"""
+        import uuid
+        
+        temp_file_path = data_dir / f"temp_validation_{uuid.uuid4().hex[:8]}.beancount"
+        try:
+            with open(temp_file_path, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+            _, errors, _ = loader.load_file(str(temp_file_path))
+        finally:
+            if temp_file_path.exists():
+                temp_file_path.unlink()
+        return errors, os.path.realpath(str(temp_file_path))
+    
+    @staticmethod
+    def _error_key(error) -> Tuple[str, str]:
+        return type(error).__name__, str(getattr(error, 'message', error))
+    
+    @staticmethod
+    def _posting_accounts(transaction_str: str) -> List[str]:
+        """交易字符串中各分录的账户（缩进行的第一个字段）"""
+        return [
+            line.split(None, 1)[0] for line in transaction_str.split('\n')[1:]
+            if line[:1].isspace() and line.strip() and not line.strip().startswith(';')
+        ]
+    
+    @staticmethod
+    def _transaction_date(transaction_str: str) -> Optional[date]:
+        try:
+            return date.fromisoformat(transaction_str.split(None, 1)[0])
+        except (ValueError, IndexError):
+            return None
+    
     def _build_transaction_string(self, data: Dict) -> str:
         """构建交易字符串"""
         lines = []
@@ -222,34 +337,47 @@ option "operating_currency" "CNY"
             str: 解析后的内容
         """
         from pathlib import Path
-        lines = content.split('\n')
-        resolved_lines = []
-        
-        for line in lines:
-            stripped_line = line.strip()
-            if stripped_line.startswith('include '):
-                # 解析include指令
-                import re
-                match = re.match(r'include\s+["\']([^"\']+)["\']', stripped_line)
-                if match:
-                    include_filename = match.group(1)
-                    include_path = base_dir / include_filename
-                    
-                    if include_path.exists():
-                        try:
-                            with open(include_path, 'r', encoding='utf-8') as f:
-                                include_content = f.read()
-                            resolved_lines.append(f'; Contents from {include_filename}')
-                            resolved_lines.append(include_content)
-                        except Exception as e:
-                            logger.warning(f"Failed to read include file {include_filename}: {e}")
-                            resolved_lines.append(f'; Error reading {include_filename}')
-                    else:
-                        logger.warning(f"Include file not found: {include_filename}")
-                        resolved_lines.append(f'; Include file not found: {include_filename}')
-                else:
-                    resolved_lines.append(line)
+        from app.utils.include_graph import scan_include_directives
+
+        # 只在字节内容中定位 include 指令所在行，其余行原样保留
+        directives = scan_include_directives(content.encode('utf-8'), Path(base_dir))
+        if not directives:
+            return content
+
+        resolved_lines = content.split('\n')
+        for directive in directives:
+            include_filename = directive.target
+            include_path = directive.path
+
+            if include_path.exists():
+                try:
+                    with open(include_path, 'r', encoding='utf-8') as f:
+                        include_content = self._absolutize_includes(f.read(), include_path.parent)
+                    resolved_lines[directive.line_index] = f'; Contents from {include_filename}\n{include_content}'
+                except Exception as e:
+                    logger.warning(f"Failed to read include file {include_filename}: {e}")
+                    resolved_lines[directive.line_index] = f'; Error reading {include_filename}'
             else:
-                resolved_lines.append(line)
-        
+                logger.warning(f"Include file not found: {include_filename}")
+                resolved_lines[directive.line_index] = f'; Include file not found: {include_filename}'
+
         return '\n'.join(resolved_lines)
+
+    def _absolutize_includes(self, content: str, base_dir) -> str:
+        """
+        把被展开文件中的 include 指令改写为绝对路径
+        
+        展开后的内容位于临时文件中，相对路径会按临时文件所在目录解析，需要改为相对原文件所在目录。
+        """
+        from pathlib import Path
+        from app.utils.include_graph import scan_include_directives
+
+        directives = scan_include_directives(content.encode('utf-8'), Path(base_dir))
+        if not directives:
+            return content
+
+        lines = content.split('\n')
+        for directive in directives:
+            include_path = os.path.join(str(base_dir), directive.target)
+            lines[directive.line_index] = f'include "{include_path}"'
+        return '\n'.join(lines)
@@ -0,0 +1,122 @@
+"""
+预热服务
+启动时和账本重新加载后在后台加载账本、构建派生索引并预先计算仪表盘常用报表
+"""
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.logging_config import get_logger
+from app.services.beancount_service import beancount_service
+
+logger = get_logger(__name__)
+
+
+class WarmupService:
+    """
+    预热服务
+
+    预热结果都写入各自的缓存（快照派生缓存、报表缓存、预算状态物化表），
+    本服务只负责按顺序触发计算并记录状态，供 /api/health 报告就绪情况。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._status = "pending"
+        self._content_hash: Optional[str] = None
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+        self._duration: Optional[float] = None
+        self._steps: List[Tuple[str, float]] = []
+        self._error: Optional[str] = None
+
+    def warm_up(self):
+        """执行一次预热，同一时间只允许一个预热在运行"""
+        with self._run_lock:
+            started = time.time()
+            with self._lock:
+                self._status = "running"
+                self._started_at = started
+                self._error = None
+
+            steps = []
+            try:
+                for name, step in self._build_steps():
+                    step_started = time.perf_counter()
+                    step()
+                    steps.append((name, round((time.perf_counter() - step_started) * 1000, 2)))
+            except Exception as e:
+                logger.error(f"预热失败: {e}")
+                with self._lock:
+                    self._status = "failed"
+                    self._error = str(e)
+                    self._steps = steps
+                    self._finished_at = time.time()
+                    self._duration = round(self._finished_at - started, 3)
+                return
+
+            with self._lock:
+                self._status = "ready"
+                self._content_hash = beancount_service.loader.content_hash
+                self._steps = steps
+                self._finished_at = time.time()
+                self._duration = round(self._finished_at - started, 3)
+            logger.info(f"预热完成，耗时 {self._duration} 秒")
+
+    def get_status(self) -> dict:
+        """获取预热状态"""
+        with self._lock:
+            current_hash = beancount_service.loader.content_hash
+            return {
+                "status": self._status,
+                # 账本在预热完成后又发生了变化（等待下一次预热）时不算就绪
+                "ready": self._status == "ready" and self._content_hash == current_hash,
+                "content_hash": self._content_hash,
+                "started_at": self._started_at,
+                "finished_at": self._finished_at,
+                "duration_seconds": self._duration,
+                "steps": [{"name": name, "elapsed_ms": elapsed} for name, elapsed in self._steps],
+                "error": self._error
+            }
+
+    @staticmethod
+    def _build_steps() -> List[Tuple[str, Callable[[], object]]]:
+        """预热步骤：参数与仪表盘请求保持一致，才能命中同一缓存键"""
+        from app.database import SessionLocal
+        from app.routers.reports import _month_period, _trend_periods
+        from app.services.budget_service import BudgetService
+        from app.services.budget_status_service import budget_status_service
+
+        loader = beancount_service.loader
+        # 与报表接口的默认日期一致（按配置的时区），否则预热的缓存键不会被请求命中
+        today = settings.now().date()
+        _, _, month_start, month_end = _month_period(None, None)
+
+        def budgets():
+            db = SessionLocal()
+            try:
+                BudgetService(db).get_budget_summary("month")
+                budget_status_service.get_status(db)
+            finally:
+                db.close()
+
+        def trends():
+            for _, start_date, end_date in _trend_periods(12):
+                beancount_service.get_income_statement(start_date, end_date)
+
+        return [
+            ("load_ledger", loader.load_entries),
+            ("account_index", loader.get_account_index),
+            ("ledger_stats", loader.get_ledger_stats),
+            ("balance_sheet", lambda: beancount_service.get_balance_sheet(today)),
+            ("income_statement", lambda: beancount_service.get_income_statement(month_start, month_end)),
+            ("month_balance_sheet", lambda: beancount_service.get_balance_sheet(month_end)),
+            ("budget_summary", budgets),
+            ("trends", trends),
+        ]
+
+
+# 全局预热服务实例
+warmup_service = WarmupService()
@@ -9,6 +9,7 @@ import re
 
 from app.core.config import settings
 from app.core.logging_config import get_logger
+from app.utils.write_lock import ledger_write_lock
 from app.utils.file_utils import (
     get_yearly_filename,
     ensure_yearly_file_exists,
@@ -90,6 +91,39 @@ class YearlyFileManager:
             logger.error(f"Error adding transaction to yearly file: {e}")
             return False
     
+    def add_transactions_to_yearly_files(self, transactions: List[Tuple[date, str]]) -> List[bool]:
+        """
+        批量将交易添加到对应年份的文件中
+        
+        同一年份的交易合并为一次追加写入，不做逐条账本验证（由调用方统一验证）。
+        
+        Args:
+            transactions: (交易日期, 交易内容) 列表
+            
+        Returns:
+            List[bool]: 每条交易是否成功写入
+        """
+        results = [False] * len(transactions)
+        by_year = {}
+        for index, (transaction_date, _) in enumerate(transactions):
+            by_year.setdefault(transaction_date.year, []).append(index)
+        
+        for year, indexes in sorted(by_year.items()):
+            try:
+                yearly_file = self.ensure_yearly_file_exists(year)
+                content = '\n\n'.join(transactions[index][1] for index in indexes)
+                success = append_transaction_to_yearly_file(yearly_file, content)
+            except Exception as e:
+                logger.error(f"Error adding transactions to yearly file for {year}: {e}")
+                success = False
+            
+            if success:
+                logger.info(f"Successfully added {len(indexes)} transactions to {yearly_file.name}")
+            for index in indexes:
+                results[index] = success
+        
+        return results
+    
     def _validate_complete_ledger(self) -> bool:
         """
         验证完整账本的有效性
@@ -159,37 +193,38 @@ class YearlyFileManager:
             source_file = self.main_file
         
         try:
-            with open(source_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # 解析交易条目和剩余内容
-            transactions_by_year, remaining_content = self._parse_and_extract_transactions(content)
-            
-            if not transactions_by_year:
-                logger.info("No transactions found to migrate")
-                return True
-            
-            # 将交易迁移到对应年份文件
-            migration_success = True
-            for year, transactions in transactions_by_year.items():
-                yearly_file = self.ensure_yearly_file_exists(year)
+            with ledger_write_lock:
+                with open(source_file, 'r', encoding='utf-8') as f:
+                    content = f.read()
                 
-                for transaction in transactions:
-                    if not append_transaction_to_yearly_file(yearly_file, transaction):
-                        logger.error(f"Failed to append transaction to {yearly_file.name}")
-                        migration_success = False
-            
-            # 只有在所有交易都成功迁移后，才更新原文件
-            if migration_success:
-                with open(source_file, 'w', encoding='utf-8') as f:
-                    f.write(remaining_content)
+                # 解析交易条目和剩余内容
+                transactions_by_year, remaining_content = self._parse_and_extract_transactions(content)
                 
-                migrated_count = sum(len(transactions) for transactions in transactions_by_year.values())
-                logger.info(f"Successfully migrated {migrated_count} transactions from {source_file.name} to yearly files")
-                return True
-            else:
-                logger.error("Migration failed, original file unchanged")
-                return False
+                if not transactions_by_year:
+                    logger.info("No transactions found to migrate")
+                    return True
+                
+                # 将交易迁移到对应年份文件
+                migration_success = True
+                for year, transactions in transactions_by_year.items():
+                    yearly_file = self.ensure_yearly_file_exists(year)
+                
+                    for transaction in transactions:
+                        if not append_transaction_to_yearly_file(yearly_file, transaction):
+                            logger.error(f"Failed to append transaction to {yearly_file.name}")
+                            migration_success = False
+                
+                # 只有在所有交易都成功迁移后，才更新原文件
+                if migration_success:
+                    with open(source_file, 'w', encoding='utf-8') as f:
+                        f.write(remaining_content)
+                
+                    migrated_count = sum(len(transactions) for transactions in transactions_by_year.values())
+                    logger.info(f"Successfully migrated {migrated_count} transactions from {source_file.name} to yearly files")
+                    return True
+                else:
+                    logger.error("Migration failed, original file unchanged")
+                    return False
             
         except Exception as e:
             logger.error(f"Error migrating transactions by year: {e}")
@@ -298,18 +333,19 @@ class YearlyFileManager:
             yearly_file = self.data_dir / yearly_filename
             
             try:
-                with open(yearly_file, 'r', encoding='utf-8') as f:
-                    content = f.read().strip()
-                
-                # 检查文件是否只包含注释或为空
-                lines = [line.strip() for line in content.split('\n') if line.strip()]
-                non_comment_lines = [line for line in lines if not line.startswith(';')]
-                
-                if not non_comment_lines:
-                    # 文件为空或只有注释，可以删除
-                    yearly_file.unlink()
-                    cleaned_count += 1
-                    logger.info(f"Cleaned up empty yearly file: {yearly_filename}")
+                with ledger_write_lock:
+                    with open(yearly_file, 'r', encoding='utf-8') as f:
+                        content = f.read().strip()
+                    
+                    # 检查文件是否只包含注释或为空
+                    lines = [line.strip() for line in content.split('\n') if line.strip()]
+                    non_comment_lines = [line for line in lines if not line.startswith(';')]
+                    
+                    if not non_comment_lines:
+                        # 文件为空或只有注释，可以删除
+                        yearly_file.unlink()
+                        cleaned_count += 1
+                        logger.info(f"Cleaned up empty yearly file: {yearly_filename}")
                     
             except Exception as e:
                 logger.error(f"Error checking yearly file {yearly_filename}: {e}")
@@ -4,9 +4,12 @@
 """
 
 from pathlib import Path
-from typing import List, Dict, Set
+from typing import List, Dict
 import re
 
+from app.utils.include_graph import include_graph, scan_include_directives
+from app.utils.write_lock import ledger_write_lock
+
 # Beancount支持的文件扩展名
 BEANCOUNT_EXTENSIONS = ['.beancount', '.bean']
 
@@ -85,95 +88,22 @@ def parse_include_directives(content: str, base_dir: Path) -> List[Path]:
     Returns:
         List[Path]: 被包含的文件路径列表
     """
-    includes = []
-    # 匹配 include "path" 和 include 'path' 格式
-    include_pattern = r'^\s*include\s+["\']([^"\']+)["\']'
-    
-    for line in content.split('\n'):
-        match = re.match(include_pattern, line.strip())
-        if match:
-            include_path = match.group(1)
-            # 解析相对路径
-            full_path = base_dir / include_path
-            includes.append(full_path.resolve())
-    
-    return includes
+    return [directive.path for directive in scan_include_directives(content.encode('utf-8'), base_dir)]
 
 
-def build_file_tree(main_file: Path, visited: Set[Path] = None) -> Dict:
+def build_file_tree(main_file: Path) -> Dict:
     """
     构建Beancount文件的include依赖树
     
+    各文件的include指令由 include_graph 按文件大小和修改时间缓存，只有变化的文件会被重新扫描
+    
     Args:
         main_file: 主文件路径
-        visited: 已访问的文件集合，用于防止循环引用
         
     Returns:
         Dict: 文件树结构
     """
-    if visited is None:
-        visited = set()
-    
-    # 防止循环引用
-    if main_file in visited:
-        return {
-            "name": main_file.name,
-            "path": str(main_file),
-            "size": 0,
-            "type": "file",
-            "is_main": False,
-            "includes": [],
-            "error": "循环引用"
-        }
-    
-    visited.add(main_file)
-    
-    try:
-        stat = main_file.stat()
-        with open(main_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # 解析include指令
-        includes = parse_include_directives(content, main_file.parent)
-        
-        # 递归构建子文件树
-        children = []
-        for include_file in includes:
-            if include_file.exists():
-                child_tree = build_file_tree(include_file, visited.copy())
-                children.append(child_tree)
-            else:
-                # 文件不存在的情况
-                children.append({
-                    "name": include_file.name,
-                    "path": str(include_file),
-                    "size": 0,
-                    "type": "file",
-                    "is_main": False,
-                    "includes": [],
-                    "error": "文件不存在"
-                })
-        
-        return {
-            "name": main_file.name,
-            "path": str(main_file),
-            "size": stat.st_size,
-            "type": "file",
-            "is_main": True if main_file.name == "main.beancount" else False,
-            "includes": children,
-            "modified": stat.st_mtime
-        }
-        
-    except Exception as e:
-        return {
-            "name": main_file.name,
-            "path": str(main_file),
-            "size": 0,
-            "type": "file",
-            "is_main": False,
-            "includes": [],
-            "error": str(e)
-        }
+    return include_graph.build_tree(main_file)
 
 
 def get_all_included_files(main_file: Path) -> List[Path]:
@@ -186,29 +116,7 @@ def get_all_included_files(main_file: Path) -> List[Path]:
     Returns:
         List[Path]: 所有相关文件的路径列表
     """
-    all_files = []
-    visited = set()
-    
-    def collect_files(file_path: Path):
-        if file_path in visited or not file_path.exists():
-            return
-        
-        visited.add(file_path)
-        all_files.append(file_path)
-        
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            includes = parse_include_directives(content, file_path.parent)
-            for include_file in includes:
-                collect_files(include_file)
-        except Exception:
-            # 忽略读取错误，只收集能读取的文件
-            pass
-    
-    collect_files(main_file)
-    return all_files
+    return include_graph.get_all_files(main_file)
 
 
 def get_yearly_filename(year: int) -> str:
@@ -238,14 +146,15 @@ def ensure_yearly_file_exists(data_dir: Path, year: int) -> Path:
     yearly_filename = get_yearly_filename(year)
     yearly_file = data_dir / yearly_filename
     
-    if not yearly_file.exists():
-        # 创建年份文件
-        content = f"""; {year}年交易记录
+    with ledger_write_lock:
+        if not yearly_file.exists():
+            # 创建年份文件
+            content = f"""; {year}年交易记录
 ; 自动生成的年份文件
 
 """
-        with open(yearly_file, 'w', encoding='utf-8') as f:
-            f.write(content)
+            with open(yearly_file, 'w', encoding='utf-8') as f:
+                f.write(content)
     
     return yearly_file
 
@@ -262,48 +171,49 @@ def add_include_to_main_file(main_file: Path, include_filename: str) -> bool:
         bool: 是否成功添加
     """
     try:
-        with open(main_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # 检查是否已经存在该include
-        include_directive = f'include "{include_filename}"'
-        if include_directive in content:
-            return True  # 已存在，无需添加
-        
-        # 找到合适的位置插入include指令
-        lines = content.split('\n')
-        
-        # 找到现有include指令的位置
-        include_section_end = -1
-        for i, line in enumerate(lines):
-            if line.strip().startswith('include '):
-                include_section_end = i
-        
-        # 如果找到了include区域，在最后一个include后添加
-        if include_section_end >= 0:
-            lines.insert(include_section_end + 1, include_directive)
-        else:
-            # 如果没有include区域，在option后面添加
-            option_section_end = -1
+        with ledger_write_lock:
+            with open(main_file, 'r', encoding='utf-8') as f:
+                content = f.read()
+            
+            # 检查是否已经存在该include
+            include_directive = f'include "{include_filename}"'
+            if include_directive in content:
+                return True  # 已存在，无需添加
+            
+            # 找到合适的位置插入include指令
+            lines = content.split('\n')
+            
+            # 找到现有include指令的位置
+            include_section_end = -1
             for i, line in enumerate(lines):
-                if line.strip().startswith('option '):
-                    option_section_end = i
+                if line.strip().startswith('include '):
+                    include_section_end = i
             
-            if option_section_end >= 0:
-                # 在option区域后添加
-                lines.insert(option_section_end + 1, '')
-                lines.insert(option_section_end + 2, '; 年份文件引用')
-                lines.insert(option_section_end + 3, include_directive)
+            # 如果找到了include区域，在最后一个include后添加
+            if include_section_end >= 0:
+                lines.insert(include_section_end + 1, include_directive)
             else:
-                # 在文件开头添加
-                lines.insert(0, include_directive)
-                lines.insert(1, '')
-        
-        # 写回文件
-        with open(main_file, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(lines))
-        
-        return True
+                # 如果没有include区域，在option后面添加
+                option_section_end = -1
+                for i, line in enumerate(lines):
+                    if line.strip().startswith('option '):
+                        option_section_end = i
+            
+                if option_section_end >= 0:
+                    # 在option区域后添加
+                    lines.insert(option_section_end + 1, '')
+                    lines.insert(option_section_end + 2, '; 年份文件引用')
+                    lines.insert(option_section_end + 3, include_directive)
+                else:
+                    # 在文件开头添加
+                    lines.insert(0, include_directive)
+                    lines.insert(1, '')
+            
+            # 写回文件
+            with open(main_file, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(lines))
+            
+            return True
         
     except Exception:
         return False
@@ -343,8 +253,9 @@ def append_transaction_to_yearly_file(yearly_file: Path, transaction_content: st
         bool: 是否成功追加
     """
     try:
-        with open(yearly_file, 'a', encoding='utf-8') as f:
-            f.write('\n' + transaction_content + '\n')
-        return True
+        with ledger_write_lock:
+            with open(yearly_file, 'a', encoding='utf-8') as f:
+                f.write('\n' + transaction_content + '\n')
+            return True
     except Exception:
         return False 
\ No newline at end of file
@@ -0,0 +1,152 @@
+"""
+include 依赖图
+缓存每个账本文件的 include 指令，文件大小和修改时间未变时不再重新读取
+"""
+import re
+import threading
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Set
+
+# 匹配行首的 include "path" 和 include 'path'，直接在字节上搜索，无需解码整个文件
+INCLUDE_PATTERN = re.compile(rb'^[ \t]*include[ \t]+["\']([^"\'\r\n]+)["\']', re.MULTILINE)
+
+
+class IncludeDirective(NamedTuple):
+    """include 指令：所在行（0 基）、原始路径和解析后的绝对路径"""
+    line_index: int
+    target: str
+    path: Path
+
+
+class _FileNode(NamedTuple):
+    size: int
+    mtime_ns: int
+    mtime: float
+    directives: List[IncludeDirective]
+
+
+def scan_include_directives(data: bytes, base_dir: Path) -> List[IncludeDirective]:
+    """在文件字节内容中查找 include 指令"""
+    directives = []
+    if b'include' not in data:
+        return directives
+
+    line_index, position = 0, 0
+    for match in INCLUDE_PATTERN.finditer(data):
+        line_index += data.count(b'\n', position, match.start())
+        position = match.start()
+        target = match.group(1).decode('utf-8', errors='replace')
+        directives.append(IncludeDirective(line_index, target, (base_dir / target).resolve()))
+    return directives
+
+
+class IncludeGraph:
+    """
+    include 依赖图
+
+    每个文件的节点以 (size, mtime_ns) 为键缓存，只有发生变化的文件才重新扫描 include 指令。
+    """
+
+    def __init__(self):
+        self._nodes: Dict[Path, _FileNode] = {}
+        self._lock = threading.Lock()
+
+    def _get_node(self, file_path: Path) -> _FileNode:
+        stat = file_path.stat()
+        with self._lock:
+            node = self._nodes.get(file_path)
+        if node is not None and node.size == stat.st_size and node.mtime_ns == stat.st_mtime_ns:
+            return node
+
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        node = _FileNode(stat.st_size, stat.st_mtime_ns, stat.st_mtime,
+                         scan_include_directives(data, file_path.parent))
+        with self._lock:
+            self._nodes[file_path] = node
+        return node
+
+    def get_directives(self, file_path: Path) -> List[IncludeDirective]:
+        """获取文件中的 include 指令"""
+        return self._get_node(file_path).directives
+
+    def get_includes(self, file_path: Path) -> List[Path]:
+        """获取文件直接包含的文件路径"""
+        return [directive.path for directive in self._get_node(file_path).directives]
+
+    def get_all_files(self, main_file: Path) -> List[Path]:
+        """获取主文件及其所有直接、间接包含的文件（按深度优先顺序，去重）"""
+        all_files = []
+        visited: Set[Path] = set()
+        stack = [main_file]
+        while stack:
+            file_path = stack.pop()
+            if file_path in visited or not file_path.exists():
+                continue
+            visited.add(file_path)
+            all_files.append(file_path)
+            try:
+                includes = self.get_includes(file_path)
+            except OSError:
+                # 忽略读取错误，只收集能读取的文件
+                continue
+            stack.extend(reversed(includes))
+        return all_files
+
+    def build_tree(self, main_file: Path) -> Dict:
+        """构建文件树，循环引用只在当前路径上检测"""
+        return self._build_tree(main_file, set())
+
+    def _build_tree(self, file_path: Path, ancestors: Set[Path]) -> Dict:
+        if file_path in ancestors:
+            return _error_node(file_path, "循环引用")
+
+        try:
+            node = self._get_node(file_path)
+        except Exception as e:
+            return _error_node(file_path, str(e))
+
+        ancestors.add(file_path)
+        try:
+            children = []
+            for directive in node.directives:
+                if directive.path.exists():
+                    children.append(self._build_tree(directive.path, ancestors))
+                else:
+                    children.append(_error_node(directive.path, "文件不存在"))
+        finally:
+            ancestors.discard(file_path)
+
+        return {
+            "name": file_path.name,
+            "path": str(file_path),
+            "size": node.size,
+            "type": "file",
+            "is_main": file_path.name == "main.beancount",
+            "includes": children,
+            "modified": node.mtime
+        }
+
+    def invalidate(self, file_path: Optional[Path] = None):
+        """清除缓存（一般无需调用，文件变化会按 stat 自动检测）"""
+        with self._lock:
+            if file_path is None:
+                self._nodes.clear()
+            else:
+                self._nodes.pop(file_path, None)
+
+
+def _error_node(file_path: Path, error: str) -> Dict:
+    return {
+        "name": file_path.name,
+        "path": str(file_path),
+        "size": 0,
+        "type": "file",
+        "is_main": False,
+        "includes": [],
+        "error": error
+    }
+
+
+# 全局 include 依赖图
+include_graph = IncludeGraph()
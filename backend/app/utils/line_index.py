@@ -0,0 +1,238 @@
+"""
+文件行偏移索引
+缓存每个文件各行起始的字节偏移，支持按行或字节范围读取大文件以及按行范围原子修改文件
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from app.core.exceptions import FileConflictError
+from app.utils.write_lock import ledger_write_lock
+
+# 构建索引时每次读取的字节数
+CHUNK_SIZE = 1024 * 1024
+
+
+class LineIndex(NamedTuple):
+    """文件行偏移索引，offsets[i] 为第 i 行（0 基）起始的字节偏移"""
+    size: int
+    mtime_ns: int
+    ctime_ns: int
+    inode: int
+    digest: str
+    offsets: array
+
+    @property
+    def version(self) -> str:
+        """文件版本（内容哈希），用于修改时检测并发写入"""
+        return self.digest
+
+    def matches(self, stat: os.stat_result) -> bool:
+        """文件自构建索引后未被修改（替换文件会改变 inode，原地写入会改变 ctime）"""
+        return (self.size, self.mtime_ns, self.ctime_ns, self.inode) == (
+            stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns, stat.st_ino
+        )
+
+    @property
+    def total_lines(self) -> int:
+        # 与 content.split('\n') 的行数一致：末尾的换行符之后还有一个空行
+        return len(self.offsets)
+
+    def line_end(self, line_index: int) -> int:
+        """第 line_index 行（0 基）内容结束的字节偏移（不含换行符）"""
+        if line_index + 1 < len(self.offsets):
+            return self.offsets[line_index + 1] - 1
+        return self.size
+
+
+class LinePatch(NamedTuple):
+    """
+    行范围修改：用 lines 替换第 start_line 到 end_line 行（1 基，闭区间）
+
+    end_line = start_line - 1 表示在 start_line 之前插入，lines 为空表示删除。
+    """
+    start_line: int
+    end_line: int
+    lines: List[str]
+
+
+def build_line_index(file_path: Path) -> LineIndex:
+    """分块扫描文件中的换行符构建行偏移索引，同时计算内容哈希"""
+    offsets = array('q', [0])
+    digest = hashlib.sha256()
+    position = 0
+    with open(file_path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            found = chunk.find(b'\n')
+            while found >= 0:
+                offsets.append(position + found + 1)
+                found = chunk.find(b'\n', found + 1)
+            position += len(chunk)
+    return LineIndex(position, stat.st_mtime_ns, stat.st_ctime_ns, stat.st_ino, digest.hexdigest(), offsets)
+
+
+class LineIndexCache:
+    """
+    行偏移索引缓存
+
+    索引以 (size, mtime_ns, ctime_ns, inode) 为键，文件变化后在下次访问时重新构建；
+    修改与其他账本写入共用 ledger_write_lock。
+    """
+
+    def __init__(self):
+        self._indexes: Dict[Path, LineIndex] = {}
+        self._lock = threading.Lock()
+
+    def get(self, file_path: Path) -> LineIndex:
+        """获取文件的行偏移索引，文件未变化时直接使用缓存"""
+        stat = file_path.stat()
+        with self._lock:
+            index = self._indexes.get(file_path)
+        if index is not None and index.matches(stat):
+            return index
+        return self._rebuild(file_path)
+
+    def _rebuild(self, file_path: Path) -> LineIndex:
+        index = build_line_index(file_path)
+        with self._lock:
+            self._indexes[file_path] = index
+        return index
+
+    def read_lines(self, file_path: Path, start_line: int, end_line: Optional[int] = None) -> Tuple[str, int, int, LineIndex]:
+        """
+        读取第 start_line 到 end_line 行（1 基，闭区间），只读取所需的字节
+
+        Returns:
+            Tuple[str, int, int, LineIndex]: (内容, 实际起始行, 实际结束行, 索引)
+        """
+        index = self.get(file_path)
+        total = index.total_lines
+        if start_line < 1:
+            raise ValueError("起始行必须大于等于 1")
+        if end_line is None or end_line > total:
+            end_line = total
+        if start_line > end_line:
+            return "", start_line, end_line, index
+
+        start = index.offsets[start_line - 1]
+        end = index.line_end(end_line - 1)
+        with open(file_path, 'rb') as f:
+            f.seek(start)
+            data = f.read(end - start)
+        return data.decode('utf-8'), start_line, end_line, index
+
+    def read_bytes(self, file_path: Path, offset: int, length: int) -> Tuple[str, int, int, LineIndex]:
+        """
+        读取字节范围 [offset, offset + length) 覆盖的完整行，避免截断多字节字符
+
+        Returns:
+            Tuple[str, int, int, LineIndex]: (内容, 起始行, 结束行, 索引)
+        """
+        if offset < 0 or length < 1:
+            raise ValueError("字节范围无效")
+        index = self.get(file_path)
+        if offset >= index.size:
+            return "", index.total_lines + 1, index.total_lines, index
+
+        start_line = bisect_right(index.offsets, offset)
+        end_line = bisect_right(index.offsets, min(offset + length, index.size) - 1)
+        return self.read_lines(file_path, start_line, end_line)
+
+    def apply_patches(self, file_path: Path, patches: List[LinePatch],
+                      expected_version: Optional[str] = None) -> LineIndex:
+        """
+        按行范围修改文件：流式写入同目录下的临时文件后原子替换原文件
+
+        所有行号都基于修改前的文件，各修改范围不能重叠。
+
+        Args:
+            file_path: 文件路径
+            patches: 行范围修改列表
+            expected_version: 读取时的文件版本，与当前版本不一致时拒绝修改
+
+        Returns:
+            LineIndex: 修改后文件的行偏移索引
+        """
+        with ledger_write_lock:
+            # 修改本身要复制整个文件，这里直接重新扫描，版本以实际内容为准而不依赖 stat
+            index = self._rebuild(file_path)
+            if expected_version is not None and expected_version != index.version:
+                raise FileConflictError(str(file_path), expected_version, index.version)
+
+            chunks = self._plan_chunks(index, patches)
+            fd, temp_name = tempfile.mkstemp(prefix=f".{file_path.name}.", suffix=".tmp", dir=file_path.parent)
+            try:
+                with os.fdopen(fd, 'wb') as out, open(file_path, 'rb') as src:
+                    first = True
+                    for chunk in chunks:
+                        if not first:
+                            out.write(b'\n')
+                        first = False
+                        if isinstance(chunk, tuple):
+                            # 原文件中连续的行：按字节区间直接复制
+                            start = index.offsets[chunk[0]]
+                            remaining = index.line_end(chunk[1] - 1) - start
+                            src.seek(start)
+                            while remaining > 0:
+                                data = src.read(min(CHUNK_SIZE, remaining))
+                                if not data:
+                                    break
+                                out.write(data)
+                                remaining -= len(data)
+                        else:
+                            out.write('\n'.join(chunk).encode('utf-8'))
+                    out.flush()
+                    os.fsync(out.fileno())
+                shutil.copymode(file_path, temp_name)
+                os.replace(temp_name, file_path)
+            except BaseException:
+                try:
+                    os.unlink(temp_name)
+                except OSError:
+                    pass
+                raise
+
+            return self._rebuild(file_path)
+
+    @staticmethod
+    def _plan_chunks(index: LineIndex, patches: List[LinePatch]) -> List:
+        """
+        把修改转换为按顺序输出的片段：(起始行, 结束行) 表示原文件的行区间（0 基，左闭右开），
+        字符串列表表示新写入的行；片段之间以换行符连接
+        """
+        total = index.total_lines
+        chunks = []
+        cursor = 0
+        for patch in sorted(patches, key=lambda p: (p.start_line, p.end_line)):
+            if not 1 <= patch.start_line <= total + 1:
+                raise ValueError(f"起始行超出范围: {patch.start_line}")
+            if not patch.start_line - 1 <= patch.end_line <= total:
+                raise ValueError(f"结束行超出范围: {patch.end_line}")
+            if patch.start_line - 1 < cursor:
+                raise ValueError(f"修改范围重叠: 第 {patch.start_line} 行")
+            if any('\n' in line for line in patch.lines):
+                raise ValueError("替换内容的每一项必须是单独的一行")
+
+            if patch.start_line - 1 > cursor:
+                chunks.append((cursor, patch.start_line - 1))
+            if patch.lines:
+                chunks.append(list(patch.lines))
+            cursor = patch.end_line
+        if cursor < total:
+            chunks.append((cursor, total))
+        return chunks
+
+
+# 全局行偏移索引缓存
+line_index_cache = LineIndexCache()
@@ -0,0 +1,9 @@
+"""
+账本文件写入锁
+所有修改账本文件的操作（追加交易、按行修改、保存文件内容、账户指令等）共用同一把锁，
+保证"读取-修改-写回"期间不会有其他写入被覆盖
+"""
+import threading
+
+# 可重入：写入流程中会嵌套调用其他写入辅助函数（如追加交易时创建年份文件并添加 include）
+ledger_write_lock = threading.RLock()
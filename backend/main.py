@@ -1,14 +1,18 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
+import asyncio
 import uvicorn
 from pathlib import Path
 from contextlib import asynccontextmanager
 
-from app.routers import transactions, reports, accounts, files, recurring, auth, sync, settings as settings_router, beancount_options, query, budgets, ai
+from app.routers import transactions, reports, accounts, files, recurring, auth, sync, settings as settings_router, beancount_options, query, budgets, ai, cache
 from app.core.config import settings
 from app.services.scheduler import scheduler
+from app.services.warmup_service import warmup_service
+from app.services.beancount_service import beancount_service
+from app.services.ledger_loader import request_write_tokens
 from app.database import init_database
 import logging
 
@@ -31,6 +35,9 @@ async def lifespan(app: FastAPI):
     scheduler.start()
     logger.info("调度器启动成功")
     
+    # 后台预热账本和仪表盘报表，不阻塞启动
+    scheduler.schedule_warmup()
+    
     # 初始化GitHub同步服务 - This is now handled on-demand by dependency injection
     # await github_sync_service._load_config()
     yield
@@ -57,8 +64,37 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Ledger-Token"],
 )
 
+@app.middleware("http")
+async def ledger_consistency(request: Request, call_next):
+    """
+    账本读写一致性
+    
+    写入后账本在合并窗口结束时才重新加载。产生写入的 API 响应通过 X-Ledger-Token 返回本次请求
+    写入的版本令牌；请求携带该头时先等待对应写入在快照中生效，从而读到自己的写入。
+    """
+    token = request.headers.get("x-ledger-token")
+    if token and request.url.path.startswith("/api"):
+        try:
+            await asyncio.to_thread(
+                beancount_service.loader.wait_for_token, int(token), settings.reload_wait_timeout_seconds
+            )
+        except ValueError:
+            pass
+    
+    # 写入在端点中（可能在线程池中）发生，列表随上下文复制共享，写入时追加令牌
+    write_tokens: list = []
+    context_token = request_write_tokens.set(write_tokens)
+    try:
+        response = await call_next(request)
+    finally:
+        request_write_tokens.reset(context_token)
+    if write_tokens and request.url.path.startswith("/api"):
+        response.headers["X-Ledger-Token"] = str(max(write_tokens))
+    return response
+
 # 确保data目录存在（使用配置中的路径）
 settings.data_dir.mkdir(exist_ok=True)
 
@@ -81,6 +117,7 @@ app.include_router(beancount_options.router, prefix="/api/beancount", tags=["账
 app.include_router(query.router, prefix="/api/query", tags=["BQL查询"], dependencies=auth_dependencies)
 app.include_router(budgets.router, prefix="/api/budgets", tags=["预算管理"], dependencies=auth_dependencies)
 app.include_router(ai.router, prefix="/api/ai", tags=["AI分析"], dependencies=auth_dependencies)
+app.include_router(cache.router, prefix="/api/cache", tags=["缓存管理"], dependencies=auth_dependencies)
 
 @app.get("/api")
 async def api_root():
@@ -88,7 +125,13 @@ async def api_root():
 
 @app.get("/api/health")
 async def health_check():
-    return {"status": "healthy", "message": "服务运行正常"}
+    warmup = warmup_service.get_status()
+    return {
+        "status": "healthy",
+        "message": "服务运行正常",
+        "ready": warmup["ready"],
+        "warmup": warmup
+    }
 
 # 静态文件配置
 static_dir = Path("static")
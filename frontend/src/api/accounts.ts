@@ -28,6 +28,58 @@ export interface AccountActionResponse {
   account_name: string;
 }
 
+export interface AccountStats {
+  account: string;
+  open_date?: string;
+  close_date?: string;
+  is_closed: boolean;
+  currencies: string[];
+  booking_method?: string;
+  first_posting_date?: string;
+  last_posting_date?: string;
+  posting_count: number;
+  subaccount_count: number;
+}
+
+export interface AccountRegisterItem {
+  date: string;
+  flag?: string;
+  payee?: string;
+  narration?: string;
+  amount: number;
+  currency: string;
+  balance: number;
+  other_accounts: string[];
+  filename?: string;
+  lineno?: number;
+  transaction_id?: string;
+}
+
+export interface AccountRegisterResponse {
+  account: string;
+  data: AccountRegisterItem[];
+  total: number;
+  page: number;
+  page_size: number;
+  total_pages: number;
+}
+
+export interface AccountTreeNode {
+  name: string;
+  account: string;
+  balance: number;
+  balances: Record<string, number>;
+  is_closed: boolean;
+  children: AccountTreeNode[];
+}
+
+export interface AccountTreeResponse {
+  as_of_date: string;
+  currency: string;
+  roots: AccountTreeNode[];
+  unconverted_currencies: string[];
+}
+
 export interface AccountOrderConfig {
   category_order: string[];
   subcategory_order: Record<string, string[]>;
@@ -55,6 +107,16 @@ export const getAccountStructure = () => {
   return api.get("/accounts/structure");
 };
 
+// 获取带汇总余额的账户树
+export const getAccountTree = (
+  asOfDate?: string,
+  includeArchived = false
+): Promise<AccountTreeResponse> => {
+  return api.get("/accounts/tree", {
+    params: { as_of_date: asOfDate, include_archived: includeArchived },
+  });
+};
+
 // 按类型获取账户
 export const getAccountsByType = () => {
   return api.get("/accounts/types");
@@ -65,6 +127,27 @@ export const suggestAccounts = (partialName: string) => {
   return api.get(`/accounts/suggest/${partialName}`);
 };
 
+// 获取账户生命周期与记账统计
+export const getAccountStats = (accountName: string): Promise<AccountStats> => {
+  return api.get(`/accounts/${encodeURIComponent(accountName)}/stats`);
+};
+
+// 获取账户明细（分页，含累计余额）
+export const getAccountRegister = (
+  accountName: string,
+  params: {
+    page?: number;
+    page_size?: number;
+    start_date?: string;
+    end_date?: string;
+    order?: "asc" | "desc";
+  } = {}
+): Promise<AccountRegisterResponse> => {
+  return api.get(`/accounts/${encodeURIComponent(accountName)}/register`, {
+    params,
+  });
+};
+
 // 创建账户
 export const createAccount = (
   data: AccountCreateRequest
@@ -30,6 +30,32 @@ export interface FileTreeResponse {
   main_file: string
 }
 
+export interface FileRangeResponse {
+  filename: string
+  file_path: string
+  content: string
+  start_line: number
+  end_line: number
+  total_lines: number
+  size: number
+  version: string
+}
+
+export interface FileLinePatch {
+  start_line: number
+  end_line: number
+  lines: string[]
+}
+
+export interface FilePatchResponse {
+  message: string
+  filename: string
+  file_path: string
+  total_lines: number
+  size: number
+  version: string
+}
+
 // 获取文件列表
 export const getFileList = () => {
   return api.get('/files/')
@@ -45,6 +71,18 @@ export const getFileContent = (filePath: string) => {
   return api.get('/files/content', { params: { file_path: filePath } })
 }
 
+// 按行范围获取文件内容
+export const getFileContentRange = (filePath: string, startLine: number, endLine?: number) => {
+  return api.get('/files/content/range', {
+    params: { file_path: filePath, start_line: startLine, end_line: endLine }
+  })
+}
+
+// 按字节范围获取文件内容（扩展到完整的行）
+export const getFileContentByteRange = (filePath: string, offset: number, length: number) => {
+  return api.get('/files/content/range', { params: { file_path: filePath, offset, length } })
+}
+
 // 获取文件内容（兼容旧接口）
 export const getFileContentLegacy = (filename: string) => {
   return api.get(`/files/${filename}/content`)
@@ -55,6 +93,11 @@ export const updateFileContent = (filePath: string, content: string) => {
   return api.put('/files/content', { content }, { params: { file_path: filePath } })
 }
 
+// 按行范围修改文件内容，version 为读取时返回的文件版本
+export const patchFileContent = (filePath: string, patches: FileLinePatch[], version?: string) => {
+  return api.patch('/files/content', { version, patches }, { params: { file_path: filePath } })
+}
+
 // 更新文件内容（兼容旧接口）
 export const updateFileContentLegacy = (filename: string, content: string) => {
   return api.put(`/files/${filename}/content`, { content })
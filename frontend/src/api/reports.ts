@@ -19,6 +19,17 @@ export interface BalanceSheet {
   currency: string
 }
 
+export interface NetWorthSeries {
+  interval: 'month' | 'week' | 'day'
+  currency: string
+  dates: string[]
+  assets: number[]
+  liabilities: number[]
+  net_worth: number[]
+  account?: string
+  account_balance?: number[]
+}
+
 export interface IncomeStatement {
   income_accounts: AccountInfo[]
   expense_accounts: AccountInfo[]
@@ -63,4 +74,14 @@ export const getYearToDateSummary = (year?: number) => {
 // 获取趋势分析
 export const getTrends = (months: number = 12) => {
   return api.get('/reports/trends', { params: { months } })
-} 
\ No newline at end of file
+} 
+
+// 获取净资产时间序列
+export const getNetWorthSeries = (params: {
+  interval?: 'month' | 'week' | 'day'
+  start_date?: string
+  end_date?: string
+  account?: string
+} = {}) => {
+  return api.get('/reports/net-worth-series', { params })
+}
@@ -13,9 +13,23 @@ const api = axios.create({
   },
 });
 
+// 最近一次写入的账本版本令牌，随请求带回以读到自己的写入
+let ledgerToken: number | null = null;
+
+const rememberLedgerToken = (headers: any) => {
+  const token = Number(headers?.["x-ledger-token"]);
+  if (Number.isFinite(token) && (ledgerToken === null || token > ledgerToken)) {
+    ledgerToken = token;
+  }
+};
+
 // 请求拦截器
 api.interceptors.request.use(
   (config) => {
+    if (ledgerToken !== null) {
+      config.headers["X-Ledger-Token"] = String(ledgerToken);
+    }
+
     // 检查是否需要认证
     const enableAuth = import.meta.env.VITE_ENABLE_AUTH !== 'false';
     
@@ -36,6 +50,7 @@ api.interceptors.request.use(
 // 响应拦截器
 api.interceptors.response.use(
   (response) => {
+    rememberLedgerToken(response.headers);
     return response.data;
   },
   (error) => {